@@ -1,9 +1,17 @@
 import os
+import sys
 from urllib.error import HTTPError
 import pandas as pd
 import datetime
 from tableauscraper import TableauScraper as TS
 
+# Snapshots are shared with the dashboard, so import them from the project root.
+sys.path.insert( 0, os.path.abspath( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "../.." ) ) )
+from src.snapshots import write_snapshot
+
+# The CSV the dashboard loads (format_resources.CASES_PATH). It isn't written by this script.
+DASHBOARD_CASES_PATH = os.path.abspath( "../../resources/new_cases.csv" )
+
 def append_wastewater( sd ):
     zip_loc = "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master/Zipcodes.csv"
     zips = pd.read_csv( zip_loc, usecols=["Zip_code", "Wastewater_treatment_plant"], dtype={"Zip_code" : str, "Wastewater_treatment_plant" : str } )
@@ -159,3 +167,11 @@ def download_cases():
 if __name__ == "__main__":
     cases = download_cases()
     cases.to_csv( os.path.abspath("../../resources/cases.csv"), index=False )
+
+    # Feather snapshot of the CSV the dashboard reads, parsed the same way as format_resources.load_cases(). It is
+    # tagged with the CSV's signature, so it is ignored once that CSV is replaced.
+    if os.path.exists( DASHBOARD_CASES_PATH ):
+        snapshot = pd.read_csv( DASHBOARD_CASES_PATH )
+        snapshot["updatedate"] = pd.to_datetime( snapshot["updatedate"] ).dt.tz_localize( None )
+        snapshot["updatedate"] = snapshot["updatedate"].dt.normalize()
+        write_snapshot( snapshot, DASHBOARD_CASES_PATH )
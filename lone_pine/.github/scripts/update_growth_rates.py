@@ -1,4 +1,9 @@
+import argparse
+import functools
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
@@ -10,11 +15,23 @@ import re
 from scipy.special import expit, logit
 import pickle
 
+# Snapshots are shared with the dashboard, so import them from the project root.
+sys.path.insert( 0, os.path.abspath( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "../.." ) ) )
+from src.snapshots import write_snapshot
+
 SEQS_LOCATION = os.path.abspath("../../resources/sequences.csv")
 VOC_LOCATION = os.path.abspath("../../resources/voc.txt")
+REGIONS_LOCATION = os.path.abspath("../../resources/growth_rates_regions.csv")
+
+# Values of the state column in sequences.csv
+REGIONS = ["San Diego", "Baja California"]
+ALIAS_PATTERN = "[A-Z]{2}.\\+$"
 
 aliasor = Aliasor()
 
+# Aliases computed before the worker processes start, so each worker doesn't have to repeat them.
+alias_table = dict()
+
 def load_cdc_variants():
     # This link provides API access to the data found in this chart: https://covid.cdc.gov/covid-data-tracker/#variant-proportions
     # However, I haven't confirmed this doesn't change over time.
@@ -32,42 +49,93 @@ def load_cdc_variants():
 def load_sequences():
     seqs = pd.read_csv( SEQS_LOCATION, usecols=["ID", "collection_date", "epiweek", "lineage", "state"],
                        parse_dates=["collection_date", "epiweek"] )
-    seqs = seqs.loc[seqs["state"] == "San Diego"]
     return seqs
 
+@functools.lru_cache( maxsize=None )
+def compress_alias( entry : str ):
+    if entry in alias_table:
+        return alias_table[entry]
+    return aliasor.partial_compress( aliasor.uncompress( entry ), accepted_aliases=["BA"] )
+
+def build_alias_table( lineages ):
+    return { i : compress_alias( i ) for i in set( lineages ) if isinstance( i, str ) and re.match( ALIAS_PATTERN, i ) }
+
+def set_alias_table( table : dict[str] ):
+    alias_table.update( table )
+
 def collapse_lineage( entry : str, accepted_lineages: set[str] ):
     if entry in accepted_lineages or "." not in entry:
         return entry
-    elif re.match( "[A-Z]{2}.\\+$", entry ):
-        return aliasor.partial_compress( aliasor.uncompress( entry ), accepted_aliases=["BA"] )
+    elif re.match( ALIAS_PATTERN, entry ):
+        return compress_alias( entry )
     return ".".join( entry.split( "." )[:-1] )
 
 
-def calculate_CIs( entry, name, model ):
-    return_df = entry.copy()
-    se = model.cov_params().loc[name,name].to_numpy()
-    se = np.sqrt( [xx@se@xx for xx in [[i, 1] for i in return_df.index]] )
-    return_df["upper"] = expit( logit( return_df["prevalence"] ) + 1.96 * se )
-    return_df["lower"] = expit( logit( return_df["prevalence"] ) - 1.96 * se )
-    return return_df
+class WeightedMNLogit( sm.MNLogit ):
+    """ MNLogit where each row stands for freq_weights[i] identical observations. Fitting the sequence counts of each
+    (week, lineage) pair gives the same estimates and covariance as fitting one row per sequence.
+    """
+    def __init__( self, endog, exog, freq_weights, **kwargs ):
+        super().__init__( endog, exog, **kwargs )
+        self.freq_weights = np.asarray( freq_weights, dtype=float )
+
+    def loglikeobs( self, params ):
+        return super().loglikeobs( params ) * self.freq_weights[:, None]
+
+    def loglike( self, params ):
+        return np.sum( self.loglikeobs( params ) )
+
+    def score_obs( self, params ):
+        return super().score_obs( params ) * self.freq_weights[:, None]
+
+    def score( self, params ):
+        params = params.reshape( self.K, -1, order="F" )
+        firstterm = self.wendog[:, 1:] - self.cdf( np.dot( self.exog, params ) )[:, 1:]
+        return np.dot( ( firstterm * self.freq_weights[:, None] ).T, self.exog ).flatten()
+
+    def loglike_and_score( self, params ):
+        return self.loglike( params ), self.score( params )
+
+    def hessian( self, params ):
+        params = params.reshape( self.K, -1, order="F" )
+        pr = self.cdf( np.dot( self.exog, params ) )[:, 1:]
+        J = pr.shape[1]
+        weighted = pr[:, :, None] * ( np.eye( J )[None, :, :] - pr[:, None, :] ) * self.freq_weights[:, None, None]
+        hessian = -np.einsum( "nij,nk,nl->ikjl", weighted, self.exog, self.exog )
+        return hessian.reshape( J * self.K, J * self.K )
 
 
 def format_model_results( model_results, weeks : list ):
-    results = pd.DataFrame( model_results.predict( [[i, 1] for i in weeks] ), index=weeks,
-                            columns=model_results.model._ynames_map.values() )
-    results = results.drop( columns=["Other"] )
-    results = results.melt( var_name="variant", value_name="prevalence", ignore_index=False )
-    results = results.groupby( "variant" ).apply( lambda x: calculate_CIs( x, x.name, model_results ) )
+    weeks = np.asarray( weeks, dtype=float )
+    exog = np.column_stack( [weeks, np.ones( len( weeks ) )] )
+    names = np.array( list( model_results.model._ynames_map.values() ) )
+    keep = names != "Other"
+    variants = names[keep]
+    prevalence = model_results.predict( exog )[:, keep]
+
+    # Standard error of the linear predictor [week, 1] @ params for every week and variant at once.
+    cov = model_results.cov_params()
+    cov = np.stack( [cov.loc[name, name].to_numpy() for name in variants] )
+    se = np.sqrt( np.einsum( "wi,vij,wj->wv", exog, cov, exog ) )
+
+    results = pd.DataFrame( {
+        "variant" : np.repeat( variants, len( weeks ) ),
+        "prevalence" : prevalence.T.ravel(),
+        "upper" : expit( logit( prevalence ) + 1.96 * se ).T.ravel(),
+        "lower" : expit( logit( prevalence ) - 1.96 * se ).T.ravel()
+    }, index=np.tile( weeks, len( variants ) ) )
     return results
 
 
 def model_sequence_counts( df : pd.DataFrame, weeks : list ):
-    mdata = df.copy()
+    # One row per week and lineage, weighted by its number of sequences.
+    mdata = df.dropna( subset=["epiweek", "collapsed_linege"] )
+    mdata = mdata.groupby( ["epiweek", "collapsed_linege"], observed=True ).size().reset_index( name="sequences" )
     mdata["const"] = 1
     X = mdata[["epiweek", "const"]]
     Y = mdata["collapsed_linege"]
 
-    model = sm.MNLogit( Y, X, missing="drop" )
+    model = WeightedMNLogit( Y, X, freq_weights=mdata["sequences"] )
     res = model.fit_regularized( maxiter=1000 )
 
     results = format_model_results( res, weeks )
@@ -83,10 +151,20 @@ def calculate_growth_rate( results ):
     coeff = coeff.rename( columns={"epiweek" : "growth_rate" })
     return coeff
 
-def dump_model_names( model, collapsed_names ):
-    with open( os.path.abspath("../../resources/clinical.model"), "wb" ) as model_file:
+def get_region_suffix( region : str ):
+    # San Diego keeps the original file names.
+    if region == "San Diego":
+        return ""
+    return "_" + re.sub( "[^a-z0-9]+", "_", region.lower() ).strip( "_" )
+
+def dump_model_names( model, collapsed_names, region : str = "San Diego" ):
+    suffix = get_region_suffix( region )
+    # Estimates and covariance are stored in the results, so the model is saved as a plain MNLogit that can be loaded
+    # without this script.
+    model.model.__class__ = sm.MNLogit
+    with open( os.path.abspath(f"../../resources/clinical{suffix}.model"), "wb" ) as model_file:
         pickle.dump( model, model_file )
-    with open( os.path.abspath("../../resources/collapsed_names.csv"), "w" ) as cn:
+    with open( os.path.abspath(f"../../resources/collapsed_names{suffix}.csv"), "w" ) as cn:
         cn.write( "lineage,collapsed_lineage\n" )
         [cn.write( f"{k},{v}\n" ) for k, v in collapsed_names.items()]
 
@@ -97,7 +175,9 @@ def smooth_sequence_counts( df : pd.DataFrame, weeks : list, forced_lineages : l
     for i in range( rounds ):
         counts = last_seqs[previous_round].value_counts()
         accepted = set( list( counts.loc[counts > min_sequences].index ) + forced_lineages )
-        last_seqs[f"round_{i}"] = last_seqs[previous_round].apply( lambda x: collapse_lineage( x, accepted ) )
+        # Collapse each lineage name once rather than once per sequence.
+        collapsed = { name : collapse_lineage( name, accepted ) for name in counts.index }
+        last_seqs[f"round_{i}"] = last_seqs[previous_round].map( collapsed )
 
         previous_round = f"round_{i}"
         counts = last_seqs[previous_round].value_counts()
@@ -122,13 +202,11 @@ def smooth_sequence_counts( df : pd.DataFrame, weeks : list, forced_lineages : l
 
     smoothed, model = model_sequence_counts( last_seqs, last_week_prediction )
 
-    dump_model_names( model, collapsed_names )
-
     smoothed.index = mdates.num2date( smoothed.index )
     smoothed.index = smoothed.index.tz_localize(None)
     growth_rates = calculate_growth_rate( model )
 
-    return smoothed, growth_rates, collapsed_names
+    return smoothed, growth_rates, collapsed_names, model
 
 
 def calculate_last_weeks( df : pd.DataFrame ):
@@ -200,20 +278,81 @@ def add_collapsed_lineages( seqs: pd.DataFrame, names: dict[str] ):
     seqs["collapsed_lineage"] = seqs["lineage"].replace( names )
     return seqs
 
-def calculate_growth_rates():
-    cdc_lineages = load_cdc_variants()
-    seqs = load_sequences()
+def calculate_growth_rates( seqs : pd.DataFrame, cdc_lineages : list[str], voc_names : dict[str] ):
     last_weeks = calculate_last_weeks( seqs )
-    smooth_seqs, rates, names = smooth_sequence_counts( seqs, last_weeks, forced_lineages=cdc_lineages )
+    smooth_seqs, rates, names, model = smooth_sequence_counts( seqs, last_weeks, forced_lineages=cdc_lineages )
     rates = rates.sort_values( "growth_rate", ascending=False )
 
     seqs = add_collapsed_lineages( seqs, names )
 
+    table_filtered, table = generate_table( rates_df=rates, seqs_df=seqs, prevalence_df=smooth_seqs, weeks=last_weeks, vocs=voc_names, forced_lineages=cdc_lineages )
+    return table_filtered, table, model, names
+
+
+def fit_region( region : str, seqs : pd.DataFrame, cdc_lineages : list[str], voc_names : dict[str] ):
+    start = time.perf_counter()
+    results = calculate_growth_rates( seqs.copy(), cdc_lineages, voc_names )
+    return results + ( time.perf_counter() - start, )
+
+
+def calculate_region_growth_rates( regions : list[str], processes : int = None ):
+    """ Estimates growth rates for each region in its own process.
+    Parameters
+    ----------
+    regions : list[str]
+        values of the state column of sequences.csv to fit.
+    processes : int
+        maximum number of worker processes. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    dict
+        maps each region that could be fit to its filtered growth rates, all growth rates, model, collapsed lineage
+        names, and runtime in seconds.
+    """
+    cdc_lineages = load_cdc_variants()
     voc_names = load_vocs()
-    return generate_table( rates_df=rates, seqs_df=seqs, prevalence_df=smooth_seqs, weeks=last_weeks, vocs=voc_names, forced_lineages=cdc_lineages )
+    seqs = load_sequences()
+    table = build_alias_table( seqs["lineage"].unique() )
+
+    results = dict()
+    with ProcessPoolExecutor( max_workers=processes, initializer=set_alias_table, initargs=(table,) ) as pool:
+        futures = { pool.submit( fit_region, region, seqs.loc[seqs["state"] == region], cdc_lineages, voc_names ) : region for region in regions }
+        for future in as_completed( futures ):
+            region = futures[future]
+            try:
+                results[region] = future.result()
+            except Exception as e:
+                print( f"Unable to estimate growth rates for {region}: {e}" )
+    return results
 
 
 if __name__ == "__main__":
-    growth_rates_filtered, all = calculate_growth_rates()
-    growth_rates_filtered.to_csv( os.path.abspath("../../resources/growth_rates.csv") , index=False )
-    all.to_csv( os.path.abspath("../../resources/growth_rates_all.csv"), index=False )
+    parser = argparse.ArgumentParser( description="Estimates relative growth rates of lineages in each region." )
+    parser.add_argument( "--regions", nargs="+", default=REGIONS, help="values of the state column to fit" )
+    parser.add_argument( "--processes", type=int, default=None, help="number of worker processes" )
+    args = parser.parse_args()
+
+    results = calculate_region_growth_rates( args.regions, args.processes )
+
+    combined = list()
+    for region in args.regions:
+        if region not in results:
+            continue
+        growth_rates_filtered, all, model, names, runtime = results[region]
+        print( f"{region}: {len( all )} lineages in {runtime:.1f} seconds" )
+        dump_model_names( model, names, region )
+        combined.append( all.assign( region=region ) )
+
+        if region == "San Diego":
+            growth_rates_filtered.to_csv( os.path.abspath("../../resources/growth_rates.csv") , index=False )
+            write_snapshot( growth_rates_filtered, os.path.abspath("../../resources/growth_rates.csv") )
+            all.to_csv( os.path.abspath("../../resources/growth_rates_all.csv"), index=False )
+
+    if len( combined ) > 0:
+        pd.concat( combined, ignore_index=True ).to_csv( REGIONS_LOCATION, index=False )
+
+    # Regions that were fit are still saved, but the update fails so stale estimates for the others are noticed.
+    failed = [region for region in args.regions if region not in results]
+    if len( failed ) > 0:
+        sys.exit( f"Unable to estimate growth rates for {', '.join( failed )}." )
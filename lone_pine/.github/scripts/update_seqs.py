@@ -1,110 +1,63 @@
+import argparse
+import json
 import os
+import sys
+import numpy as np
 import pandas as pd
-from epiweeks import Week
-import datetime
 
-path = os.path.abspath('../../resources/excite_providers.csv')
-def load_excite_providers() :
-    excite = pd.read_csv(path)
-    excite = excite.set_index( "ID" )
-    return excite["provider"].to_dict()
+# The SEARCH update is shared with src/download_resources.py, so import it from the project root.
+sys.path.insert( 0, os.path.abspath( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "../.." ) ) )
+from src.search_sequences import update_search
+from src.snapshots import write_snapshot
 
-def load_file_as_list( loc ):
-    with open( loc, "r" ) as open_file:
-        return [line.strip() for line in open_file]
+RESOURCES = os.path.abspath('../../resources')
+SEQUENCES_PATH = os.path.join( RESOURCES, 'sequences.csv' )
+STATE_PATH = os.path.join( RESOURCES, 'sequences_state.json' )
+
+def format_snapshot( md ):
+    """ Types the sequences the way the dashboard uses them, so the snapshot doesn't need to be parsed like the CSV.
+    Parameters
+    ----------
+    md : pandas.DataFrame
+        output of update_search().
 
-def download_search():
-    """ Downloads the metadata from the SEARCH github repository. Removes entries with very wrong dates.
     Returns
     -------
-    pandas.DataFrame:
-        Data frame containing the metadata for all sequences generated by SEARCH
+    pandas.DataFrame
+        sequences with normalized dates, clean zip codes and categorical columns.
     """
+    snapshot = md.reset_index( drop=True )
+    snapshot["collection_date"] = pd.to_datetime( snapshot["collection_date"] ).dt.normalize()
+    snapshot["epiweek"] = pd.to_datetime( snapshot["epiweek"] ).dt.normalize()
 
-    search_md = "https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/metadata.csv"
-    md = pd.read_csv( search_md, usecols=["ID", "collection_date", "location", "authors", "originating_lab", "zipcode", "host", "percent_coverage_cds"] )
-    md["collection_date"] = md["collection_date"].astype( str )
-
-    # Filter out incorrect samples or wastewater
-    md = md.loc[~md["ID"].isin(["SEARCH-104076", "SEARCH-58367"])]
-    #md = md.loc[~md["ID"].isin( load_file_as_list( "resources/ignore.txt") )]
-
-    md = md.loc[(md["location"]=="North America/USA/California/San Diego")|(md["location"].str.startswith( "North America/Mexico/Baja California" ))]
-
-    md = md.loc[~md["collection_date"].str.startswith( "19" )]
-    md = md.loc[~md["collection_date"].str.contains( "/" )]
-
-    md = md.loc[~md["collection_date"].isin( ["NaT", "nan", 'Unknown', 'missing'] )]
-
-    md = md.loc[~md["host"].isin(["Environment","Environmental"] )]
-
-    # Generate an identifiable location column
-    md["state"] = "Baja California"
-    md.loc[md["location"]=="North America/USA/California/San Diego","state"] = "San Diego"
-
-    #clean up zipcode
-    md["zipcode"] = md["zipcode"].astype( "str" )
-    md["zipcode"] = md["zipcode"].apply( lambda x: x.split( "-" )[0] )
-    # Will covert all zipcodes to int except those with alphabetical characters.
-    md["zipcode"] = pd.to_numeric( md["zipcode"], errors="coerce", downcast="integer" )
-
-    md["epiweek"] = md["collection_date"].apply( lambda x: Week.fromdate( datetime.datetime.strptime( x, "%Y-%m-%d" ).date() ).startdate() )
-    md["collection_date"] = pd.to_datetime( md["collection_date"], format="%Y-%m-%d" ).dt.normalize()
-    md["days_past"] = ( md["collection_date"].max() - md["collection_date"] ).dt.days
-
-    md["originating_lab"] = md["originating_lab"].replace( { 'UC San Diego Center for Advanced Laboratory Medicine' :  "UCSD CALM Lab",
-                                                            "UCSD EXCITE" : "UCSD EXCITE Lab",
-                                                            "EXCITE Lab" : "UCSD EXCITE Lab",
-                                                            "Andersen lab at Scripps Research" : "SD County Public Health Laboratory",
-                                                            "San Diego County Public Health Laboratory" : "SD County Public Health Laboratory",
-                                                            "Sharp HealthCare Laboratory" : "Sharp Health",
-                                                            "Scripps Medical Laboratory" : "Scripps Health",
-                                                            "Rady Children's Hospital - San Diego" : "Rady Children's Hospital",
-                                                            "Rady Children’s Hospital" : "Rady Children's Hospital"} )
-
-    excite_providers = load_excite_providers()
-
-    # Correct some sequencer problems
-    md["sequencer"] = "Andersen Lab"
-    md.loc[md["originating_lab"]=="UCSD EXCITE Lab","sequencer"] = "UCSD EXCITE Lab"
-    md.loc[md["authors"]=="Helix","sequencer"] = "Helix"
-    md.loc[md["ID"].isin( load_file_as_list( os.path.abspath('../../resources/sdphl_sequences.txt' )) ),"sequencer"] = "SD County Public Health Laboratory"
-    md.loc[md['ID'].str.startswith( "CA-SDCPHL-" ),"sequencer"] = "SD County Public Health Laboratory"
-
-    md["provider"] = md["originating_lab"]
-    md.loc[md["originating_lab"]=="UCSD EXCITE Lab", "provider"] = md["ID"].map( excite_providers )
-    md["provider"] = md["provider"].replace( {"RTL" : "UCSD Return to Learn",
-                                             "CALM" : "UCSD CALM Lab",
-                                             "HELIX" : "Helix",
-                                             "San Diego Fire-Rescue Department" : "SD Fire-Rescue Department",
-                                             "SASEA" : "UCSD Safer at School Early Action",
-                                             "Instituto de Diagnostico y Referencia Epidemiologicos (InDRE)": "InDRE",
-                                             "Delta" : "Helix",
-                                             "DeltaAmplicon" : "Helix",
-                                             "Genomica Lab Molecular, Mexico" : "Genomica Laboratorio",
-                                             "Genomica Lab Molecular, México" : "Genomica Laboratorio"} )
-    md.loc[md["provider"].isna(),"provider"] = md["sequencer"]
-
-    # Add pangolin lineage information
-    pango_loc = "https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/lineage_report.csv"
-    pango = pd.read_csv( pango_loc, usecols=["taxon", "lineage"] )
-    pango["num"] = pango["taxon"].str.extract( "SEARCH-([0-9]+)" )
-    pango.loc[pango["num"].isna(),"num"] = pango["taxon"]
-    pango = pango[["num", "lineage"]]
-
-
-    md["num"] = md["ID"].str.extract( "SEARCH-([0-9]+)" )
-    md.loc[md["num"].isna(),"num"] = md["ID"]
-
-    md = md.merge( pango, left_on="num", right_on="num", how="left")
-
-    # Filter sequences which failed lineage calling. These sequences are likely incomplete/erroneous.
-    md = md.loc[~md["lineage"].isin( ["None", "Unassigned"] )]
-
-    md = md[["ID","collection_date", "zipcode", "epiweek", "days_past", "sequencer", "provider", "lineage", "state"]]
+    # Same zipcode cleanup as format_resources.clean_zipcodes()
+    zipcodes = snapshot["zipcode"].astype( str ).str.split( ":" ).str[0]
+    zipcodes = pd.to_numeric( zipcodes.replace( r'^\s*$', np.nan, regex=True ), errors="coerce" )
+    snapshot["zipcode"] = zipcodes.map( "{:.0f}".format )
 
-    return md
+    for column in ["zipcode", "sequencer", "provider", "lineage", "state"]:
+        snapshot[column] = snapshot[column].astype( "category" )
+    return snapshot
 
 if __name__ == "__main__":
-    seqs_md = download_search()
-    seqs_md.to_csv( path, index=False )
+    parser = argparse.ArgumentParser( description="Updates sequences.csv from the SEARCH github repository." )
+    parser.add_argument( "--full", action="store_true", help="reprocess every sequence instead of only new ones" )
+    args = parser.parse_args()
+
+    existing = None
+    state = None
+    if not args.full and os.path.exists( SEQUENCES_PATH ) and os.path.exists( STATE_PATH ):
+        existing = pd.read_csv( SEQUENCES_PATH, parse_dates=["collection_date", "epiweek"], dtype={"ID" : str} )
+        with open( STATE_PATH, "r" ) as state_file:
+            state = json.load( state_file )
+
+    seqs_md, state = update_search( RESOURCES, existing, state )
+    if seqs_md is None:
+        print( "No update to SEARCH sequences." )
+    else:
+        seqs_md.to_csv( SEQUENCES_PATH, index=False )
+        write_snapshot( format_snapshot( seqs_md ), SEQUENCES_PATH )
+
+    # One entry per line so the daily commit of the state only shows the rows that changed.
+    with open( STATE_PATH, "w" ) as state_file:
+        json.dump( state, state_file, indent=1 )
@@ -4,6 +4,7 @@ import dash_bootstrap_components as dbc
 import src.format_resources as format_data
 import dash
 from src.callbacks import register_callbacks
+from src.dataset_cache import datasets
 
 external_stylesheets = [dbc.themes.ZEPHYR, dbc.icons.BOOTSTRAP]
 app = dash.Dash( __name__, external_stylesheets=external_stylesheets )
@@ -20,9 +21,11 @@ app.scripts.append_script( {
 sequences = format_data.load_sequences()
 cases_whole = format_data.load_cases()
 growth_rates = format_data.load_growth_rates()
-ww_growth_rates = format_data.load_ww_growth_rates()
 
-register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rates )
+# Loads the wastewater datasets in the background and keeps them up to date.
+datasets.start()
+
+register_callbacks( app, sequences, cases_whole, growth_rates )
 
 app.layout = html.Div( children=[
     dcc.Location(id='url', refresh=False),
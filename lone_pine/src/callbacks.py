@@ -1,6 +1,8 @@
-from scipy.signal import savgol_filter
 import src.plot as dashplot
 import src.format_resources as format_data
+from src.dataset_cache import datasets
+from src.sequence_cube import SequenceCube
+from src.figure_cache import figures
 import src.pages.mainpage as mainpage
 import src.pages.sgtfpage as sgtfpage
 import src.pages.wastewaterpage as wastepage
@@ -45,7 +47,16 @@ def get_last_commit_date( url ):
         #return "Updating at the moment..."
         return ""
 
-def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rates ):
+def register_callbacks( app, sequences, cases_whole, growth_rates ):
+    # Pre-aggregated sequence counts, so most callbacks don't need to copy and filter sequences.
+    cube = SequenceCube( sequences )
+
+    # Sequences, cases, and growth rates are only loaded at startup, so their version is fixed for this process.
+    resources_version = format_data.get_resources_version()
+    static_version = lambda *args: resources_version
+
+    # Smoothed case series for each wastewater catchment. Cases are only loaded at startup, so these are built once.
+    catchment_cases = format_data.get_catchment_cases( cases_whole )
 
     def get_sequences( seqs, url, window=None, provider=None, sequencer=None, zip_f=None ):
         new_seqs = seqs.copy()
@@ -63,7 +74,7 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
 
         return new_seqs
 
-    def get_cases( cases, url, window=None, source=None ):
+    def get_cases( cases, url, window=None ):
         new_cases = cases.copy()
 
         new_cases = register_url_cases( new_cases, url )
@@ -71,13 +82,6 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
         if window:
             new_cases = cases.loc[cases["days_past"] <= window]
 
-        if source:
-            new_cases = cases.loc[cases["catchment"] == source].groupby( "updatedate" ).agg(
-                reported_cases=("new_cases", sum),
-                population=("population", sum ) )
-            new_cases["reported_cases_rolling"] = savgol_filter( new_cases["reported_cases"], window_length=21, polyorder=2 )
-            new_cases.loc[new_cases["reported_cases_rolling"] < 0] = 0
-            new_cases["reported_cases_rolling"] = new_cases["reported_cases_rolling"] / new_cases["population"]
         return new_cases
 
     @app.callback(
@@ -127,11 +131,12 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
         Output( "top-table-div", "children" ),
         Input( "url", "pathname" )
     )
+    @figures.memoize( "top-table", version=lambda url: ( resources_version, datasets.version( "ww_growth_rates" ) if url == "/wastewater" else None ) )
     def generate_top_table( url ):
         if url == "/bajacalifornia":
             return [html.Table( id="summary-table" )]
         elif url == "/wastewater":
-            return ww_growth_table.get_table( format_data.load_ww_growth_rates() )
+            return ww_growth_table.get_table( datasets.get( "ww_growth_rates" ) )
         else:
             return growth_table.get_table( growth_rates )
 
@@ -158,8 +163,8 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "zip-drop", "value")]
     )
     def update_sequencer_drop( url, window, provider, zip_f ):
-        new_sequences = get_sequences( sequences, url, window, provider, None, zip_f )
-        return format_data.get_provider_sequencer_values( new_sequences, "sequencer" )
+        selection = cube.select( url, window, provider, None, zip_f )
+        return format_data.get_provider_sequencer_values( cube.count_by( "sequencer", selection ) )
 
     @app.callback(
         Output( "provider-drop", "options" ),
@@ -169,8 +174,8 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "zip-drop", "value")]
     )
     def update_sequencer_drop( url, window, sequencer, zip_f ):
-        new_sequences = get_sequences( sequences, url, window, None, sequencer, zip_f )
-        return format_data.get_provider_sequencer_values( new_sequences, "provider" )
+        selection = cube.select( url, window, None, sequencer, zip_f )
+        return format_data.get_provider_sequencer_values( cube.count_by( "provider", selection ) )
 
     @app.callback(
         Output( "lineage-drop", "options" ),
@@ -181,8 +186,8 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( 'sequencer-drop', "value")]
     )
     def update_lineage_drop( url, window, zip_f, provider, sequencer ):
-        new_sequences = get_sequences( sequences, url, window, provider, sequencer, zip_f )
-        return format_data.get_lineage_values( new_sequences )
+        selection = cube.select( url, window, provider, sequencer, zip_f )
+        return format_data.get_lineage_values( cube.count_by( "lineage", selection ).index )
 
     @app.callback(
         Output( "summary-table", "children"),
@@ -202,10 +207,11 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "provider-drop", "value"),
          Input( 'sequencer-drop', "value")]
     )
+    @figures.memoize( "zip-graph", version=static_version )
     def update_zip_graph( url, window, provider, sequencer ):
-        new_sequences = get_sequences( sequences, url, window, provider, sequencer )
+        selection = cube.select( url, window, provider, sequencer )
         new_cases = format_data.format_cases_total( get_cases( cases_whole, url, window ) )
-        return dashplot.plot_zips( format_data.format_zip_summary( new_cases, new_sequences ) )
+        return dashplot.plot_zips( format_data.format_zip_summary( new_cases, cube.get_seqs( selection, groupby="zipcode" ) ) )
 
     @app.callback(
         [Output( "cum-graph", "figure" ),
@@ -217,9 +223,10 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "provider-drop", "value"),
          Input( 'sequencer-drop', "value")]
     )
+    @figures.memoize( "cum-graph", version=static_version )
     def update_cummulative_graph( url, window, zip_f, provider, sequencer ):
-        new_sequences = get_sequences( sequences, url, window, provider, sequencer )
-        new_seqs_per_case = format_data.get_seqs_per_case( get_cases( cases_whole, url, window ), new_sequences, zip_f=zip_f )
+        selection = cube.select( url, window, provider, sequencer, zip_f )
+        new_seqs_per_case = format_data.get_seqs_per_case( get_cases( cases_whole, url, window ), cube.get_seqs( selection ), zip_f=zip_f )
 
         return_plots = [dashplot.plot_cummulative_cases_seqs( new_seqs_per_case ),
                         dashplot.plot_daily_cases_seqs( new_seqs_per_case ),
@@ -235,9 +242,10 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "provider-drop", "value"),
          Input( 'sequencer-drop', "value")]
     )
+    @figures.memoize( "lineage-graph", version=static_version )
     def update_lineages_graph( url, window, zip_f, provider, sequencer ):
-        new_sequences = get_sequences( sequences, url, window, provider, sequencer, zip_f )
-        return dashplot.plot_lineages( new_sequences )
+        selection = cube.select( url, window, provider, sequencer, zip_f )
+        return dashplot.plot_lineages( cube.count_by( "lineage", selection ) )
 
     @app.callback(
         Output( "lineage-time-graph", "figure" ),
@@ -249,17 +257,18 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "lineage-type", "value"),
          Input( 'sequencer-drop', "value")]
     )
+    @figures.memoize( "lineage-time-graph", version=static_version )
     def update_lineage_time_graph( url, window, zip_f, lineage, provider, scaleby, sequencer ):
-        new_sequences = get_sequences( sequences, url, window, provider, sequencer, zip_f )
+        counts = cube.pivot( cube.select( url, window, provider, sequencer, zip_f ) )
 
         if lineage == "all-voc":
-            return dashplot.plot_voc( new_sequences, scaleby, focus="VOC" )
+            return dashplot.plot_voc( counts, scaleby, focus="VOC" )
         elif lineage == "all-delta":
-            return dashplot.plot_voc( new_sequences, scaleby, focus="Delta" )
+            return dashplot.plot_voc( counts, scaleby, focus="Delta" )
         elif lineage == "all-omicron":
-            return dashplot.plot_voc( new_sequences, scaleby, focus="Omicron" )
+            return dashplot.plot_voc( counts, scaleby, focus="Omicron" )
         else:
-            return dashplot.plot_lineages_time( new_sequences, lineage, scaleby )
+            return dashplot.plot_lineages_time( counts, lineage, scaleby )
 
     @app.callback(
         Output('zip-drop', 'value'),
@@ -292,8 +301,18 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
         [Input( "yaxis-scale-radio", "value" ),
          Input( "ww-source-radio", "value" )]
     )
+    @figures.memoize( "wastewater-graph", version=lambda *args: ( resources_version, datasets.version( "wastewater" ) ) )
     def update_wastewater_graph( scale, source ):
-        return dashplot.plot_wastewater( *format_data.load_wastewater_data(), cases=get_cases( cases_whole, "/", source=source ), scale=scale, source=source )
+        return dashplot.plot_wastewater( *datasets.get( "wastewater" ), cases=catchment_cases[source], scale=scale, source=source )
+
+    # Keyed on the site rather than the raw query string, so unrelated query parameters share an entry.
+    @figures.memoize( "indiv-wastewater-graph", version=lambda *args: ( resources_version, datasets.version( "wastewater" ) ) )
+    def plot_indiv_wastewater( source ):
+        return dashplot.plot_wastewater(
+            *datasets.get( "wastewater" ),
+            cases=catchment_cases[source],
+            source=source, seq_indicator=False
+        )
 
     @app.callback(
         Output( "indiv-wastewater-graph", "figure"),
@@ -305,11 +324,7 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
             search_dict = parse_qs( search.strip("?") )
             if "site" in search_dict:
                 source = search_dict["site"][0]
-        return dashplot.plot_wastewater(
-            *format_data.load_wastewater_data(),
-            cases=get_cases( cases_whole, "/", source=source ),
-            source=source, seq_indicator=False
-        )
+        return plot_indiv_wastewater( source )
 
     @app.callback(
         Output( "wastewater-seq-graph", "figure" ),
@@ -317,16 +332,18 @@ def register_callbacks( app, sequences, cases_whole, growth_rates, ww_growth_rat
          Input( "ww-source-radio", "value" ),
          Input( "smooth-radio", "value")]
     )
+    @figures.memoize( "wastewater-seq-graph", version=lambda *args: ( resources_version, datasets.version( "wastewater" ), datasets.version( "ww_plot_config" ) ) )
     def update_wastewater_seq_graph( norm_type, source, smooth ):
-        return dashplot.plot_wastewater_seqs( *format_data.load_wastewater_data(), config=format_data.load_ww_plot_config(), cases=get_cases( cases_whole, "/", source=source), norm_type=norm_type, source=source, smooth=smooth )
+        return dashplot.plot_wastewater_seqs( *datasets.get( "wastewater" ), config=datasets.get( "ww_plot_config" ), cases=catchment_cases[source], norm_type=norm_type, source=source, smooth=smooth )
 
     @app.callback(
         Output( "monkeypox-graph", "figure"),
         [Input( "yaxis-scale-radio", "value" ),
          Input( "ww-source-radio", "value" )]
     )
+    @figures.memoize( "monkeypox-graph", version=lambda *args: datasets.version( "monkeypox" ) )
     def update_monkeypox_graph( scale, source ):
-        monkeypox_data = format_data.load_monkeypox_data()
+        monkeypox_data = datasets.get( "monkeypox" )
         return dashplot.plot_monkeypox_concentration( *monkeypox_data, scale=scale, source=source )
 
     # This is I guess the way to change the title dynamically. Fingers crossed.
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import threading
+import time
+
+import pandas as pd
+import requests
+
+import src.format_resources as format_data
+
+
+class DatasetCache:
+    """ Process-wide store of parsed datasets that are downloaded from remote repositories. Each dataset is loaded once and
+    then refreshed on a background thread, so callbacks read frames that are already parsed and smoothed, and never wait
+    on the network once a dataset is available.
+
+    A dataset is only reloaded when one of its source URLs reports a new ETag. URLs that don't report an ETag are
+    reloaded every refresh interval, and versioned by a hash of the loaded content. If a refresh fails, the previous
+    copy is kept.
+    """
+    def __init__( self, refresh_interval=600 ):
+        self.refresh_interval = refresh_interval
+        self.loaders = dict()
+        self.urls = dict()
+        self.values = dict()
+        self.versions = dict()
+        self.etags = dict()
+        self.locks = dict()
+        self.thread = None
+
+    def register( self, name, loader, urls=None ):
+        """ Adds a dataset to the cache.
+        Parameters
+        ----------
+        name : str
+            key used to retrieve the dataset.
+        loader : callable
+            function without arguments that downloads and parses the dataset.
+        urls : list[str]
+            remote files the loader reads. Used to check whether the dataset has changed.
+        """
+        self.loaders[name] = loader
+        self.urls[name] = urls if urls is not None else []
+        self.locks[name] = threading.Lock()
+
+    def get( self, name ):
+        """ Returns the current copy of a dataset, loading it if it hasn't been loaded yet.
+        """
+        if name not in self.values:
+            with self.locks[name]:
+                if name not in self.values:
+                    self._load( name, self._current_etags( name ) )
+        return self.values[name]
+
+    def version( self, name ):
+        """ Returns an identifier of the copy get() returns, loading the dataset if needed. Built from the ETags of the
+        source files when they have them, or else from the content of the dataset, so other processes that loaded the
+        same files report the same version.
+        """
+        self.get( name )
+        return self.versions[name]
+
+    def refresh( self, name ):
+        """ Reloads a dataset if its remote files have changed since it was last loaded.
+        """
+        with self.locks[name]:
+            etags = self._current_etags( name )
+            if name in self.values and etags is not None and etags == self.etags.get( name ):
+                return False
+            self._load( name, etags )
+            return True
+
+    def start( self ):
+        """ Starts the background thread, which loads every dataset and then checks for updates every refresh interval.
+        """
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread( target=self._run, name="dataset-cache", daemon=True )
+        self.thread.start()
+
+    def _run( self ):
+        while True:
+            for name in self.loaders:
+                try:
+                    self.refresh( name )
+                except Exception as e:
+                    print( f"Unable to refresh {name}, keeping previous copy: {e}" )
+            time.sleep( self.refresh_interval )
+
+    def _load( self, name, etags ):
+        self.values[name] = self.loaders[name]()
+        self.versions[name] = ",".join( etags ) if etags is not None else get_content_version( self.values[name] )
+        self.etags[name] = etags
+
+    def _current_etags( self, name ):
+        # None if any URL can't be checked, which forces a reload.
+        etags = list()
+        for url in self.urls[name]:
+            try:
+                etag = requests.head( url, timeout=10, allow_redirects=True ).headers.get( "ETag" )
+            except requests.RequestException:
+                return None
+            if etag is None:
+                return None
+            etags.append( etag )
+        return etags
+
+
+def get_content_version( value ):
+    """ SHA-1 of a loaded dataset, which can be a DataFrame, a tuple or list of DataFrames, or a JSON value like a dict.
+    Only depends on the data, so every process that loaded the same files computes the same version.
+    """
+    sha1 = hashlib.sha1()
+
+    def update( item ):
+        if isinstance( item, ( pd.DataFrame, pd.Series ) ):
+            columns = list( item.columns ) if isinstance( item, pd.DataFrame ) else [item.name]
+            sha1.update( repr( ( type( item ).__name__, item.shape, columns ) ).encode() )
+            sha1.update( pd.util.hash_pandas_object( item, index=True ).values.tobytes() )
+        elif isinstance( item, ( tuple, list ) ):
+            sha1.update( f"{type( item ).__name__}{len( item )}".encode() )
+            for i in item:
+                update( i )
+        else:
+            sha1.update( json.dumps( item, sort_keys=True, default=str ).encode() )
+
+    update( value )
+    return sha1.hexdigest()
+
+
+datasets = DatasetCache()
+datasets.register( "wastewater", format_data.load_wastewater_data, urls=format_data.get_wastewater_urls() )
+datasets.register( "ww_plot_config", format_data.load_ww_plot_config, urls=[format_data.WW_PLOT_CONFIG_URL] )
+datasets.register( "ww_growth_rates", format_data.load_ww_growth_rates, urls=[format_data.WW_GROWTH_RATES_URL] )
+datasets.register( "monkeypox", format_data.load_monkeypox_data, urls=format_data.get_monkeypox_urls() )
@@ -1,19 +1,15 @@
-import datetime, os
+import datetime, json, os, sys
 from urllib.error import HTTPError
 import pandas as pd
-from epiweeks import Week
 from arcgis.gis import GIS
 
-# Download metadata from SEARCH repository
-# https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/metadata.csv
-def load_excite_providers() :
-    excite = pd.read_csv( os.path.abspath('../resources/excite_providers.csv'), usecols=["ID", "provider" ] )
-    excite = excite.set_index( "ID" )
-    return excite["provider"].to_dict()
+# Run from src/, so add the project root to import the shared helpers.
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+from src.search_sequences import update_search
 
-def load_file_as_list( loc ):
-    with open( loc, "r" ) as open_file:
-        return [line.strip() for line in open_file]
+# Download metadata from SEARCH repository
+SEQUENCES_PATH = os.path.abspath( "../resources/sequences.csv" )
+STATE_PATH = os.path.abspath( "../resources/sequences_state.json" )
 
 def download_search():
     """ Downloads the metadata from the SEARCH github repository. Removes entries with very wrong dates.
@@ -22,90 +18,8 @@ def download_search():
     pandas.DataFrame:
         Data frame containing the metadata for all sequences generated by SEARCH
     """
+    return update_search( os.path.abspath( "../resources" ) )[0]
 
-    search_md = "https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/metadata.csv"
-    md = pd.read_csv( search_md, usecols=["ID", "collection_date", "location", "authors", "originating_lab", "zipcode", "host", "percent_coverage_cds"] )
-    md["collection_date"] = md["collection_date"].astype( str )
-
-    # Filter out incorrect samples or wastewater
-    md = md.loc[~md["ID"].isin(["SEARCH-104076", "SEARCH-58367"])]
-    #md = md.loc[~md["ID"].isin( load_file_as_list( "resources/ignore.txt") )]
-
-    md = md.loc[(md["location"]=="North America/USA/California/San Diego")|(md["location"].str.startswith( "North America/Mexico/Baja California" ))]
-
-    md = md.loc[~md["collection_date"].str.startswith( "19" )]
-    md = md.loc[~md["collection_date"].str.contains( "/" )]
-
-    md = md.loc[~md["collection_date"].isin( ["NaT", "nan", 'Unknown', 'missing'] )]
-
-    md = md.loc[~md["host"].isin(["Environment","Environmental"] )]
-
-    # Generate an identifiable location column
-    md["state"] = "Baja California"
-    md.loc[md["location"]=="North America/USA/California/San Diego","state"] = "San Diego"
-
-    #clean up zipcode
-    md["zipcode"] = md["zipcode"].astype( "str" )
-    md["zipcode"] = md["zipcode"].apply( lambda x: x.split( "-" )[0] )
-
-    md["epiweek"] = md["collection_date"].apply( lambda x: Week.fromdate( datetime.datetime.strptime( x, "%Y-%m-%d" ).date() ).startdate() )
-    md["collection_date"] = pd.to_datetime( md["collection_date"], format="%Y-%m-%d" ).dt.normalize()
-    md["days_past"] = ( md["collection_date"].max() - md["collection_date"] ).dt.days
-
-    md["originating_lab"] = md["originating_lab"].replace( { 'UC San Diego Center for Advanced Laboratory Medicine' :  "UCSD CALM Lab",
-                                                            "UCSD EXCITE" : "UCSD EXCITE Lab",
-                                                            "EXCITE Lab" : "UCSD EXCITE Lab",
-                                                            "Andersen lab at Scripps Research" : "SD County Public Health Laboratory",
-                                                            "San Diego County Public Health Laboratory" : "SD County Public Health Laboratory",
-                                                            "Sharp HealthCare Laboratory" : "Sharp Health",
-                                                            "Scripps Medical Laboratory" : "Scripps Health",
-                                                            "Rady Children's Hospital - San Diego" : "Rady Children's Hospital",
-                                                            "Rady Children’s Hospital" : "Rady Children's Hospital"} )
-
-    excite_providers = load_excite_providers()
-
-    # Correct some sequencer problems
-    md["sequencer"] = "Andersen Lab"
-    md.loc[md["originating_lab"]=="UCSD EXCITE Lab","sequencer"] = "UCSD EXCITE Lab"
-    md.loc[md["authors"]=="Helix","sequencer"] = "Helix"
-    md.loc[md["ID"].isin( load_file_as_list( os.path.abspath('../resources/sdphl_sequences.txt' )) ),"sequencer"] = "SD County Public Health Laboratory"
-
-    md.loc[md['ID'].str.startswith( "CA-SDCPHL-" ),"sequencer"] = "SD County Public Health Laboratory"
-
-    md["provider"] = md["originating_lab"]
-    md.loc[md["originating_lab"]=="UCSD EXCITE Lab", "provider"] = md["ID"].map( excite_providers )
-    md["provider"] = md["provider"].replace( {"RTL" : "UCSD Return to Learn",
-                                             "CALM" : "UCSD CALM Lab",
-                                             "HELIX" : "Helix",
-                                             "San Diego Fire-Rescue Department" : "SD Fire-Rescue Department",
-                                             "SASEA" : "UCSD Safer at School Early Action",
-                                             "Instituto de Diagnostico y Referencia Epidemiologicos (InDRE)": "InDRE",
-                                             "Delta" : "Helix",
-                                             "DeltaAmplicon" : "Helix",
-                                             "Genomica Lab Molecular, Mexico" : "Genomica Laboratorio",
-                                             "Genomica Lab Molecular, México" : "Genomica Laboratorio"} )
-    md.loc[md["provider"].isna(),"provider"] = md["sequencer"]
-
-    # Add pangolin lineage information
-    pango_loc = "https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/lineage_report.csv"
-    pango = pd.read_csv( pango_loc, usecols=["taxon", "lineage"] )
-    pango["num"] = pango["taxon"].str.extract( "SEARCH-([0-9]+)" )
-    pango.loc[pango["num"].isna(),"num"] = pango["taxon"]
-    pango = pango[["num", "lineage"]]
-
-
-    md["num"] = md["ID"].str.extract( "SEARCH-([0-9]+)" )
-    md.loc[md["num"].isna(),"num"] = md["ID"]
-
-
-    md = md.merge( pango, left_on="num", right_on="num", how="left")
-
-    # Filter sequences which failed lineage calling. These sequences are likely incomplete/erroneous.
-    md = md.loc[~md["lineage"].isin( ["None", "Unassigned"] )]
-
-    md = md[["ID","collection_date", "zipcode", "epiweek", "days_past", "sequencer", "provider", "lineage", "state"]]
-
-    return md
 
 def download_cases():
     """ Downloads the cases per San Diego ZIP code. Appends population.
@@ -232,8 +146,18 @@ def download_bc_cases():
     return bc
 
 if __name__ == "__main__":
-    seqs_md = download_search()
-    seqs_md.to_csv( os.path.abspath('../resources/sequences.csv'), index=False )
+    existing = None
+    state = None
+    if os.path.exists( SEQUENCES_PATH ) and os.path.exists( STATE_PATH ):
+        existing = pd.read_csv( SEQUENCES_PATH, parse_dates=["collection_date", "epiweek"], dtype={"ID" : str, "zipcode" : str} )
+        with open( STATE_PATH, "r" ) as state_file:
+            state = json.load( state_file )
+
+    seqs_md, state = update_search( os.path.abspath( "../resources" ), existing, state )
+    if seqs_md is not None:
+        seqs_md.to_csv( SEQUENCES_PATH, index=False )
+    with open( STATE_PATH, "w" ) as state_file:
+        json.dump( state, state_file, indent=1 )
 
     cases = download_cases()
     cases.to_csv( os.path.abspath('../resources/cases.csv'), index=False )
@@ -0,0 +1,18 @@
+import pandas as pd
+
+
+def get_epiweek_start( dates ):
+    """ Vectorized equivalent of Week.fromdate( x ).startdate() from the epiweeks package. CDC/MMWR weeks run from Sunday
+    to Saturday, so a week starts on the Sunday on or before each date.
+    Parameters
+    ----------
+    dates : pandas.Series
+        dates, or strings that pandas.to_datetime() can parse.
+
+    Returns
+    -------
+    pandas.Series
+        start of the epiweek of each date, as datetime64.
+    """
+    dates = pd.to_datetime( dates ).dt.normalize()
+    return dates - pd.to_timedelta( ( dates.dt.dayofweek + 1 ) % 7, unit="D" )
@@ -0,0 +1,109 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+
+from plotly.utils import PlotlyJSONEncoder
+
+
+def get_code_version( directory=os.path.dirname( os.path.abspath( __file__ ) ) ):
+    """ Hash of the Python sources in src/, so entries written by an older deployment of the dashboard aren't served
+    after its plotting code changes. Every worker computes the same value from the same checkout.
+    """
+    sha1 = hashlib.sha1()
+    for root, dirs, files in os.walk( directory ):
+        dirs[:] = sorted( i for i in dirs if not i.startswith( "." ) and i != "__pycache__" )
+        for file in sorted( files ):
+            if file.endswith( ".py" ):
+                path = os.path.join( root, file )
+                sha1.update( os.path.relpath( path, directory ).encode() )
+                with open( path, "rb" ) as source:
+                    sha1.update( source.read() )
+    return sha1.hexdigest()
+
+
+class FigureCache:
+    """ Least-recently-used store of callback outputs serialized as JSON, kept on disk so that every gunicorn worker
+    shares the same entries. Outputs are keyed on the callback, its inputs, and the version of the data it plots, so
+    figures for the default views are built once and then read back for every visitor.
+
+    Keys also include code_version, so a directory that outlives a deployment doesn't serve figures built by older code.
+    Each entry is a file named after the hash of its key. Reading an entry updates its modification time, and the
+    entries with the oldest modification times are removed once there are more than max_entries.
+    """
+    def __init__( self, directory, max_entries=512, code_version=None ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.code_version = code_version
+        os.makedirs( self.directory, exist_ok=True )
+
+    def get( self, key ):
+        path = self._path( key )
+        try:
+            with open( path ) as cached:
+                value = cached.read()
+            os.utime( path )
+        except OSError:
+            return None
+        return value
+
+    def set( self, key, value ):
+        # Write to a temporary file first so other workers never read a partial entry.
+        handle, temp_path = tempfile.mkstemp( dir=self.directory, suffix=".tmp" )
+        with os.fdopen( handle, "w" ) as temp:
+            temp.write( value )
+        os.replace( temp_path, self._path( key ) )
+        self._evict()
+
+    def memoize( self, name, version=None ):
+        """ Decorator that caches the output of a Dash callback.
+        Parameters
+        ----------
+        name : str
+            name of the callback; part of the key.
+        version : callable
+            function called with the callback's inputs that returns the version of the data the callback reads.
+            Outputs cached for an earlier version aren't returned.
+
+        Returns
+        -------
+        callable
+        """
+        def decorator( func ):
+            @functools.wraps( func )
+            def wrapper( *args ):
+                key = repr( ( self.code_version, name, args, version( *args ) if version is not None else None ) )
+                cached = self.get( key )
+                if cached is not None:
+                    return json.loads( cached )
+                output = func( *args )
+                self.set( key, json.dumps( output, cls=PlotlyJSONEncoder ) )
+                return output
+            return wrapper
+        return decorator
+
+    def _path( self, key ):
+        return os.path.join( self.directory, hashlib.sha1( key.encode() ).hexdigest() + ".json" )
+
+    def _evict( self ):
+        entries = list()
+        for entry in os.scandir( self.directory ):
+            if entry.name.endswith( ".json" ):
+                try:
+                    entries.append( ( entry.stat().st_mtime, entry.path ) )
+                except OSError:
+                    continue
+        if len( entries ) <= self.max_entries:
+            return
+        for _, path in sorted( entries )[:len( entries ) - self.max_entries]:
+            try:
+                os.remove( path )
+            except OSError:
+                pass
+
+
+figures = FigureCache(
+    os.environ.get( "LONE_PINE_FIGURE_CACHE", os.path.join( tempfile.gettempdir(), "lone_pine_figures" ) ),
+    code_version=get_code_version()
+)
@@ -3,26 +3,48 @@ import os
 import numpy as np
 import pandas as pd
 from dash import html
-from epiweeks import Week
 
 from src.variants import VOC, VOI
+from src.epiweek import get_epiweek_start
+from src.snapshots import get_snapshot_path, load_snapshot
 from scipy.optimize import curve_fit
 from scipy.signal import savgol_filter
 from numpy import exp, log
 import geopandas as gpd
 
+WW_REPO = "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master"
+WW_TITER_TEMPLATE = WW_REPO + "/{}_sewage_qPCR.csv"
+WW_SEQS_TEMPLATE = WW_REPO + "/{}_sewage_seqs.csv"
+WW_PLOT_CONFIG_URL = WW_REPO + "/plot_config.yml"
+WW_GROWTH_RATES_URL = WW_REPO + "/rel_growth_rates.csv"
+MPX_REPO = "https://raw.githubusercontent.com/andersen-lab/MPX_WasteWater_San-Diego/master"
+MPX_TITER_TEMPLATE = MPX_REPO + "/MPX_{}_qpcr.csv"
+MPX_CASES_URL = MPX_REPO + "/MPX_cases.csv"
+WW_LOCATIONS = ["PointLoma", "Encina", "SouthBay"]
+
+SEQUENCES_PATH = os.path.abspath( "./resources/sequences.csv" )
+CASES_PATH = os.path.abspath( "./resources/new_cases.csv" )
+GROWTH_RATES_PATH = os.path.abspath( "./resources/growth_rates.csv" )
+
+def clean_zipcodes( zipcodes ):
+    """ Converts zip codes to five digit strings, with "nan" for missing zip codes.
+    """
+    zipcodes = zipcodes.astype( str ).str.split( ":" ).str[0]
+    zipcodes = pd.to_numeric( zipcodes.replace( r'^\s*$', np.nan, regex=True ), errors="coerce" )
+    return zipcodes.map( "{:.0f}".format )
+
 def load_sequences( window=None ):
-    sequences = pd.read_csv( os.path.abspath("./resources/sequences.csv") )
+    sequences = load_snapshot( SEQUENCES_PATH )
+    if sequences is None:
+        sequences = pd.read_csv( SEQUENCES_PATH )
 
-    # Convert to dates correctly.
-    sequences["collection_date"] = pd.to_datetime( sequences["collection_date"] ).dt.tz_localize( None )
-    sequences["collection_date"] = sequences["collection_date"].dt.normalize()
-    sequences["epiweek"] = pd.to_datetime( sequences["epiweek"] ).dt.tz_localize( None )
-    sequences["epiweek"] = sequences["epiweek"].dt.normalize()
+        # Convert to dates correctly.
+        sequences["collection_date"] = pd.to_datetime( sequences["collection_date"] ).dt.tz_localize( None )
+        sequences["collection_date"] = sequences["collection_date"].dt.normalize()
+        sequences["epiweek"] = pd.to_datetime( sequences["epiweek"] ).dt.tz_localize( None )
+        sequences["epiweek"] = sequences["epiweek"].dt.normalize()
 
-    sequences["zipcode"] = sequences["zipcode"].apply( lambda x: str(x).split( ":" )[0] )
-    sequences["zipcode"] = sequences["zipcode"].replace(r'^\s*$', np.nan, regex=True)
-    sequences["zipcode"] = sequences["zipcode"].apply( lambda x: f"{float( x ):.0f}" )
+        sequences["zipcode"] = clean_zipcodes( sequences["zipcode"] )
 
     if window is not None:
         sequences = sequences.loc[sequences["days_past"] <= window].copy()
@@ -31,36 +53,80 @@ def load_sequences( window=None ):
 
 
 def load_cases( window = None ):
-    cases = pd.read_csv( os.path.abspath("./resources/new_cases.csv" ))
+    cases = load_snapshot( CASES_PATH )
+    if cases is None:
+        cases = pd.read_csv( CASES_PATH )
 
-    # Convert to dates correctly.
-    cases["updatedate"] = pd.to_datetime( cases["updatedate"] ).dt.tz_localize( None )
-    cases["updatedate"] = cases["updatedate"].dt.normalize()
+        # Convert to dates correctly.
+        cases["updatedate"] = pd.to_datetime( cases["updatedate"] ).dt.tz_localize( None )
+        cases["updatedate"] = cases["updatedate"].dt.normalize()
 
     if window is not None:
         cases = cases.loc[cases["days_past"] <= window].copy()
     return cases
 
 
+def get_catchment_cases( cases ):
+    """ Daily cases and population of each wastewater catchment area, computed once so wastewater callbacks only need
+    a lookup.
+    Parameters
+    ----------
+    cases : pandas.DataFrame
+        output of load_cases().
+
+    Returns
+    -------
+    dict
+        DataFrame for each catchment indexed by date, with the columns reported_cases, population, and
+        reported_cases_rolling, the smoothed cases per capita.
+    """
+    totals = cases.groupby( ["catchment", "updatedate"], observed=True ).agg(
+        reported_cases=("new_cases", "sum"),
+        population=("population", "sum") )
+
+    catchment_cases = dict()
+    for catchment, catchment_df in totals.groupby( level="catchment", observed=True ):
+        catchment_df = catchment_df.droplevel( "catchment" )
+        catchment_df["reported_cases_rolling"] = savgol_filter( catchment_df["reported_cases"], window_length=21, polyorder=2 )
+        catchment_df.loc[catchment_df["reported_cases_rolling"] < 0] = 0
+        catchment_df["reported_cases_rolling"] = catchment_df["reported_cases_rolling"] / catchment_df["population"]
+        catchment_cases[catchment] = catchment_df
+    return catchment_cases
+
+
 def load_growth_rates():
-    return pd.read_csv( os.path.abspath("./resources/growth_rates.csv" ))
+    growth_rates = load_snapshot( GROWTH_RATES_PATH )
+    if growth_rates is None:
+        growth_rates = pd.read_csv( GROWTH_RATES_PATH )
+    return growth_rates
+
+
+def get_resources_version():
+    """ Latest modification time of the local resources loaded at startup. Changes when the update scripts run.
+    """
+    paths = [SEQUENCES_PATH, CASES_PATH, GROWTH_RATES_PATH]
+    paths += [get_snapshot_path( i ) for i in paths]
+    return max( os.path.getmtime( i ) for i in paths if os.path.exists( i ) )
 
 
 def load_ww_growth_rates():
-    return pd.read_csv( "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master/rel_growth_rates.csv" )
+    return pd.read_csv( WW_GROWTH_RATES_URL )
 
 def format_cases_total( cases_df ):
     return_df = cases_df.sort_values( "updatedate", ascending=False ).groupby( "ziptext" ).first()
     return_df = return_df.reset_index()
     return return_df.drop( columns=["days_past"] )
 
-def get_seqs_per_case( time_series, seq_md, zip_f=None ):
+def get_seqs_per_case( time_series, seq_counts, zip_f=None ):
     """ Combines timeseries of cases and sequences.
     Parameters
     ----------
-    time_series
-    seq_md
-    zip_f
+    time_series : pandas.DataFrame
+        output of load_cases().
+    seq_counts : pandas.DataFrame
+        number of new sequences per day; output of get_seqs() or SequenceCube.get_seqs(), already filtered to zip_f.
+    zip_f : str or list[str]
+        zip code(s) to filter cases to.
 
     Returns
     -------
@@ -75,7 +141,7 @@ def get_seqs_per_case( time_series, seq_md, zip_f=None ):
 
     cases.columns = ["date", "cases"]
 
-    cases = cases.merge( get_seqs( seq_md, zip_f=zip_f ), on="date", how="outer", sort=True )
+    cases = cases.merge( seq_counts, on="date", how="outer", sort=True )
 
     cases["new_sequences"] = cases["new_sequences"].fillna( 0.0 )
     cases["sequences"] = cases["new_sequences"].cumsum()
@@ -114,22 +180,20 @@ def get_seqs( seq_md, groupby="collection_date", zip_f=None ):
 
     return seqs
 
-def format_zip_summary( cases, seqs ):
+def format_zip_summary( cases, cumulative_seqs ):
     """ Merges cummulate cases and sequences for each ZIP code.
     Parameters
     ----------
     cases : pandas.DataFrame
         output of format_cases_total( load_cases() ) containing the cummulative cases for each zip code.
-    seqs : pandas.DataFrame
-        output of download_search() or load_sequences() containing a lkist of sequences with ZIP code information.
+    cumulative_seqs : pandas.DataFrame
+        number of sequences per zip code; output of get_seqs() or SequenceCube.get_seqs() with groupby="zipcode".
     Returns
     -------
     pandas.DataFrame :
         DataFrame linking ZIP code to case counts, sequences, and fraction of cases sequenced. Use format_shapefile() if
         want GeoDataFrames.
     """
-    cumulative_seqs = get_seqs( seqs, groupby="zipcode" )
-
     cumulative_seqs = cumulative_seqs.merge( cases[["ziptext", "case_count"]], left_on="zip", right_on="ziptext", how="right" )
     cumulative_seqs["sequences"] = cumulative_seqs["sequences"].fillna( 0.0 )
     cumulative_seqs["fraction"] = cumulative_seqs["sequences"] / cumulative_seqs["case_count"]
@@ -138,9 +202,8 @@ def format_zip_summary( cases, seqs ):
 
     return cumulative_seqs
 
-def get_lineage_values( seqs ):
-    values = seqs["lineage"].dropna()
-    values = values.sort_values().unique()
+def get_lineage_values( lineages ):
+    values = sorted( lineages )
 
     return_dict = [{"label" : "All variants of concern", "value" : "all-voc" },
                    {"label" : "All Delta lineages", "value" : "all-delta" },
@@ -184,8 +247,8 @@ def get_summary_table( seqs ):
 
     return table
 
-def get_provider_sequencer_values( seqs, value ):
-    labels = [{"label" : f"{i} ({j})", "value": i }for i, j in seqs[value].sort_values().value_counts().iteritems()]
+def get_provider_sequencer_values( counts ):
+    labels = [{"label" : f"{i} ({j})", "value": i } for i, j in counts.items()]
     labels = sorted( labels, key=lambda x: x["label"] )
     return labels
 
@@ -313,16 +376,15 @@ def load_wastewater_data():
         temp["source"] = source
         return temp
 
-    titer_template = "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master/{}_sewage_qPCR.csv"
-    seqs_template = "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master/{}_sewage_seqs.csv"
-    locations = ["PointLoma", "Encina", "SouthBay"]
-
     qpcr_columns = ["date", "gene_copies", "source"]
-    return_df = pd.concat( [load_ww_individual( loc=titer_template.format( loc ), source=loc, date_col="Sample_Date", value_col="gene_copies", columns=qpcr_columns, window_length=11 ) for loc in locations] )
-    seqs = pd.concat( [load_seq_individul( seqs_template.format( loc ), loc ) for loc in locations] )
+    return_df = pd.concat( [load_ww_individual( loc=WW_TITER_TEMPLATE.format( loc ), source=loc, date_col="Sample_Date", value_col="gene_copies", columns=qpcr_columns, window_length=11 ) for loc in WW_LOCATIONS] )
+    seqs = pd.concat( [load_seq_individul( WW_SEQS_TEMPLATE.format( loc ), loc ) for loc in WW_LOCATIONS] )
 
     return return_df, seqs
 
+def get_wastewater_urls():
+    return [WW_TITER_TEMPLATE.format( loc ) for loc in WW_LOCATIONS] + [WW_SEQS_TEMPLATE.format( loc ) for loc in WW_LOCATIONS]
+
 def load_catchment_areas():
     zip_loc = "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master/Zipcodes.csv"
     zips = pd.read_csv( zip_loc, usecols=["Zip_code", "Wastewater_treatment_plant"] )
@@ -360,7 +422,7 @@ def load_ww_plot_config( delta=0.15 ):
     from urllib import request
 
     try:
-        config_url = request.urlopen( "https://raw.githubusercontent.com/andersen-lab/SARS-CoV-2_WasteWater_San-Diego/master/plot_config.yml" )
+        config_url = request.urlopen( WW_PLOT_CONFIG_URL )
         plot_config = yaml.load( config_url, Loader=yaml.FullLoader )
     except:
         print( "Unable to connect to remote config. Defaulting to local, potentially out-of-date copy." )
@@ -388,15 +450,13 @@ def load_ww_plot_config( delta=0.15 ):
     return plot_config
 
 def load_monkeypox_data():
-    titer_template = "https://raw.githubusercontent.com/andersen-lab/MPX_WasteWater_San-Diego/master/MPX_{}_qpcr.csv"
-    locations = ["PointLoma", "Encina", "SouthBay"]
-    data = pd.concat( [load_ww_individual( loc=titer_template.format( loc ), source=loc, date_col="date", value_col="copies", columns=["date", "source", "copies"], window_length=11 if loc=="PointLoma" else 3 ) for loc in locations] )
+    data = pd.concat( [load_ww_individual( loc=MPX_TITER_TEMPLATE.format( loc ), source=loc, date_col="date", value_col="copies", columns=["date", "source", "copies"], window_length=11 if loc=="PointLoma" else 3 ) for loc in WW_LOCATIONS] )
     data.loc[data["copies_rolling"] < 0, "copies_rolling"] = 0
 
-    cases = pd.read_csv( "https://raw.githubusercontent.com/andersen-lab/MPX_WasteWater_San-Diego/master/MPX_cases.csv", parse_dates=["date"] )
+    cases = pd.read_csv( MPX_CASES_URL, parse_dates=["date"] )
     cases["cases"] = cases["cases"].diff().fillna(0)
     cases.loc[cases["cases"]<0,"cases"] = 0
-    cases["week"] = cases["date"].apply( lambda x: Week.fromdate( x ).startdate() )
+    cases["week"] = get_epiweek_start( cases["date"] )
     cases = cases.groupby( "week" )["cases"].agg( "sum" )
     cases = cases.reindex( pd.date_range( cases.index.min(), cases.index.max() ) ).rename_axis( "date" ).reset_index()
     indexer = pd.api.indexers.FixedForwardWindowIndexer( window_size=7 )
@@ -406,3 +466,6 @@ def load_monkeypox_data():
     cases.loc[cases["cases_rolling"]<0,"cases_rolling"] = 0
 
     return data, cases
+
+def get_monkeypox_urls():
+    return [MPX_TITER_TEMPLATE.format( loc ) for loc in WW_LOCATIONS] + [MPX_CASES_URL]
@@ -3,11 +3,11 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import numpy as np
 import pandas as pd
-from epiweeks import Week
 from scipy.signal import savgol_filter
 from scipy.special import betaincinv
 
 from src.variants import VOC, VOI
+from src.epiweek import get_epiweek_start
 import datetime
 
 COLOR_DARK = "#495057"
@@ -111,7 +111,7 @@ def plot_cummulative_cases_seqs( df ):
     return fig
 
 def plot_cummulative_sampling_fraction( df ):
-    df["epiweek"] = df["date"].apply( lambda x: Week.fromdate(x).startdate() )
+    df["epiweek"] = get_epiweek_start( df["date"] )
     plot_df = df.groupby( "epiweek" ).agg( new_cases = ("new_cases", "sum"), new_sequences = ("new_sequences", "sum" ) )
     plot_df = plot_df.loc[plot_df["new_sequences"]>0]
     plot_df["fraction"] = plot_df["new_sequences"] / plot_df["new_cases"]
@@ -143,9 +143,9 @@ def add_missing_to_color_scale( scale, color="white" ):
             return_list.append( [( 1 / len_scale ) * i, col] )
     return return_list
 
-def plot_lineages_time( df, lineage=None, scaleby="fraction" ):
-    plot_df = df.pivot_table( index="epiweek", columns="lineage", values="ID", aggfunc="count" )
-    plot_df = plot_df.fillna( 0 )
+def plot_lineages_time( counts, lineage=None, scaleby="fraction" ):
+    """ counts is the number of sequences per epiweek (index) and lineage (columns); see SequenceCube.pivot(). """
+    plot_df = counts.astype( float )
 
     yaxis_label = "Sequences"
 
@@ -178,8 +178,9 @@ def plot_lineages_time( df, lineage=None, scaleby="fraction" ):
 
     return fig
 
-def plot_voc( df, scaleby="fraction", focus="VOC" ):
-    plot_df = df.pivot_table( index="epiweek", columns="lineage", values="state", aggfunc="count", fill_value=0 ).T
+def plot_voc( counts, scaleby="fraction", focus="VOC" ):
+    """ counts is the number of sequences per epiweek (index) and lineage (columns); see SequenceCube.pivot(). """
+    plot_df = counts.T
     plot_df["VOC"] = plot_df.index.map( VOC )
     plot_df.loc[plot_df["VOC"].isna(),"VOC"] = "Other"
 
@@ -274,12 +275,12 @@ def plot_delta( df, scaleby="fraction" ):
     return fig
 
 
-def plot_lineages( df ):
-
-    plot_df = df["lineage"].value_counts().reset_index()
+def plot_lineages( counts ):
+    """ counts is the number of sequences per lineage; see SequenceCube.count_by(). """
+    plot_df = counts.sort_values( ascending=False )
 
     colors = list()
-    for i in plot_df["index"]:
+    for i in plot_df.index:
         if i in sorted( VOI.keys() ):
             colors.append( "#4977CE" )
         elif i in sorted( VOC.keys() ):
@@ -288,7 +289,7 @@ def plot_lineages( df ):
             colors.append( COLOR_DARK )
 
     fig = go.Figure()
-    fig.add_trace( go.Bar( x=plot_df["index"], y=plot_df["lineage"], marker_color=colors ) )
+    fig.add_trace( go.Bar( x=plot_df.index, y=plot_df.values, marker_color=colors ) )
     fig.update_yaxes( showgrid=True, title="<b>Number of sequences</b>" )
     fig.update_xaxes( title="<b>PANGO lineage</b>" )
 
@@ -358,7 +359,7 @@ def binom_conf_interval(k, n, confidence_level=0.95 ):
 
 def plot_sgtf( sgtf_data ):
     plot_df = sgtf_data[0]
-    plot_df["week"] = plot_df["Date"].apply( lambda x: Week.fromdate( x ).startdate() )
+    plot_df["week"] = get_epiweek_start( plot_df["Date"] )
     plot_df = plot_df.groupby( "week" )[["sgtf_all", "sgtf_likely", "sgtf_unlikely", "total_positive"]].agg( sum )
     plot_df["percent"] = plot_df["sgtf_all"] / plot_df["total_positive"]
     plot_df[["lower", "upper"]] = plot_df.apply( lambda x: binom_conf_interval( x["sgtf_all"], x["total_positive"] ), axis=1 )
@@ -641,156 +642,82 @@ def plot_monkeypox_concentration( mx_gene: pd.DataFrame, mx_cases: pd.DataFrame,
 ## Use load_sequences (1st function from format_resources.py) to get your data, perhaps make code similar to what is seen in load_wastewater_data (line 307)
 ## We need to connect the selections with Zipcode data instead of locations in wastewater.
 
-def plot_wastewater_seqs( ww_data, seqs, cases, config, norm_type, source="PointLoma", smooth=True ) -> go.Figure:
-    def hex_to_rgb( hex_color: str ) -> tuple:
-        hex_color = hex_color.lstrip( "#" )
-        if len( hex_color ) == 3:
-            hex_color = hex_color * 2
-        return int( hex_color[0:2], 16 ), int( hex_color[2:4], 16 ), int( hex_color[4:6], 16 )
-
-    filtered_seqs = seqs.loc[seqs["source"]==source]
-
-    plot_df = []
-    for i in config.keys() :
-        if i != "Other" :
-            try:
-                temp_sum = filtered_seqs[config[i]["members"]].sum( axis=1 )
-            except KeyError:
-                print( 'help"')
-                exit()
-            temp_sum.name = i
-            plot_df.append( temp_sum )
-    plot_df = pd.concat( plot_df, axis=1 )
-    plot_df["Other"] = 100 - plot_df.sum( axis=1 )
-    plot_df["Other"] = plot_df["Other"].clip( lower=0 )
-
+def get_seqs_plot_frame( ww_data, seqs, cases, config, norm_type, source="PointLoma", smooth=True ) -> pd.DataFrame:
+    """ Abundance of each group of lineages in the wastewater sequencing plots, computed for every date at once.
+    Parameters
+    ----------
+    ww_data : pandas.DataFrame
+        viral load for each date and source, with the smoothed load in "gene_copies_rolling".
+    seqs : pandas.DataFrame
+        percentage of each lineage for each date and source, indexed by date.
+    cases : pandas.DataFrame
+        cases in the catchment of source, indexed by date. Only used when norm_type is "cases".
+    config : dict
+        name, lineage members, and color of each group, from load_ww_plot_config().
+    norm_type : str
+        "prevalence" for percentages, "viral" to scale by viral load, or "cases" to scale by reported cases.
+    source : str
+        wastewater treatment plant.
+    smooth : bool
+        whether to apply a Savitzky-Golay filter to the percentages.
+
+    Returns
+    -------
+    pandas.DataFrame
+        one column per group in config, indexed by date.
+    """
+    filtered_seqs = seqs.loc[seqs["source"]==source].drop( columns="source" )
+    groups = [i for i in config.keys() if i != "Other"]
+
+    # Matrix mapping each lineage column to the groups it belongs to, so all groups are summed with a single product.
+    membership = np.zeros( ( filtered_seqs.shape[1], len( groups ) ) )
+    for j, group in enumerate( groups ):
+        columns = filtered_seqs.columns.get_indexer( config[group]["members"] )
+        if ( columns < 0 ).any():
+            missing = [m for m, c in zip( config[group]["members"], columns ) if c < 0]
+            print( f"Lineages {', '.join( missing )} of {group} aren't in the sequencing data for {source}. Ignoring them." )
+        membership[columns[columns >= 0], j] = 1
+
+    values = np.nan_to_num( filtered_seqs.to_numpy( dtype=float ) ) @ membership
+    values = np.column_stack( [values, np.clip( 100 - values.sum( axis=1 ), 0, None )] )
 
     if smooth:
-        plot_df = plot_df.apply( savgol_filter, window_length=21, polyorder=1 )
-        #plot_df = plot_df.apply( lambda x: x.rolling( 14, min_periods=1, win_type="triang" ).mean() )
-        plot_df = plot_df.clip( lower=0 )
-        plot_df = plot_df.apply( lambda x:( x / x.sum()) * 100, axis=1  )
+        values = np.clip( savgol_filter( values, window_length=21, polyorder=1, axis=0 ), 0, None )
+        with np.errstate( invalid="ignore", divide="ignore" ):
+            values = values / values.sum( axis=1, keepdims=True ) * 100
 
-    norm=None
-    ht = "%{y:.0f}"
-
-    if norm_type == "viral":
-        norm = "gene_copies_rolling"
-        yaxis_label = "<b>Variant copies / Liter</b>"
-        ticksuffix = ""
-        yrange = None
-    elif norm_type == "cases":
-        ww_data = ww_data.merge( cases, left_on="date", right_index=True, how="left" )
-        ww_data["reported_cases_rolling"] = ww_data["reported_cases_rolling"] * ww_data["population"]
-        norm="reported_cases_rolling"
-        yaxis_label = "<b>Estimated cases<b>"
-        ticksuffix = ""
-        yrange = None
-    elif norm_type == "prevalence":
-        ht = "%{y:.0f}%"
-        yaxis_label = "<b>Variant prevalence</b>"
-        ticksuffix = "%"
-        yrange = [0,100]
+    plot_df = pd.DataFrame( values, index=filtered_seqs.index, columns=groups + ["Other"] )
 
-    if norm is not None:
-        ww_data = ww_data.loc[ww_data["source"]==source]
-        plot_df = plot_df.merge( ww_data[["date", norm]], left_index=True, right_on="date", how="left" )
-        plot_df = plot_df.rename( columns={ "date" : "Date" } )
+    if norm_type in ["viral", "cases"]:
+        ww_data = ww_data.loc[ww_data["source"]==source].set_index( "date" )
+        if norm_type == "viral":
+            norm = ww_data["gene_copies_rolling"]
+        else:
+            norm = ( cases["reported_cases_rolling"] * cases["population"] ).reindex( ww_data.index )
+        norm = norm.reindex( plot_df.index ).to_numpy()
+        plot_df = plot_df * ( norm[:, np.newaxis] / 100 )
         plot_df = plot_df.dropna()
-        plot_df = plot_df.set_index( "Date" )
-        plot_df = plot_df.loc[:, plot_df.columns != norm].apply( lambda x : (x / 100) * plot_df[norm] )
-
-    fig = go.Figure()
-
-    fill_pattern = go.scatter.Fillpattern( bgcolor=config["Recombinants"]["color"], fgcolor="white", shape="/", solidity=0.5 )
-
-    fig.add_trace(
-        go.Scatter(
-            x=plot_df.index, y=[0]*plot_df.shape[0],
-            hoverinfo="skip",
-            showlegend=False,
-            fillcolor="black",
-            line=dict( width=1, color="black" ),
-            stackgroup='one'
-        )
-    )
-    for i in reversed( list( config.keys() ) ):
-        fig.add_trace(
-            go.Scatter(
-                x=plot_df.index, y=plot_df[i],
-                name=config[i]["name"],
-                hovertemplate=ht,
-                hoverinfo='x+y',
-                mode='lines',
-                fillcolor=f"rgba{(*hex_to_rgb(config[i]['color']), 0.65)}",
-                line=dict( width=0.5, color=config[i]["color"] ),
-                fillpattern=fill_pattern if i == "Recombinants" else None,
-                stackgroup='one'
-            )
-        )
-    fig.add_trace(
-        go.Scatter(
-            x=plot_df.index, y=[0]*plot_df.shape[0],
-            hoverinfo="skip",
-            showlegend=False,
-            fillcolor="black",
-            line=dict( width=1, color="black" ),
-            stackgroup='one'
-        )
-    )
-    fig.update_yaxes( showgrid=True, title=yaxis_label, range=yrange, tickformat='.0f',
-                      ticksuffix=ticksuffix, showline=True, ticks="", mirror=True, linewidth=2 ) # Twice as wide because fake lineages adds with the x-axis
-    fig.update_xaxes( dtick="M1", tickformat="%b\n%Y", mirror=True, showline=True, ticks="", showgrid=False, linewidth=1 )
-    _add_date_formatting_minimum( fig )
-    fig.update_layout( legend=dict( bgcolor="white" ) )
-    fig.update_traces( mode="lines" )
-    return fig
-
+        plot_df.index.name = "Date"
 
+    return plot_df
 
 
-def plot_clinical_seqs( clinical_data, seqs, cases, config, norm_type, source="PointLoma", smooth=True ) -> go.Figure:
+def plot_seqs_frame( plot_df, config, norm_type ) -> go.Figure:
+    """ Stacked area plot of the output of get_seqs_plot_frame().
+    """
     def hex_to_rgb( hex_color: str ) -> tuple:
         hex_color = hex_color.lstrip( "#" )
         if len( hex_color ) == 3:
             hex_color = hex_color * 2
         return int( hex_color[0:2], 16 ), int( hex_color[2:4], 16 ), int( hex_color[4:6], 16 )
 
-    filtered_seqs = seqs.loc[seqs["source"]==source]
-
-    plot_df = []
-    for i in config.keys() :
-        if i != "Other" :
-            try:
-                temp_sum = filtered_seqs[config[i]["members"]].sum( axis=1 )
-            except KeyError:
-                print( 'help"')
-                exit()
-            temp_sum.name = i
-            plot_df.append( temp_sum )
-    plot_df = pd.concat( plot_df, axis=1 )
-    plot_df["Other"] = 100 - plot_df.sum( axis=1 )
-    plot_df["Other"] = plot_df["Other"].clip( lower=0 )
-
-
-    if smooth:
-        plot_df = plot_df.apply( savgol_filter, window_length=21, polyorder=1 )
-        #plot_df = plot_df.apply( lambda x: x.rolling( 14, min_periods=1, win_type="triang" ).mean() )
-        plot_df = plot_df.clip( lower=0 )
-        plot_df = plot_df.apply( lambda x:( x / x.sum()) * 100, axis=1  )
-
-    norm=None
     ht = "%{y:.0f}"
 
     if norm_type == "viral":
-        norm = "gene_copies_rolling"
         yaxis_label = "<b>Variant copies / Liter</b>"
         ticksuffix = ""
         yrange = None
     elif norm_type == "cases":
-        ww_data = ww_data.merge( cases, left_on="date", right_index=True, how="left" )
-        ww_data["reported_cases_rolling"] = ww_data["reported_cases_rolling"] * ww_data["population"]
-        norm="reported_cases_rolling"
         yaxis_label = "<b>Estimated cases<b>"
         ticksuffix = ""
         yrange = None
@@ -800,14 +727,6 @@ def plot_clinical_seqs( clinical_data, seqs, cases, config, norm_type, source="P
         ticksuffix = "%"
         yrange = [0,100]
 
-    if norm is not None:
-        ww_data = ww_data.loc[ww_data["source"]==source]
-        plot_df = plot_df.merge( ww_data[["date", norm]], left_index=True, right_on="date", how="left" )
-        plot_df = plot_df.rename( columns={ "date" : "Date" } )
-        plot_df = plot_df.dropna()
-        plot_df = plot_df.set_index( "Date" )
-        plot_df = plot_df.loc[:, plot_df.columns != norm].apply( lambda x : (x / 100) * plot_df[norm] )
-
     fig = go.Figure()
 
     fill_pattern = go.scatter.Fillpattern( bgcolor=config["Recombinants"]["color"], fgcolor="white", shape="/", solidity=0.5 )
@@ -853,3 +772,13 @@ def plot_clinical_seqs( clinical_data, seqs, cases, config, norm_type, source="P
     fig.update_layout( legend=dict( bgcolor="white" ) )
     fig.update_traces( mode="lines" )
     return fig
+
+
+def plot_wastewater_seqs( ww_data, seqs, cases, config, norm_type, source="PointLoma", smooth=True ) -> go.Figure:
+    plot_df = get_seqs_plot_frame( ww_data, seqs, cases, config, norm_type, source=source, smooth=smooth )
+    return plot_seqs_frame( plot_df, config, norm_type )
+
+
+def plot_clinical_seqs( clinical_data, seqs, cases, config, norm_type, source="PointLoma", smooth=True ) -> go.Figure:
+    plot_df = get_seqs_plot_frame( clinical_data, seqs, cases, config, norm_type, source=source, smooth=smooth )
+    return plot_seqs_frame( plot_df, config, norm_type )
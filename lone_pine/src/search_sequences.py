@@ -0,0 +1,250 @@
+import hashlib
+import io
+import json
+import os
+from urllib import request
+from urllib.error import HTTPError
+import pandas as pd
+
+from src.epiweek import get_epiweek_start
+
+# Sequences from the SEARCH github repository, shared by .github/scripts/update_seqs.py and src/download_resources.py.
+SEARCH_METADATA_URL = "https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/metadata.csv"
+SEARCH_LINEAGES_URL = "https://raw.githubusercontent.com/andersen-lab/HCoV-19-Genomics/master/lineage_report.csv"
+SEARCH_COMMIT_URL = "https://api.github.com/repos/andersen-lab/HCoV-19-Genomics/git/refs/heads/master"
+METADATA_COLUMNS = ["ID", "collection_date", "location", "authors", "originating_lab", "zipcode", "host", "percent_coverage_cds"]
+COLUMNS = ["ID","collection_date", "zipcode", "epiweek", "days_past", "sequencer", "provider", "lineage", "state"]
+LOCAL_INPUTS = ["excite_providers.csv", "sdphl_sequences.txt"]
+
+def load_excite_providers( resources ) :
+    excite = pd.read_csv( os.path.join( resources, "excite_providers.csv" ), usecols=["ID", "provider" ] )
+    excite = excite.set_index( "ID" )
+    return excite["provider"].to_dict()
+
+def load_file_as_list( loc ):
+    with open( loc, "r" ) as open_file:
+        return [line.strip() for line in open_file]
+
+def hash_local_inputs( resources ):
+    """ Fingerprint of the local files clean_metadata() reads. Every sequence is cleaned again when they change.
+    """
+    digest = hashlib.sha1()
+    for name in LOCAL_INPUTS:
+        path = os.path.join( resources, name )
+        if os.path.exists( path ):
+            with open( path, "rb" ) as input_file:
+                digest.update( input_file.read() )
+        digest.update( b"\0" )
+    return digest.hexdigest()
+
+def hash_metadata_rows( md ):
+    """ Hash of each row of metadata.csv, used to find sequences that were corrected upstream.
+    Returns
+    -------
+    dict
+        hex digest of each row, keyed by ID.
+    """
+    hashes = pd.util.hash_pandas_object( md[METADATA_COLUMNS], index=False )
+    return dict( zip( md["ID"], hashes.map( "{:016x}".format ) ) )
+
+def download_if_changed( url, etag=None ):
+    """ Downloads a file unless it still has the ETag it had when it was last downloaded.
+    Parameters
+    ----------
+    url : str
+        location of the file.
+    etag : str
+        ETag returned by the previous download, if any.
+
+    Returns
+    -------
+    (bytes, str)
+        contents of the file, or None if it hasn't changed, and its current ETag.
+    """
+    headers = {"If-None-Match" : etag} if etag else {}
+    try:
+        with request.urlopen( request.Request( url, headers=headers ) ) as response:
+            return response.read(), response.headers.get( "ETag" )
+    except HTTPError as e:
+        if e.code == 304:
+            return None, etag
+        raise
+
+def get_upstream_commit():
+    with request.urlopen( SEARCH_COMMIT_URL ) as response:
+        return json.load( response )["object"]["sha"]
+
+def clean_metadata( md, resources ):
+    """ Filters and cleans SEARCH metadata. Each sequence is cleaned independently of the others, so new sequences can
+    be cleaned on their own and appended to previously cleaned ones.
+    Parameters
+    ----------
+    md : pandas.DataFrame
+        rows of metadata.csv.
+    resources : str
+        directory holding excite_providers.csv and sdphl_sequences.txt.
+
+    Returns
+    -------
+    pandas.DataFrame
+        cleaned sequences, without lineages or days_past.
+    """
+    md["collection_date"] = md["collection_date"].astype( str )
+
+    # Filter out incorrect samples or wastewater
+    md = md.loc[~md["ID"].isin(["SEARCH-104076", "SEARCH-58367"])]
+    #md = md.loc[~md["ID"].isin( load_file_as_list( "resources/ignore.txt") )]
+
+    md = md.loc[(md["location"]=="North America/USA/California/San Diego")|(md["location"].str.startswith( "North America/Mexico/Baja California" ))]
+
+    md = md.loc[~md["collection_date"].str.startswith( "19" )]
+    md = md.loc[~md["collection_date"].str.contains( "/" )]
+
+    md = md.loc[~md["collection_date"].isin( ["NaT", "nan", 'Unknown', 'missing'] )]
+
+    md = md.loc[~md["host"].isin(["Environment","Environmental"] )]
+
+    # Generate an identifiable location column
+    md["state"] = "Baja California"
+    md.loc[md["location"]=="North America/USA/California/San Diego","state"] = "San Diego"
+
+    #clean up zipcode
+    md["zipcode"] = md["zipcode"].astype( "str" )
+    md["zipcode"] = md["zipcode"].apply( lambda x: x.split( "-" )[0] )
+    # Will covert all zipcodes to int except those with alphabetical characters.
+    md["zipcode"] = pd.to_numeric( md["zipcode"], errors="coerce", downcast="integer" )
+
+    md["collection_date"] = pd.to_datetime( md["collection_date"], format="%Y-%m-%d" ).dt.normalize()
+    md["epiweek"] = get_epiweek_start( md["collection_date"] )
+    md["days_past"] = ( md["collection_date"].max() - md["collection_date"] ).dt.days
+
+    md["originating_lab"] = md["originating_lab"].replace( { 'UC San Diego Center for Advanced Laboratory Medicine' :  "UCSD CALM Lab",
+                                                            "UCSD EXCITE" : "UCSD EXCITE Lab",
+                                                            "EXCITE Lab" : "UCSD EXCITE Lab",
+                                                            "Andersen lab at Scripps Research" : "SD County Public Health Laboratory",
+                                                            "San Diego County Public Health Laboratory" : "SD County Public Health Laboratory",
+                                                            "Sharp HealthCare Laboratory" : "Sharp Health",
+                                                            "Scripps Medical Laboratory" : "Scripps Health",
+                                                            "Rady Children's Hospital - San Diego" : "Rady Children's Hospital",
+                                                            "Rady Children’s Hospital" : "Rady Children's Hospital"} )
+
+    excite_providers = load_excite_providers( resources )
+
+    # Correct some sequencer problems
+    md["sequencer"] = "Andersen Lab"
+    md.loc[md["originating_lab"]=="UCSD EXCITE Lab","sequencer"] = "UCSD EXCITE Lab"
+    md.loc[md["authors"]=="Helix","sequencer"] = "Helix"
+    md.loc[md["ID"].isin( load_file_as_list( os.path.join( resources, 'sdphl_sequences.txt' ) ) ),"sequencer"] = "SD County Public Health Laboratory"
+    md.loc[md['ID'].str.startswith( "CA-SDCPHL-" ),"sequencer"] = "SD County Public Health Laboratory"
+
+    md["provider"] = md["originating_lab"]
+    md.loc[md["originating_lab"]=="UCSD EXCITE Lab", "provider"] = md["ID"].map( excite_providers )
+    md["provider"] = md["provider"].replace( {"RTL" : "UCSD Return to Learn",
+                                             "CALM" : "UCSD CALM Lab",
+                                             "HELIX" : "Helix",
+                                             "San Diego Fire-Rescue Department" : "SD Fire-Rescue Department",
+                                             "SASEA" : "UCSD Safer at School Early Action",
+                                             "Instituto de Diagnostico y Referencia Epidemiologicos (InDRE)": "InDRE",
+                                             "Delta" : "Helix",
+                                             "DeltaAmplicon" : "Helix",
+                                             "Genomica Lab Molecular, Mexico" : "Genomica Laboratorio",
+                                             "Genomica Lab Molecular, México" : "Genomica Laboratorio"} )
+    md.loc[md["provider"].isna(),"provider"] = md["sequencer"]
+
+    md["num"] = md["ID"].str.extract( "SEARCH-([0-9]+)" )
+    md.loc[md["num"].isna(),"num"] = md["ID"]
+
+    return md
+
+def add_lineages( md, lineage_report ):
+    """ Adds the pangolin lineage of each sequence and removes sequences which failed lineage calling.
+    """
+    pango = lineage_report[["taxon", "lineage"]].copy()
+    pango["num"] = pango["taxon"].str.extract( "SEARCH-([0-9]+)" )
+    pango.loc[pango["num"].isna(),"num"] = pango["taxon"]
+    pango = pango[["num", "lineage"]]
+
+    md = md.drop( columns=["lineage"], errors="ignore" )
+    md = md.merge( pango, left_on="num", right_on="num", how="left")
+
+    # Filter sequences which failed lineage calling. These sequences are likely incomplete/erroneous.
+    return md.loc[~md["lineage"].isin( ["None", "Unassigned"] )]
+
+def update_search( resources, existing=None, state=None ):
+    """ Updates the sequences from the SEARCH github repository. Only sequences that are new, whose row in metadata.csv
+    changed, or that were never cleaned with the current local inputs are cleaned. Lineages and days_past are
+    recomputed for every sequence, since both can change for old sequences.
+    Parameters
+    ----------
+    resources : str
+        directory holding the local inputs of clean_metadata().
+    existing : pandas.DataFrame
+        output of a previous run. If None, every sequence is processed.
+    state : dict
+        state returned by the previous run, holding the upstream commit, the ETags of the downloaded files, a hash of
+        the local inputs, a hash of each metadata row, and the IDs that clean_metadata() removed.
+
+    Returns
+    -------
+    (pandas.DataFrame, dict)
+        updated sequences, or None if nothing changed, and the state to pass to the next run.
+    """
+    state = state if ( existing is not None and state is not None ) else dict()
+
+    commit = get_upstream_commit()
+    inputs = hash_local_inputs( resources )
+    inputs_changed = inputs != state.get( "inputs" )
+    if existing is not None and commit == state.get( "commit" ) and not inputs_changed:
+        return None, state
+
+    # Unchanged downloads can be skipped only if the sequences don't need to be cleaned again.
+    md_content, md_etag = download_if_changed( SEARCH_METADATA_URL, None if inputs_changed else state.get( "metadata_etag" ) )
+    pango_content, pango_etag = download_if_changed( SEARCH_LINEAGES_URL, None if inputs_changed else state.get( "lineages_etag" ) )
+    if md_content is None and pango_content is None:
+        return None, dict( state, commit=commit )
+
+    # Both files are needed to process new sequences, so download whichever didn't change.
+    if md_content is None:
+        md_content, md_etag = download_if_changed( SEARCH_METADATA_URL )
+    if pango_content is None:
+        pango_content, pango_etag = download_if_changed( SEARCH_LINEAGES_URL )
+
+    # Read as strings so a row's hash doesn't depend on the types pandas infers for the rest of the file.
+    md = pd.read_csv( io.BytesIO( md_content ), usecols=METADATA_COLUMNS, dtype=str )
+    lineage_report = pd.read_csv( io.BytesIO( pango_content ), usecols=["taxon", "lineage"] )
+    row_hashes = hash_metadata_rows( md )
+
+    if existing is None or inputs_changed:
+        unchanged = set()
+    else:
+        previous_hashes = state.get( "row_hashes", {} )
+        unchanged = { i for i, row_hash in row_hashes.items() if previous_hashes.get( i ) == row_hash }
+
+    # Sequences removed upstream are dropped. Sequences whose row changed are cleaned again, including filtered ones.
+    filtered = set( state.get( "filtered_ids", [] ) ).intersection( unchanged )
+    old_md = None
+    new_md = md.loc[~md["ID"].isin( filtered )].copy()
+    if existing is not None:
+        old_md = existing.loc[existing["ID"].isin( unchanged ), [i for i in COLUMNS if i not in ["lineage", "days_past"]]].copy()
+        old_md["num"] = old_md["ID"].str.extract( "SEARCH-([0-9]+)" )
+        old_md.loc[old_md["num"].isna(),"num"] = old_md["ID"]
+        new_md = new_md.loc[~new_md["ID"].isin( old_md["ID"] )]
+
+    print( f"Cleaning {len( new_md )} of {len( md )} sequences." )
+    cleaned = clean_metadata( new_md, resources )
+    filtered = filtered.union( new_md.loc[~new_md["ID"].isin( cleaned["ID"] ), "ID"] )
+    md = pd.concat( [old_md, cleaned], ignore_index=True ) if old_md is not None else cleaned
+
+    md = add_lineages( md, lineage_report )
+    md["days_past"] = ( md["collection_date"].max() - md["collection_date"] ).dt.days
+    md = md[COLUMNS]
+
+    new_state = {
+        "commit" : commit,
+        "metadata_etag" : md_etag,
+        "lineages_etag" : pango_etag,
+        "inputs" : inputs,
+        "filtered_ids" : sorted( filtered ),
+        "row_hashes" : row_hashes
+    }
+    return md, new_state
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ["state", "epiweek", "collection_date", "zipcode", "provider", "sequencer", "lineage"]
+
+
+class SequenceCube:
+    """ Number of sequences for every combination of state, epiweek, collection date, zip code, provider, sequencer, and
+    lineage. Built once from load_sequences() so callbacks filter and sum a table of integer codes instead of copying
+    and re-grouping the full sequence table on each interaction.
+
+    Every dimension is stored as categorical codes, with -1 for missing values. Missing values are kept in the cube
+    so totals match a count of the raw table, but are left out of count_by() and pivot(), like pandas groupby does.
+    """
+    def __init__( self, sequences ):
+        cube = sequences.assign( sequences=sequences["ID"].notna() )
+        # observed=True so categorical columns from a snapshot don't expand to every combination of categories.
+        cube = cube.groupby( DIMENSIONS + ["days_past"], dropna=False, observed=True )["sequences"].sum().reset_index()
+        cube = cube.loc[cube["sequences"] > 0]
+
+        self.categories = dict()
+        self.codes = dict()
+        for column in DIMENSIONS:
+            values = pd.Categorical( cube[column] )
+            self.categories[column] = values.categories
+            self.codes[column] = values.codes.astype( np.int64 )
+        self.days_past = cube["days_past"].to_numpy()
+        self.counts = cube["sequences"].to_numpy( dtype=np.int64 )
+
+    def select( self, url, window=None, provider=None, sequencer=None, zip_f=None ):
+        """ Finds the rows of the cube that match the dashboard filters.
+        Parameters
+        ----------
+        url : str
+            pathname of the page. "/bajacalifornia" selects Baja California sequences, anything else San Diego.
+        window : int
+            maximum number of days since collection.
+        provider : str
+            sequencing provider.
+        sequencer : str
+            sequencing platform.
+        zip_f : str or list[str]
+            zip code(s).
+
+        Returns
+        -------
+        numpy.ndarray
+            boolean mask over the rows of the cube.
+        """
+        mask = self._match( "state", "Baja California" if url == "/bajacalifornia" else "San Diego" )
+        if window:
+            mask &= self.days_past <= window
+        if provider:
+            mask &= self._match( "provider", provider )
+        if sequencer:
+            mask &= self._match( "sequencer", sequencer )
+        if zip_f:
+            mask &= self._match( "zipcode", zip_f )
+        return mask
+
+    def count_by( self, column, mask ):
+        """ Number of sequences for each value of a dimension.
+        Parameters
+        ----------
+        column : str
+            dimension to count.
+        mask : numpy.ndarray
+            output of select().
+
+        Returns
+        -------
+        pandas.Series
+            sequence counts indexed by the values of column, sorted by value. Values without sequences are dropped.
+        """
+        codes = self.codes[column][mask]
+        keep = codes >= 0
+        totals = np.bincount( codes[keep], weights=self.counts[mask][keep], minlength=len( self.categories[column] ) )
+        totals = pd.Series( totals.astype( np.int64 ), index=self.categories[column], name="sequences" )
+        totals.index.name = column
+        return totals.loc[totals > 0]
+
+    def pivot( self, mask, index="epiweek", columns="lineage" ):
+        """ Number of sequences for each pair of values of two dimensions. Equivalent to
+        seqs.pivot_table( index=index, columns=columns, values="ID", aggfunc="count", fill_value=0 ).
+        Parameters
+        ----------
+        mask : numpy.ndarray
+            output of select().
+        index : str
+            dimension used for rows.
+        columns : str
+            dimension used for columns.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        rows = self.codes[index][mask]
+        cols = self.codes[columns][mask]
+        keep = ( rows >= 0 ) & ( cols >= 0 )
+
+        shape = ( len( self.categories[index] ), len( self.categories[columns] ) )
+        table = np.bincount( rows[keep] * shape[1] + cols[keep], weights=self.counts[mask][keep], minlength=shape[0] * shape[1] )
+        table = pd.DataFrame( table.reshape( shape ).astype( np.int64 ), index=self.categories[index], columns=self.categories[columns] )
+        table.index.name = index
+        table.columns.name = columns
+
+        return table.loc[table.sum( axis=1 ) > 0, table.sum( axis=0 ) > 0]
+
+    def get_seqs( self, mask, groupby="collection_date" ):
+        """ Same output as format_resources.get_seqs(), computed from the cube.
+        Parameters
+        ----------
+        mask : numpy.ndarray
+            output of select().
+        groupby : str
+            dimension to count.
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        seqs = self.count_by( groupby, mask ).reset_index()
+        if groupby == "collection_date":
+            seqs.columns = ["date", "new_sequences"]
+        elif groupby == "zipcode":
+            seqs.columns = ["zip", "sequences"]
+        return seqs
+
+    def _match( self, column, values ):
+        if type( values ) != list:
+            values = [values]
+        codes = self.categories[column].get_indexer( values )
+        return np.isin( self.codes[column], codes[codes >= 0] )
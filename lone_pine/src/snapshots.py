@@ -0,0 +1,74 @@
+import hashlib
+import os
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+    feather = None
+
+# Schema metadata key holding the signature of the CSV a snapshot was made from.
+SIGNATURE_KEY = b"lone_pine_source_sha1"
+
+
+def get_snapshot_path( csv_path ):
+    return os.path.splitext( csv_path )[0] + ".feather"
+
+
+def get_csv_signature( csv_path ):
+    """ SHA-1 of the contents of a resource CSV. Unlike modification times, it survives checkouts and copies.
+    """
+    sha1 = hashlib.sha1()
+    with open( csv_path, "rb" ) as csv_file:
+        for block in iter( lambda: csv_file.read( 1 << 20 ), b"" ):
+            sha1.update( block )
+    return sha1.hexdigest().encode()
+
+
+def write_snapshot( frame, csv_path ):
+    """ Writes a Feather snapshot next to a resource CSV, tagged with the signature of the CSV as it is now. Should be
+    called after the CSV is written, with the CSV's rows typed the way the dashboard uses them.
+    Parameters
+    ----------
+    frame : pandas.DataFrame
+        contents of the CSV.
+    csv_path : str
+        location of the resource CSV.
+    """
+    table = pa.Table.from_pandas( frame.reset_index( drop=True ), preserve_index=False )
+    metadata = dict( table.schema.metadata or {} )
+    metadata[SIGNATURE_KEY] = get_csv_signature( csv_path )
+    feather.write_feather( table.replace_schema_metadata( metadata ), get_snapshot_path( csv_path ) )
+
+
+def load_snapshot( csv_path ):
+    """ Loads the Feather snapshot that the update scripts write next to a resource CSV. Snapshots already have clean zip
+    codes, normalized dates and categorical columns, and are memory-mapped instead of parsed. The snapshot is ignored
+    unless it was made from the current contents of the CSV, e.g. after src/download_resources.py, which doesn't write
+    snapshots, rewrites it.
+    Parameters
+    ----------
+    csv_path : str
+        location of the resource CSV.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        None if there is no snapshot, it was made from a different CSV, or pyarrow isn't installed, in which case the
+        CSV should be loaded instead.
+    """
+    snapshot_path = get_snapshot_path( csv_path )
+    if feather is None or not os.path.exists( snapshot_path ):
+        return None
+    try:
+        table = feather.read_table( snapshot_path, memory_map=True )
+    except Exception as e:
+        print( f"Unable to read {snapshot_path}, loading {csv_path} instead: {e}" )
+        return None
+    if os.path.exists( csv_path ):
+        signature = ( table.schema.metadata or {} ).get( SIGNATURE_KEY )
+        if signature != get_csv_signature( csv_path ):
+            print( f"{snapshot_path} was not made from the current {csv_path}. Loading the CSV instead." )
+            return None
+    return table.to_pandas()
@@ -0,0 +1,24 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from src.epiweek import get_epiweek_start
+
+DATES = pd.Series( pd.date_range( "2019-12-25", "2023-01-10", freq="D" ) )
+
+def test_epiweek_starts_on_sunday():
+    starts = get_epiweek_start( DATES )
+    # Sunday on or before each date, computed one date at a time.
+    expected = [d - datetime.timedelta( days=( d.weekday() + 1 ) % 7 ) for d in DATES.dt.date]
+    assert starts.dt.date.tolist() == expected
+
+def test_epiweek_matches_epiweeks_package():
+    epiweeks = pytest.importorskip( "epiweeks" )
+    starts = get_epiweek_start( DATES )
+    expected = [epiweeks.Week.fromdate( d ).startdate() for d in DATES.dt.date]
+    assert starts.dt.date.tolist() == expected
+
+def test_epiweek_parses_strings_and_times():
+    starts = get_epiweek_start( pd.Series( ["2022-01-01 00:00:00", "2022-01-02 13:45:00", "2022-01-08 23:59:59"] ) )
+    assert starts.tolist() == [pd.Timestamp( "2021-12-26" ), pd.Timestamp( "2022-01-02" ), pd.Timestamp( "2022-01-02" )]
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.sequence_cube import SequenceCube
+
+def _sequences( n=400, seed=0 ):
+    rng = np.random.default_rng( seed )
+    dates = pd.Timestamp( "2022-01-01" ) + pd.to_timedelta( rng.integers( 0, 60, n ), unit="D" )
+    def choose( values ):
+        return rng.choice( np.array( values, dtype=object ), n )
+    seqs = pd.DataFrame( {
+        "ID" : choose( ["SEARCH-1", "SEARCH-2", None] ),
+        "state" : choose( ["San Diego", "Baja California"] ),
+        "collection_date" : dates,
+        "zipcode" : choose( ["92037", "92122", "91910", "nan"] ),
+        "provider" : choose( ["SEARCH", "Helix", None] ),
+        "sequencer" : choose( ["Illumina", "Nanopore"] ),
+        "lineage" : choose( ["BA.1", "BA.2", "BA.5", "XBB.1.5", None] ),
+        "days_past" : ( pd.Timestamp( "2022-03-15" ) - dates ).days,
+    } )
+    seqs["epiweek"] = dates - pd.to_timedelta( ( dates.dayofweek + 1 ) % 7, unit="D" )
+    return seqs
+
+def _filter( seqs, url, window=None, provider=None, sequencer=None, zip_f=None ):
+    # Same filters as callbacks.get_sequences(), on the raw table.
+    seqs = seqs.loc[seqs["state"] == ( "Baja California" if url == "/bajacalifornia" else "San Diego" )]
+    if window:
+        seqs = seqs.loc[seqs["days_past"] <= window]
+    if provider:
+        seqs = seqs.loc[seqs["provider"] == provider]
+    if sequencer:
+        seqs = seqs.loc[seqs["sequencer"] == sequencer]
+    if zip_f:
+        seqs = seqs.loc[seqs["zipcode"].isin( zip_f if type( zip_f ) == list else [zip_f] )]
+    return seqs
+
+FILTERS = [
+    dict( url="/" ),
+    dict( url="/bajacalifornia" ),
+    dict( url="/", window=30 ),
+    dict( url="/", provider="Helix", sequencer="Nanopore" ),
+    dict( url="/", zip_f=["92037", "91910"] ),
+    dict( url="/", zip_f="92122", window=45 ),
+]
+
+@pytest.mark.parametrize( "filters", FILTERS )
+def test_pivot_matches_pivot_table( filters ):
+    seqs = _sequences()
+    cube = SequenceCube( seqs )
+    expected = _filter( seqs, **filters ).pivot_table( index="epiweek", columns="lineage", values="ID", aggfunc="count", fill_value=0 )
+    expected = expected.loc[expected.sum( axis=1 ) > 0, expected.sum( axis=0 ) > 0]
+    pd.testing.assert_frame_equal( cube.pivot( cube.select( **filters ) ), expected, check_dtype=False, check_index_type=False, check_column_type=False )
+
+@pytest.mark.parametrize( "filters", FILTERS )
+@pytest.mark.parametrize( "column", ["lineage", "provider", "sequencer", "zipcode", "collection_date"] )
+def test_count_by_matches_groupby( filters, column ):
+    seqs = _sequences()
+    cube = SequenceCube( seqs )
+    expected = _filter( seqs, **filters ).groupby( column )["ID"].count()
+    expected = expected.loc[expected > 0]
+    pd.testing.assert_series_equal( cube.count_by( column, cube.select( **filters ) ), expected, check_dtype=False, check_index_type=False, check_names=False )
+
+@pytest.mark.parametrize( "groupby", ["collection_date", "zipcode"] )
+def test_get_seqs_matches_format_resources( groupby ):
+    seqs = _sequences()
+    cube = SequenceCube( seqs )
+
+    # Old format_resources.get_seqs() on the filtered table. The cube leaves out values without sequences.
+    expected = _filter( seqs, "/" ).groupby( groupby )["ID"].agg( "count" ).reset_index()
+    expected = expected.loc[expected["ID"] > 0].reset_index( drop=True )
+    expected.columns = ["date", "new_sequences"] if groupby == "collection_date" else ["zip", "sequences"]
+
+    pd.testing.assert_frame_equal( cube.get_seqs( cube.select( "/" ), groupby=groupby ), expected, check_dtype=False )
+
+def test_total_matches_raw_count():
+    seqs = _sequences()
+    cube = SequenceCube( seqs )
+    assert cube.counts.sum() == seqs["ID"].notna().sum()
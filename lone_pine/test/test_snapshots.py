@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+# Snapshots are optional in the dashboard, and need pyarrow.
+pytest.importorskip( "pyarrow" )
+
+from src.snapshots import get_snapshot_path, load_snapshot, write_snapshot
+
+def _write_csv( path ):
+    frame = pd.DataFrame( { "ziptext" : ["92037", "92122"], "new_cases" : [1.0, 2.0] } )
+    frame.to_csv( path, index=False )
+    return frame
+
+def test_snapshot_matches_csv( tmp_path ):
+    csv_path = str( tmp_path / "cases.csv" )
+    frame = _write_csv( csv_path )
+    write_snapshot( frame.astype( { "ziptext" : "category" } ), csv_path )
+
+    snapshot = load_snapshot( csv_path )
+    assert snapshot is not None, "Snapshot of the current CSV was not loaded."
+    assert snapshot["ziptext"].dtype == "category"
+    assert snapshot["new_cases"].tolist() == [1.0, 2.0]
+
+def test_snapshot_ignored_when_csv_changes( tmp_path ):
+    csv_path = str( tmp_path / "cases.csv" )
+    frame = _write_csv( csv_path )
+    write_snapshot( frame, csv_path )
+
+    # Same modification order as a fresh checkout, but different contents.
+    frame.assign( new_cases=[3.0, 4.0] ).to_csv( csv_path, index=False )
+    assert load_snapshot( csv_path ) is None, "Snapshot of an outdated CSV was loaded."
+
+def test_snapshot_without_signature_ignored( tmp_path ):
+    csv_path = str( tmp_path / "cases.csv" )
+    frame = _write_csv( csv_path )
+    frame.to_feather( get_snapshot_path( csv_path ) )
+    assert load_snapshot( csv_path ) is None, "Snapshot without a CSV signature was loaded."
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Precompute per-lineage mutation counts from a genomics index.
+
+Run after each genomics index build. The output file is served by the
+lineage-mutations handler (config_web.genomics.LINEAGE_MUTATIONS_TABLE) for
+lineage groups without mutation filters. Counts for a group of lineages
+("A OR B") are the sums of the per-lineage counts, since every genome has
+exactly one pangolin_lineage.
+"""
+import gzip
+import json
+import logging
+import os
+
+from elasticsearch import Elasticsearch
+from tornado.options import options, parse_command_line
+
+options.define('host', default="localhost:9200")
+options.define('index', default="outbreak-genomics")
+options.define('output', default="lineage_mutations.json.gz")
+options.define('max_buckets', default=65535)  # search.max_buckets of the cluster
+options.define('page_size', default=None, type=int)  # lineages per page; defaults to as many as fit under max_buckets
+
+MUTATION_TERMS_SIZE = 10000
+
+def iterate_lineage_buckets(client, index, page_size):
+    query = {
+        "size": 0,
+        "aggs": {
+            "lineages": {
+                "composite": {
+                    "size": page_size,
+                    "sources": [{"pangolin_lineage": {"terms": {"field": "pangolin_lineage"}}}]
+                },
+                "aggs": {
+                    "mutations": {
+                        "nested": {"path": "mutations"},
+                        "aggs": {
+                            "mutations": {
+                                "terms": {"field": "mutations.mutation", "size": MUTATION_TERMS_SIZE},
+                                "aggs": {"genomes": {"reverse_nested": {}}}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+    while True:
+        resp = client.search(index=index, body=query, request_timeout=300)
+        agg = resp["aggregations"]["lineages"]
+        for bucket in agg["buckets"]:
+            yield bucket
+        if "after_key" not in agg or len(agg["buckets"]) == 0:
+            break
+        query["aggs"]["lineages"]["composite"]["after"] = agg["after_key"]
+
+def build_table(client, index, page_size):
+    lineages = {}
+    for bucket in iterate_lineage_buckets(client, index, page_size):
+        # Keys are normalized by the lowercase normalizer; lowercased again so lookups never depend on the mapping
+        lineages[bucket["key"]["pangolin_lineage"].lower()] = {
+            "lineage_count": bucket["doc_count"],
+            "mutations": {
+                i["key"]: i["genomes"]["doc_count"]
+                for i in bucket["mutations"]["mutations"]["buckets"]
+            }
+        }
+    # Record the concrete index(es) behind the alias, in the form the handler compares against
+    indices = client.indices.get_alias(index=index)
+    return {"index": ",".join(sorted(indices)), "lineages": lineages}
+
+def main():
+    parse_command_line()
+    client = Elasticsearch(options.host)
+    # Each lineage bucket can hold up to MUTATION_TERMS_SIZE mutation buckets
+    page_size = options.page_size or max(1, options.max_buckets // (MUTATION_TERMS_SIZE + 1))
+    table = build_table(client, options.index, page_size)
+    # Write then rename so the API never reads a partial file
+    tmp_path = options.output + ".tmp"
+    with gzip.open(tmp_path, "wt") as f:
+        json.dump(table, f)
+    os.replace(tmp_path, options.output)
+    logging.info("wrote %d lineages from %s to %s", len(table["lineages"]), table["index"], options.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
 API_PREFIX = "genomics"
 ES_INDEX = "outbreak-genomics"
 API_VERSION = "v2"
+# Output of bin/lineage_mutations.py; lineage-mutations serves plain lineage groups from it when set
+LINEAGE_MUTATIONS_TABLE = None
+# search.max_buckets of the ES cluster (ES default); bounds how many aggregations are batched per search
+ES_MAX_BUCKETS = 65535
+# Requests slower than this (ms) are logged with their stage timings and ES bodies; None disables
+# logging and skips keeping a copy of each body
+SLOW_QUERY_MS = 5000
 
 APP_LIST_V2 = [
     (
@@ -118,6 +125,7 @@ APP_LIST_ORIGIN = [
     (r"/{pre}/metadata", "web.handlers.genomics.MetadataHandler"),
     (r"/{pre}/gisaid-id-lookup", "web.handlers.genomics.GisaidIDHandler"),
     (r"/{pre}/get-auth-token", "web.handlers.genomics.GISAIDTokenHandler"),
+    (r"/{pre}/metrics", "web.handlers.genomics.MetricsHandler"),
 ]
 
 APP_LIST = [
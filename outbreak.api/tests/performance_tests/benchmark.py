@@ -0,0 +1,265 @@
+"""
+Latency benchmark for the genomics API.
+
+Drives every route in config_web.genomics.APP_LIST with concurrent requests and
+reports p50/p95/p99 latency, throughput, error counts and per-stage timings as
+JSON for regression tracking. Stage timings are read from the Server-Timing
+header when the server sends one (ES time, pandas transforms, serialization).
+
+Run from the outbreak.api folder against a running API:
+
+    python tests/performance_tests/benchmark.py --host http://localhost:8000 --output results.json
+
+or let the harness start the app itself (uses config_web_local.py for ES_HOST,
+so point it at a local ES seeded by generate_corpus.py):
+
+    python tests/performance_tests/benchmark.py --start-app --port 8123 --output results.json
+
+Pass --baseline with an earlier results file to fail on p95 regressions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.error import URLError
+from urllib.parse import quote
+from urllib.request import urlopen
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from config_web import genomics  # noqa: E402
+
+LINEAGES = "b.1.617.2," + ",".join("ay.{}".format(i) for i in range(1, 60))
+
+# Query strings per endpoint name (last path segment); routes without samples are skipped
+SAMPLE_QUERIES = {
+    "lineage-mutations": [
+        "pangolin_lineage=ba.2&frequency=0.75",
+        "pangolin_lineage=ba.1,ba.2,ba.4,ba.5",
+    ],
+    "lineage": ["name=b.1.*", "name=*ay.4*&size=20"],
+    "location": ["name=*cali*", "name=united*"],
+    "prevalence-by-location": [
+        "pangolin_lineage=b.1.1.7&location_id=USA",
+        "pangolin_lineage=" + LINEAGES,
+        "cumulative=true&pangolin_lineage=" + LINEAGES,
+    ],
+    "prevalence-by-location-all-lineages": [
+        "location_id=USA&other_threshold=0.03&nday_threshold=5&ndays=60",
+        "other_threshold=0.05&nday_threshold=10&ndays=180",
+    ],
+    "prevalence-by-position": ["name=S:501", "name=S:484&location_id=USA&pangolin_lineage=b.1.1.7"],
+    "mutation-details": ["mutations=S:E484K,S:N501Y"],
+    "collection-submission": ["", "location_id=USA"],
+    "mutations": ["name=s:e484*"],
+    "mutations-by-lineage": ["mutations=S:E484K&location_id=USA"],
+    "location-lookup": ["id=USA", "id=USA_US-CA"],
+    "most-recent-collection-date-by-location": ["pangolin_lineage=b.1.1.7&location_id=USA"],
+    "most-recent-submission-date-by-location": ["pangolin_lineage=b.1.1.7&location_id=USA"],
+    "sequence-count": [
+        "",
+        "location_id=USA_US-CA",
+        "location_id=USA&cumulative=true&subadmin=true",
+    ],
+    "lineage-by-sub-admin-most-recent": ["pangolin_lineage=b.1.1.7&location_id=USA&ndays=60"],
+    "lineage-by-country": ["pangolin_lineage=b.1.1.7"],
+    "lineage-by-division": ["pangolin_lineage=b.1.1.7&country=United States"],
+    "lineage-and-country": ["pangolin_lineage=b.1.1.7&country=United States"],
+    "lineage-and-division": ["pangolin_lineage=b.1.1.7&division=California"],
+    "global-prevalence": [
+        "",
+        "pangolin_lineage=b.1.1.7",
+        "pangolin_lineage=b.1.1.7&cumulative=true",
+    ],
+    "metadata": [""],
+}
+
+
+def get_routes(pattern=None):
+    routes = []
+    for route, handler in genomics.APP_LIST:
+        path = route.format(pre=genomics.API_PREFIX, ver=genomics.API_VERSION)
+        if path in routes or (pattern and not re.search(pattern, path)):
+            continue
+        routes.append(path)
+    return routes
+
+
+def parse_server_timing(header):
+    # "es;dur=12.1, transform;dur=3.4" -> {"es": 12.1, "transform": 3.4}
+    stages = {}
+    for metric in (header or "").split(","):
+        parts = [i.strip() for i in metric.split(";")]
+        if not parts[0]:
+            continue
+        for param in parts[1:]:
+            if param.startswith("dur="):
+                stages[parts[0]] = float(param[4:])
+    return stages
+
+
+def summarize(latencies, elapsed, errors, stages):
+    latencies_ms = np.array(latencies) * 1000
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else None,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+        "max_ms": float(latencies_ms.max()),
+    }
+    if stages:
+        summary["stages_ms"] = {
+            name: {"mean": float(np.mean(values)), "p95": float(np.percentile(values, 95))}
+            for name, values in stages.items()
+        }
+    return summary
+
+
+async def run_query(client, url, headers, n_requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    stages = defaultdict(list)
+    errors = 0
+
+    async def fetch():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            resp = await client.fetch(
+                HTTPRequest(url, headers=headers, request_timeout=300), raise_error=False
+            )
+            latencies.append(time.perf_counter() - start)
+        if resp.code != 200:
+            errors += 1
+        else:
+            # A body that isn't a JSON object (e.g. an HTML error page from a proxy) is an error too
+            try:
+                body = json.loads(resp.body or b"{}")
+            except ValueError:
+                body = None
+            if not isinstance(body, dict) or not body.get("success"):
+                errors += 1
+        for name, dur in parse_server_timing(resp.headers.get("Server-Timing")).items():
+            stages[name].append(dur)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[fetch() for i in range(n_requests)])
+    return summarize(latencies, time.perf_counter() - start, errors, stages)
+
+
+async def run_benchmark(args):
+    AsyncHTTPClient.configure(None, max_clients=args.concurrency)
+    client = AsyncHTTPClient()
+    headers = {"Authorization": "Bearer {}".format(args.token)} if args.token else {}
+    results = {}
+    skipped = []
+    for path in get_routes(args.routes):
+        queries = SAMPLE_QUERIES.get(path.rsplit("/", 1)[-1])
+        if queries is None:
+            skipped.append(path)
+            continue
+        for query in queries:
+            url = "{}{}?{}".format(args.host.rstrip("/"), path, quote(query, safe="=&,*:"))
+            if args.warmup > 0:
+                await run_query(client, url, headers, args.warmup, args.concurrency)
+            key = "{}?{}".format(path, query) if query else path
+            results[key] = await run_query(client, url, headers, args.requests, args.concurrency)
+            print(
+                "{:>8.1f} {:>8.1f} {:>8.1f} ms  {:>7.1f} rps  {}".format(
+                    results[key]["p50_ms"],
+                    results[key]["p95_ms"],
+                    results[key]["p99_ms"],
+                    results[key]["throughput_rps"],
+                    key[:120],
+                ),
+                file=sys.stderr,
+            )
+    return {
+        "host": args.host,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare_to_baseline(report, baseline, max_regression):
+    regressions = []
+    for key, summary in report["results"].items():
+        if key not in baseline["results"]:
+            continue
+        ratio = summary["p95_ms"] / baseline["results"][key]["p95_ms"]
+        if ratio > 1 + max_regression:
+            regressions.append({"query": key, "p95_ratio": ratio})
+    return regressions
+
+
+def start_app(port):
+    proc = subprocess.Popen(
+        [sys.executable, "index.py", "--conf=config_web", "--port={}".format(port)], cwd=ROOT
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urlopen("http://localhost:{}/".format(port), timeout=5)
+            return proc
+        except (URLError, ConnectionError):
+            if proc.poll() is not None:
+                raise RuntimeError("API exited with code {}".format(proc.returncode))
+            time.sleep(1)
+    proc.terminate()
+    raise RuntimeError("API did not start on port {}".format(port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--start-app", action="store_true", help="start index.py locally")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--requests", type=int, default=100, help="requests per query")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests per query")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", default=None, help="regex filter on route paths")
+    parser.add_argument("--token", default=None, help="GISAID bearer token")
+    parser.add_argument("--output", default=None, help="write JSON results here")
+    parser.add_argument("--baseline", default=None, help="earlier results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 increase")
+    args = parser.parse_args()
+
+    proc = None
+    if args.start_app:
+        proc = start_app(args.port)
+        args.host = "http://localhost:{}".format(args.port)
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare_to_baseline(report, json.load(f), args.max_regression)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,666 @@
+"""
+Synthetic genomics and wastewater corpus for scale testing.
+
+Generates outbreak-genomics documents (a Pango-style lineage tree with aliases
+and crumbs, nested mutations inherited down the tree, country/division/location
+names and IDs, collection dates following lineage waves and submission dates
+with a per-country reporting lag) plus wastewater_metadata, wastewater_demix and
+wastewater_variants documents whose lineage mixes follow the same waves.
+
+Load straight into a local ES (the genomics index is built under a new name and
+the outbreak-genomics alias is moved to it, as a hub build would):
+
+    python tests/performance_tests/generate_corpus.py --genomes 1000000 --host localhost:9200
+
+or write gzipped _bulk NDJSON files to load later:
+
+    python tests/performance_tests/generate_corpus.py --genomes 50000000 --output corpus/
+
+Output is deterministic for a given --seed and set of size options.
+"""
+import argparse
+import gzip
+import itertools
+import json
+import logging
+import os
+import string
+import time
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# name, first nucleotide, length in codons
+GENES = [
+    ("ORF1a", 266, 4405),
+    ("ORF1b", 13468, 2695),
+    ("S", 21563, 1273),
+    ("ORF3a", 25393, 275),
+    ("E", 26245, 75),
+    ("M", 26523, 222),
+    ("ORF6", 27202, 61),
+    ("ORF7a", 27394, 121),
+    ("ORF7b", 27756, 43),
+    ("ORF8", 27894, 121),
+    ("N", 28274, 419),
+    ("ORF10", 29558, 38),
+]
+GENOME_LENGTH = 29903
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY*"
+BASES = "ACGT"
+
+# name, ISO3, share of genomes, days behind the global waves, median submission lag
+COUNTRIES = [
+    ("United States", "USA", 0.40, 14, 12),
+    ("United Kingdom", "GBR", 0.25, 0, 7),
+    ("Germany", "DEU", 0.07, 7, 15),
+    ("Denmark", "DNK", 0.05, 5, 6),
+    ("Canada", "CAN", 0.05, 14, 20),
+    ("Japan", "JPN", 0.04, 21, 18),
+    ("India", "IND", 0.04, 10, 35),
+    ("Brazil", "BRA", 0.03, 20, 30),
+    ("South Africa", "ZAF", 0.03, -10, 14),
+    ("Australia", "AUS", 0.02, 30, 10),
+    ("Kenya", "KEN", 0.01, 25, 60),
+    ("Peru", "PER", 0.01, 25, 45),
+]
+# Division names and the division_id stored on genomes (ISO 3166-2 subdivision code)
+DIVISIONS = {
+    "USA": [
+        ("California", "CA"),
+        ("Texas", "TX"),
+        ("New York", "NY"),
+        ("Florida", "FL"),
+        ("Washington", "WA"),
+        ("Ohio", "OH"),
+        ("Illinois", "IL"),
+        ("Massachusetts", "MA"),
+        ("Michigan", "MI"),
+        ("Colorado", "CO"),
+        ("Hawaii", "HI"),
+        ("Kentucky", "KY"),
+    ],
+    "GBR": [("England", "ENG"), ("Scotland", "SCT"), ("Wales", "WLS"), ("Northern Ireland", "NIR")],
+    "DEU": [("Bavaria", "BY"), ("Berlin", "BE"), ("Hesse", "HE")],
+    "DNK": [("Hovedstaden", "84"), ("Midtjylland", "82")],
+    "CAN": [("Ontario", "ON"), ("Quebec", "QC"), ("British Columbia", "BC")],
+    "JPN": [("Tokyo", "13"), ("Osaka", "27")],
+    "IND": [("Maharashtra", "MH"), ("Delhi", "DL"), ("Karnataka", "KA")],
+    "BRA": [("Sao Paulo", "SP"), ("Rio de Janeiro", "RJ")],
+    "ZAF": [("Gauteng", "GT"), ("Western Cape", "WC")],
+    "AUS": [("New South Wales", "NSW"), ("Victoria", "VIC")],
+    "KEN": [("Nairobi", "110")],
+    "PER": [("Lima", "LIM")],
+}
+MISSING_DIVISION_RATE = 0.03
+MISSING_LOCATION_RATE = 0.3
+MUTATION_DROPOUT_RATE = 0.03
+
+LOWERCASE_KEYWORD = {"type": "keyword", "normalizer": "lowercase"}
+KEYWORD = {"type": "keyword"}
+DATE = {"type": "date", "format": "yyyy-MM-dd"}
+GENOMICS_MAPPING = {
+    "properties": {
+        "accession_id": KEYWORD,
+        # Keywords as in the production index; handlers split and filter the yyyy-MM-dd keys as strings
+        "date_collected": KEYWORD,
+        "date_submitted": KEYWORD,
+        "pangolin_lineage": LOWERCASE_KEYWORD,
+        "pangolin_lineage_crumbs": LOWERCASE_KEYWORD,
+        "country": KEYWORD,
+        "country_id": KEYWORD,
+        "country_lower": KEYWORD,
+        "division": KEYWORD,
+        "division_id": KEYWORD,
+        "division_lower": KEYWORD,
+        "location": KEYWORD,
+        "location_id": KEYWORD,
+        "location_lower": KEYWORD,
+        "mutations": {
+            "type": "nested",
+            "properties": {
+                "mutation": LOWERCASE_KEYWORD,
+                "gene": KEYWORD,
+                "ref_aa": KEYWORD,
+                "alt_aa": KEYWORD,
+                "codon_num": {"type": "integer"},
+                "codon_end": {"type": "integer"},
+                "pos": {"type": "integer"},
+                "type": KEYWORD,
+                "change_length_nt": {"type": "integer"},
+                "is_synonymous": {"type": "boolean"},
+            },
+        },
+    }
+}
+WASTEWATER_MAPPINGS = {
+    "metadata": {
+        "properties": {
+            "sra_accession": KEYWORD,
+            "collection_date": DATE,
+            "collection_site_id": KEYWORD,
+            "geo_loc_country": KEYWORD,
+            "geo_loc_region": KEYWORD,
+            "viral_load": {"type": "float"},
+            "ww_population": {"type": "integer"},
+            "demix_success": {"type": "boolean"},
+            "variants_success": {"type": "boolean"},
+            "coverage_intervals": {
+                "properties": {"start": {"type": "integer"}, "end": {"type": "integer"}}
+            },
+        }
+    },
+    "demix": {
+        "properties": {
+            "sra_accession": KEYWORD,
+            "name": KEYWORD,
+            "crumbs": KEYWORD,
+            "prevalence": {"type": "float"},
+        }
+    },
+    "variants": {
+        "properties": {
+            "sra_accession": KEYWORD,
+            "site": {"type": "integer"},
+            "ref_base": KEYWORD,
+            "alt_base": KEYWORD,
+            "prevalence": {"type": "float"},
+            "depth": {"type": "integer"},
+        }
+    },
+}
+INDEX_SETTINGS = {
+    "analysis": {"normalizer": {"lowercase": {"type": "custom", "filter": ["lowercase"]}}}
+}
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def build_places(rng, locations_per_division):
+    """
+    Every (country, division, location) a genome can come from, with its share of
+    genomes. Missing divisions and locations are stored as "None" like GISAID data.
+    """
+    places = []
+    for country, country_id, share, wave_lag, submission_lag in COUNTRIES:
+        divisions = DIVISIONS[country_id]
+        division_shares = rng.dirichlet(np.ones(len(divisions)))
+        country_place = {
+            "country": country,
+            "country_id": country_id,
+            "wave_lag": wave_lag,
+            "submission_lag": submission_lag,
+        }
+        missing = {"division": "None", "division_id": "None", "location": "None"}
+        places.append(
+            dict(country_place, **missing, location_id="None", share=share * MISSING_DIVISION_RATE)
+        )
+        for (division, division_id), division_share in zip(divisions, division_shares):
+            division_place = dict(country_place, division=division, division_id=division_id)
+            division_share = share * (1 - MISSING_DIVISION_RATE) * division_share
+            places.append(
+                dict(
+                    division_place,
+                    location="None",
+                    location_id="None",
+                    share=division_share * MISSING_LOCATION_RATE,
+                )
+            )
+            # Heavy-tailed county sizes
+            location_shares = rng.dirichlet(np.full(locations_per_division, 0.5))
+            for i, location_share in enumerate(location_shares):
+                places.append(
+                    dict(
+                        division_place,
+                        location="{} County {}".format(division, i + 1),
+                        location_id="{}{:03d}".format(division_id, i + 1),
+                        share=division_share * (1 - MISSING_LOCATION_RATE) * location_share,
+                    )
+                )
+    return places
+
+
+def build_mutation_catalog(rng, n_mutations):
+    """
+    Amino-acid mutations in the nested genomics format, each with the single
+    nucleotide change wastewater variant calls would report for it.
+    """
+    gene_weights = np.array([i[2] for i in GENES], dtype=float)
+    catalog = []
+    seen = set()
+    ref_aa = {}
+    while len(catalog) < n_mutations:
+        gene, start, n_codons = GENES[rng.choice(len(GENES), p=gene_weights / gene_weights.sum())]
+        codon_num = int(rng.integers(1, n_codons + 1))
+        pos = start + (codon_num - 1) * 3
+        if rng.random() < 0.08:
+            codon_end = min(codon_num + int(rng.integers(0, 3)), n_codons)
+            name = "{}:del{}/{}".format(gene.lower(), codon_num, codon_end)
+            record = {
+                "mutation": name, "gene": gene, "ref_aa": name.upper(),
+                "alt_aa": "DEL{}/{}".format(codon_num, codon_end), "codon_num": codon_num,
+                "codon_end": codon_end, "pos": pos, "type": "deletion",
+                "change_length_nt": (codon_end - codon_num + 1) * 3, "is_synonymous": False,
+            }
+        else:
+            ref = ref_aa.setdefault((gene, codon_num), AMINO_ACIDS[rng.integers(20)])
+            alt = rng.choice([i for i in AMINO_ACIDS if i != ref])
+            name = "{}:{}{}{}".format(gene.lower(), ref.lower(), codon_num, alt.lower())
+            record = {
+                "mutation": name, "gene": gene, "ref_aa": ref, "alt_aa": str(alt),
+                "codon_num": codon_num, "pos": pos, "type": "substitution",
+                "is_synonymous": False,
+            }
+        if name in seen:
+            continue
+        seen.add(name)
+        ref_base, alt_base = rng.choice(list(BASES), size=2, replace=False)
+        catalog.append(
+            (record, int(pos + rng.integers(3)), str(ref_base), str(alt_base))
+        )
+    return catalog
+
+
+def alias_codes():
+    # BA, BB, ... skipping A/B roots and X (recombinants)
+    for first, second in itertools.product(string.ascii_lowercase, repeat=2):
+        if first not in "abx":
+            yield first + second
+        elif first == "b" and second not in "ab":
+            yield first + second
+
+
+def build_lineage_tree(rng, n_lineages, n_days, n_mutations):
+    """
+    A Pango-like lineage tree: children are numbered under their parent and a
+    lineage four levels below its alias root gets a new alias for its children
+    (B.1.1.529 -> BA.1). Each lineage inherits its parent's mutations, adds a
+    few of its own and circulates as one wave (peak day, width, size).
+    """
+    codes = alias_codes()
+    names = ["a", "b"]
+    full_names = ["a", "b"]
+    parents = [-1, -1]
+    n_children = [0, 0]
+    aliases = {}
+    emergence = [0.0, 0.0]
+    sizes = list(rng.lognormal(0, 1, 2))
+    mutations = [
+        rng.choice(n_mutations, size=3, replace=False),
+        rng.choice(n_mutations, size=3, replace=False),
+    ]
+    while len(names) < n_lineages:
+        # Bigger, more recent waves spawn more children
+        recency = np.exp(np.array(emergence) / max(n_days, 1))
+        weights = np.array(sizes) * recency
+        parent = int(rng.choice(len(names), p=weights / weights.sum()))
+        n_children[parent] += 1
+        if len(names[parent].split(".")) >= 4:
+            if parent not in aliases:
+                aliases[parent] = next(codes)
+            prefix = aliases[parent]
+        else:
+            prefix = names[parent]
+        names.append("{}.{}".format(prefix, n_children[parent]))
+        full_names.append("{}.{}".format(full_names[parent], n_children[parent]))
+        parents.append(parent)
+        n_children.append(0)
+        emergence.append(min(emergence[parent] + 14 + rng.exponential(90), n_days - 30))
+        sizes.append(rng.lognormal(0, 2))
+        new_mutations = rng.choice(n_mutations, size=1 + rng.poisson(2), replace=False)
+        mutations.append(np.unique(np.concatenate([mutations[parent], new_mutations])))
+    widths = rng.uniform(20, 90, n_lineages)
+    peaks = np.array(emergence) + 2 * widths
+    return {
+        "names": names,
+        "full_names": full_names,
+        "parents": parents,
+        "peaks": peaks,
+        "widths": widths,
+        "sizes": np.array(sizes),
+        "mutations": mutations,
+    }
+
+
+def ancestors(tree, i):
+    lineage = [i]
+    while tree["parents"][lineage[-1]] >= 0:
+        lineage.append(tree["parents"][lineage[-1]])
+    return lineage[::-1]
+
+
+def lineage_activity(tree, n_days):
+    # Relative circulation of each lineage per day, shape (n_days, n_lineages)
+    days = np.arange(n_days)[:, None]
+    activity = tree["sizes"] * np.exp(-0.5 * ((days - tree["peaks"]) / tree["widths"]) ** 2)
+    # The roots never quite disappear, so every day has something to sample
+    activity[:, :2] += 1e-3
+    return activity
+
+
+class LineageSampler:
+    """
+    Draws lineages for many genomes at once: one searchsorted over the per-day
+    cumulative distributions laid end to end.
+    """
+
+    def __init__(self, activity):
+        n_days, self.n_lineages = activity.shape
+        cum = activity.cumsum(axis=1)
+        cum /= cum[:, -1:]
+        self.flat = (cum + np.arange(n_days)[:, None]).ravel()
+
+    def sample(self, rng, days):
+        idx = np.searchsorted(self.flat, days + rng.random(len(days)), side="right")
+        return np.minimum(idx - days * self.n_lineages, self.n_lineages - 1)
+
+
+def generate_genomes(rng, tree, catalog, places, start_date, n_days, n_genomes, chunk_size):
+    """
+    Yield lists of genomics documents. Genomes submitted after the last day are
+    dropped, so recent days are incomplete the way live data is.
+    """
+    activity = lineage_activity(tree, n_days)
+    sampler = LineageSampler(activity)
+    volume = activity.sum(axis=1)
+    day_p = volume / volume.sum()
+    place_p = np.array([i["share"] for i in places])
+    place_p /= place_p.sum()
+    wave_lag = np.array([i["wave_lag"] for i in places])
+    submission_lag = np.array([i["submission_lag"] for i in places], dtype=float)
+    places = [
+        {
+            "country": i["country"], "country_id": i["country_id"],
+            "country_lower": i["country"].lower(), "division": i["division"],
+            "division_id": i["division_id"], "division_lower": i["division"].lower(),
+            "location": i["location"], "location_id": i["location_id"],
+            "location_lower": i["location"].lower(),
+        }
+        for i in places
+    ]
+    crumbs = [
+        ";{};".format(";".join(tree["full_names"][j] for j in ancestors(tree, i)))
+        for i in range(len(tree["names"]))
+    ]
+    records = [i[0] for i in catalog]
+    start = np.datetime64(start_date, "D")
+    n_done = 0
+    while n_done < n_genomes:
+        n = min(chunk_size, n_genomes - n_done)
+        days = rng.choice(n_days, size=n, p=day_p)
+        place = rng.choice(len(places), size=n, p=place_p)
+        lineage = sampler.sample(rng, np.clip(days - wave_lag[place], 0, n_days - 1))
+        submitted = days + np.floor(rng.lognormal(np.log(submission_lag[place]), 0.7)).astype(int)
+        keep = submitted < n_days
+        days, place, lineage, submitted = days[keep], place[keep], lineage[keep], submitted[keep]
+        date_collected = (start + days).astype(str)
+        date_submitted = (start + submitted).astype(str)
+        n_private = rng.poisson(1.5, len(days))
+        docs = []
+        for i in range(len(days)):
+            lineage_mutations = tree["mutations"][lineage[i]]
+            kept = lineage_mutations[rng.random(len(lineage_mutations)) > MUTATION_DROPOUT_RATE]
+            private = rng.integers(len(records), size=n_private[i])
+            doc = {
+                "accession_id": "EPI_ISL_{}".format(n_done + i + 1),
+                "date_collected": date_collected[i],
+                "date_submitted": date_submitted[i],
+                "pangolin_lineage": tree["names"][lineage[i]],
+                "pangolin_lineage_crumbs": crumbs[lineage[i]],
+                "mutations": [records[j] for j in dict.fromkeys(kept.tolist() + private.tolist())],
+            }
+            doc.update(places[place[i]])
+            docs.append(doc)
+        n_done += n
+        yield docs
+
+
+def generate_wastewater(rng, tree, catalog, places, start_date, n_days, n_samples, n_sites):
+    """
+    Yield (kind, id, document) for wastewater metadata, demix and variants.
+    Each sample's lineage mix is drawn from the waves in its country, and its
+    variant calls are the mutations of those lineages at their mix proportions.
+    """
+    activity = lineage_activity(tree, n_days)
+    countries = {}
+    for i in places:
+        if i["division"] != "None":
+            countries.setdefault(i["country"], (i["wave_lag"], set()))[1].add(i["division"])
+    country_names = sorted(countries)
+    country_p = np.array([next(j[2] for j in COUNTRIES if j[0] == i) for i in country_names])
+    sites = []
+    for i in range(n_sites):
+        country = country_names[rng.choice(len(country_names), p=country_p / country_p.sum())]
+        region = sorted(countries[country][1])[rng.integers(len(countries[country][1]))]
+        sites.append(
+            {
+                "collection_site_id": "site_{:05d}".format(i + 1),
+                "geo_loc_country": country,
+                "geo_loc_region": region,
+                "ww_population": int(rng.lognormal(11, 1.2)),
+                "wave_lag": countries[country][0],
+            }
+        )
+    crumbs = [
+        ";{};".format(";".join(tree["names"][j].upper() for j in ancestors(tree, i)))
+        for i in range(len(tree["names"]))
+    ]
+    start = np.datetime64(start_date, "D")
+    for i in range(n_samples):
+        site = sites[rng.integers(n_sites)]
+        day = int(rng.integers(n_days))
+        sra_accession = "SRR{:08d}".format(20000000 + i)
+        demix_success = bool(rng.random() < 0.95)
+        variants_success = bool(rng.random() < 0.95)
+        n_intervals = int(rng.integers(1, 4))
+        intervals = np.sort(rng.choice(GENOME_LENGTH, size=2 * n_intervals, replace=False))
+        yield "metadata", sra_accession, {
+            "sra_accession": sra_accession,
+            "collection_date": str(start + day),
+            "collection_site_id": site["collection_site_id"],
+            "geo_loc_country": site["geo_loc_country"],
+            "geo_loc_region": site["geo_loc_region"],
+            "viral_load": -1 if rng.random() < 0.05 else float(rng.lognormal(10, 1.5)),
+            "ww_population": site["ww_population"],
+            "demix_success": demix_success,
+            "variants_success": variants_success,
+            "coverage_intervals": [
+                {"start": int(intervals[j]) + 1, "end": int(intervals[j + 1]) + 1}
+                for j in range(0, len(intervals), 2)
+            ],
+        }
+        circulating = activity[min(max(day - site["wave_lag"], 0), n_days - 1)]
+        k = min(6, int((circulating > 0).sum()))
+        lineages = rng.choice(
+            len(circulating), size=k, replace=False, p=circulating / circulating.sum()
+        )
+        proportions = circulating[lineages] * rng.gamma(2, size=k)
+        proportions /= proportions.sum()
+        if demix_success:
+            for lineage, prevalence in zip(lineages, proportions):
+                name = tree["names"][lineage].upper()
+                yield "demix", "{}_{}".format(sra_accession, name), {
+                    "sra_accession": sra_accession,
+                    "name": name,
+                    "crumbs": crumbs[lineage],
+                    "prevalence": float(prevalence),
+                }
+        if variants_success:
+            site_prevalence = {}
+            for lineage, prevalence in zip(lineages, proportions):
+                for j in tree["mutations"][lineage]:
+                    site_prevalence[j] = site_prevalence.get(j, 0) + prevalence
+            for j, prevalence in site_prevalence.items():
+                record, nt_site, ref_base, alt_base = catalog[j]
+                prevalence = min(prevalence * rng.uniform(0.9, 1.1), 1.0)
+                if record["type"] != "substitution" or prevalence < 0.01:
+                    continue
+                yield "variants", "{}_{}{}".format(sra_accession, nt_site, alt_base), {
+                    "sra_accession": sra_accession,
+                    "site": nt_site,
+                    "ref_base": ref_base,
+                    "alt_base": alt_base,
+                    "prevalence": float(prevalence),
+                    "depth": int(rng.integers(50, 5000)),
+                }
+
+
+class NDJSONWriter:
+    """
+    Gzipped _bulk request bodies, split into files of at most chunk_size documents.
+    """
+
+    def __init__(self, directory, chunk_size):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, index, doc_id, doc):
+        count, n_files, f = self.files.get(index, (0, 0, None))
+        if f is None or count >= self.chunk_size:
+            if f is not None:
+                f.close()
+            path = os.path.join(self.directory, "{}-{:05d}.ndjson.gz".format(index, n_files))
+            f = gzip.open(path, "wt", compresslevel=1)
+            count, n_files = 0, n_files + 1
+        f.write(dumps_json({"index": {"_index": index, "_id": doc_id}}))
+        f.write("\n")
+        f.write(dumps_json(doc))
+        f.write("\n")
+        self.files[index] = (count + 1, n_files, f)
+
+    def close(self):
+        for count, n_files, f in self.files.values():
+            f.close()
+
+
+class ESLoader:
+    """
+    Bulk loads into new indices with refresh off, then moves each alias onto
+    its new index so the API and its index caches switch over in one step.
+    """
+
+    def __init__(self, host, shards, threads):
+        from elasticsearch import Elasticsearch, helpers
+
+        self.client = Elasticsearch(host, timeout=300)
+        self.helpers = helpers
+        self.shards = shards
+        self.threads = threads
+        self.suffix = time.strftime("%Y%m%d_%H%M%S")
+        self.indices = {}
+
+    def create(self, alias, mapping):
+        if self.client.indices.exists(index=alias) and not self.client.indices.exists_alias(
+            name=alias
+        ):
+            raise RuntimeError("{} is a concrete index, not an alias".format(alias))
+        index = "{}_synthetic_{}".format(alias, self.suffix)
+        settings = dict(
+            INDEX_SETTINGS, number_of_shards=self.shards, number_of_replicas=0, refresh_interval=-1
+        )
+        self.client.indices.create(index=index, body={"settings": settings, "mappings": mapping})
+        self.indices[alias] = index
+
+    def load(self, actions):
+        for ok, item in self.helpers.parallel_bulk(
+            self.client, actions, thread_count=self.threads, chunk_size=1000, raise_on_error=True
+        ):
+            pass
+
+    def finish(self):
+        for alias, index in self.indices.items():
+            self.client.indices.put_settings(index=index, body={"refresh_interval": "1s"})
+            self.client.indices.refresh(index=index)
+            actions = [{"add": {"index": index, "alias": alias}}]
+            if self.client.indices.exists_alias(name=alias):
+                for old in self.client.indices.get_alias(name=alias):
+                    actions.insert(0, {"remove": {"index": old, "alias": alias}})
+            self.client.indices.update_aliases(body={"actions": actions})
+            logging.info("%s -> %s", alias, index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--genomes", type=int, default=1000000)
+    parser.add_argument("--lineages", type=int, default=3000)
+    parser.add_argument("--mutations", type=int, default=20000, help="size of the mutation catalog")
+    parser.add_argument("--locations-per-division", type=int, default=20)
+    parser.add_argument("--start-date", default="2020-01-01")
+    parser.add_argument("--end-date", default="2024-06-30")
+    parser.add_argument("--ww-samples", type=int, default=20000)
+    parser.add_argument("--ww-sites", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=100000, help="documents per batch/file")
+    parser.add_argument("--host", default=None, help="ES host to load into")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=4, help="bulk load threads")
+    parser.add_argument("--genomics-index", default="outbreak-genomics")
+    parser.add_argument("--ww-prefix", default="wastewater_")
+    parser.add_argument("--output", default=None, help="directory for _bulk NDJSON files")
+    args = parser.parse_args()
+    if args.host is None and args.output is None:
+        parser.error("one of --host or --output is required")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    rng = np.random.default_rng(args.seed)
+    n_days = int((np.datetime64(args.end_date) - np.datetime64(args.start_date)).astype(int)) + 1
+    places = build_places(rng, args.locations_per_division)
+    catalog = build_mutation_catalog(rng, args.mutations)
+    tree = build_lineage_tree(rng, args.lineages, n_days, len(catalog))
+    logging.info("%d lineages, %d mutations, %d places", args.lineages, len(catalog), len(places))
+
+    ww_indices = {i: args.ww_prefix + i for i in WASTEWATER_MAPPINGS}
+    writer = NDJSONWriter(args.output, args.chunk_size) if args.output else None
+    loader = ESLoader(args.host, args.shards, args.threads) if args.host else None
+    if loader is not None:
+        loader.create(args.genomics_index, GENOMICS_MAPPING)
+        for kind, mapping in WASTEWATER_MAPPINGS.items():
+            loader.create(ww_indices[kind], mapping)
+
+    def genome_actions():
+        n_genomes = 0
+        for docs in generate_genomes(
+            rng, tree, catalog, places, args.start_date, n_days, args.genomes, args.chunk_size
+        ):
+            for doc in docs:
+                yield args.genomics_index, doc["accession_id"], doc
+            n_genomes += len(docs)
+            logging.info("%d genomes", n_genomes)
+
+    def wastewater_actions():
+        for kind, doc_id, doc in generate_wastewater(
+            rng, tree, catalog, places, args.start_date, n_days, args.ww_samples, args.ww_sites
+        ):
+            yield ww_indices[kind], doc_id, doc
+
+    def emit(actions):
+        for index, doc_id, doc in actions:
+            if writer is not None:
+                writer.write(index, doc_id, doc)
+            if loader is not None:
+                yield {"_index": loader.indices[index], "_id": doc_id, "_source": doc}
+
+    for actions in (genome_actions(), wastewater_actions()):
+        if loader is not None:
+            loader.load(emit(actions))
+        else:
+            for i in emit(actions):
+                pass
+    if writer is not None:
+        writer.close()
+    if loader is not None:
+        loader.finish()
+
+
+if __name__ == "__main__":
+    main()
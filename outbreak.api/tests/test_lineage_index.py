@@ -0,0 +1,43 @@
+import fnmatch
+import random
+
+from web.handlers.genomics.index_cache import match_wildcard
+from web.handlers.v2.genomics.lineage_index import LineageIndex
+
+NAMES = sorted(
+    ["b.1", "b.1.1", "b.1.1.7", "b.1.617.2", "ba.1", "ba.2", "ba.2.12.1", "ba.2.86", "ba.2.86.1", "xbb", "xbb.1.5", "*star"]
+)
+
+
+def _old_match(values, pattern):
+    # Plain scan over every value, without the prefix bisection
+    return [i for i, value in enumerate(values) if fnmatch.fnmatchcase(value, pattern)]
+
+
+def test_match_wildcard_matches_full_scan():
+    patterns = ["*", "b.1*", "ba.2.*", "ba.?", "*.1", "xbb", "ba.2.86*", "c.*", "", "*.2.*", "b?.*"]
+    for pattern in patterns:
+        assert match_wildcard(NAMES, pattern) == _old_match(NAMES, pattern), pattern
+
+
+def test_match_wildcard_random_patterns():
+    rng = random.Random(0)
+    alphabet = "ab.12*?"
+    for _ in range(500):
+        pattern = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 6)))
+        assert match_wildcard(NAMES, pattern) == _old_match(NAMES, pattern), pattern
+
+
+def test_match_wildcard_escapes_and_case():
+    assert match_wildcard(NAMES, "\\**") == [NAMES.index("*star")]
+    # The matcher itself stays case-sensitive for data that isn't normalized
+    assert match_wildcard(NAMES, "BA.2*") == []
+
+
+def test_search_ignores_pattern_case():
+    index = LineageIndex()
+    index.names = NAMES
+    index.counts = [len(i) for i in NAMES]
+    assert index.search("BA.2.86*") == [("ba.2.86.1", 9), ("ba.2.86", 7)]
+    assert index.search("Xbb.1.5") == [("xbb.1.5", 7)]
+    assert index.search("ba.2*", size=1) == index.search("BA.2*", size=1)
@@ -0,0 +1,80 @@
+import asyncio
+import gzip
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from web.handlers.v2.genomics import lineage_mutations
+from web.handlers.v2.genomics.lineage_mutations import LineageMutationsHandler, LineageMutationsTable
+
+
+class StubTimings:
+    @contextmanager
+    def stage(self, name):
+        yield
+
+
+def _write_table(path, index):
+    table = {
+        "index": index,
+        "lineages": {
+            "ba.2.86.1": {"lineage_count": 10, "mutations": {"s:e484k": 9, "s:n501y": 5}},
+            "ba.2": {"lineage_count": 4, "mutations": {"s:e484k": 4}},
+        },
+    }
+    with gzip.open(path, "wt") as f:
+        json.dump(table, f)
+
+
+def _stub_handler(path, pangolin_lineage, es_queries):
+    async def get_index_name():
+        return "genomics_1"
+
+    async def asynchronous_fetch(query):
+        # Answers every group sent to ES with one mutation bucket
+        query = json.loads(query) if isinstance(query, str) else query
+        groups = list(query["aggs"]["lineages"]["filters"]["filters"])
+        es_queries.append(groups)
+        bucket = {
+            "doc_count": 2,
+            "mutations": {"mutations": {"buckets": [{"key": "s:d614g", "genomes": {"doc_count": 2}}]}},
+        }
+        return {"aggregations": {"lineages": {"buckets": {i: bucket for i in groups}}}}
+
+    config = SimpleNamespace(
+        genomics=SimpleNamespace(LINEAGE_MUTATIONS_TABLE=path, ES_MAX_BUCKETS=65535)
+    )
+    return SimpleNamespace(
+        args=SimpleNamespace(pangolin_lineage=pangolin_lineage, frequency=0, gene=None),
+        biothings=SimpleNamespace(config=config),
+        gene_mapping=LineageMutationsHandler.gene_mapping,
+        timings=StubTimings(),
+        get_index_name=get_index_name,
+        asynchronous_fetch=asynchronous_fetch,
+    )
+
+
+def test_table_lookup_ignores_case():
+    table = LineageMutationsTable()
+    table.lineages = {"ba.2": {"lineage_count": 4, "mutations": {"s:e484k": 4}}}
+    assert table.get_buckets(["BA.2"]) == (4, [("s:e484k", 4)])
+    assert table.get_buckets(["ba.2*"]) is None
+    assert table.get_buckets(["BA.2", "xbb.1"]) is None
+
+
+def test_mixed_case_lineage_with_table(tmp_path, monkeypatch):
+    path = str(tmp_path / "lineage_mutations.json.gz")
+    _write_table(path, "genomics_1")
+    monkeypatch.setattr(lineage_mutations, "lineage_mutations_table", LineageMutationsTable())
+    es_queries = []
+    handler = _stub_handler(path, "BA.2.86.1,ba.2*", es_queries)
+
+    resp = asyncio.run(LineageMutationsHandler._get(handler))
+
+    # The mixed-case group is answered from the table, the wildcard group by ES
+    assert es_queries == [["ba.2*"]]
+    results = resp["results"]
+    assert list(results) == ["BA.2.86.1", "ba.2*"]
+    prevalence = {i["mutation"]: i["prevalence"] for i in results["BA.2.86.1"]}
+    assert prevalence == {"s:e484k": 0.9, "s:n501y": 0.5}
+    assert [i["mutation"] for i in results["ba.2*"]] == ["s:d614g"]
@@ -0,0 +1,67 @@
+from web.handlers.genomics.location_id import (
+    COUNTRY_ISO3_TO_ISO2,
+    LOCATION_ID_FIELDS,
+    decode_location_id,
+    encode_child_ids,
+    encode_location_id,
+)
+
+LOCATIONS = [
+    ("USA", None, None),
+    ("USA", "CA", None),
+    ("USA", "CA", "06073"),
+    ("GBR", "ENG", None),
+    ("MEX", "BCN", "02004"),
+    ("XYZ", "ABC", None),  # Not in the ISO3 table, so the ISO3 code prefixes the division
+]
+
+
+def _old_decode(query_id):
+    # parse_location_id_to_query before the codec, minus building the query
+    location_codes = query_id.split("_")
+    for i in range(min(3, len(location_codes))):
+        if i == 1 and len(location_codes[i].split("-")) > 1:
+            location_codes[i] = location_codes[i].split("-")[1]
+    return dict(zip(LOCATION_ID_FIELDS, location_codes))
+
+
+def _old_encode(country_id, division_id=None, location_id=None):
+    country_iso2_code = COUNTRY_ISO3_TO_ISO2[country_id] if country_id in COUNTRY_ISO3_TO_ISO2 else country_id
+    if division_id is None:
+        return country_id
+    if location_id is None:
+        return "_".join([country_id, country_iso2_code + "-" + division_id])
+    return "_".join([country_id, country_iso2_code + "-" + division_id, location_id])
+
+
+def _old_child_id(sub_id, query_location):
+    if query_location is None:
+        return sub_id
+    if len(query_location.split("_")) == 1:
+        iso2 = COUNTRY_ISO3_TO_ISO2.get(query_location, query_location)
+        return "_".join([query_location, iso2 + "-" + sub_id])
+    return "_".join([query_location, sub_id])
+
+
+def test_encode_matches_old_ids():
+    for location in LOCATIONS:
+        assert encode_location_id(*location) == _old_encode(*location)
+    assert encode_location_id("USA", "CA") == "USA_US-CA"
+
+
+def test_decode_matches_old_parse():
+    for location in LOCATIONS:
+        location_id = encode_location_id(*location)
+        decoded = dict(zip(LOCATION_ID_FIELDS, decode_location_id(location_id)))
+        assert decoded == _old_decode(location_id)
+        assert tuple(decoded.values()) == tuple(i for i in location if i is not None)
+
+
+def test_decode_ignores_extra_parts():
+    assert decode_location_id("USA_US-CA_06073_extra") == ("USA", "CA", "06073")
+    assert decode_location_id("USA_CA") == ("USA", "CA")
+
+
+def test_child_ids_match_old_lambdas():
+    for parent, children in [(None, ["USA", "MEX"]), ("USA", ["CA", "NY"]), ("XYZ", ["ABC"]), ("USA_US-CA", ["06073"])]:
+        assert encode_child_ids(parent, children) == [_old_child_id(i, parent) for i in children]
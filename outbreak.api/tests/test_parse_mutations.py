@@ -0,0 +1,76 @@
+import re
+
+import pandas as pd
+
+from web.handlers.genomics.util import parse_mutations
+
+GENE_MAPPING = {"orf1a": "ORF1a", "orf1b": "ORF1b", "s": "S", "n": "N"}
+MUTATIONS = [
+    "s:d614g",
+    "s:n501y",
+    "orf1b:p314l",
+    "n:r203k",
+    "orf8:q27*",
+    "s:ins214epe",
+    "s:del69/70",
+    "s:DEL144/144",
+    "s:y144del",
+    "orf1a:s3675/3677del",
+    "s:214_215insepe",
+    "orf1a:del3675_3677",
+]
+
+
+def _old_parse(mutations):
+    # The per-row lambdas parse_mutations replaced
+    def gene(k):
+        return GENE_MAPPING[k.split(":")[0]] if k.split(":")[0] in GENE_MAPPING else k.split(":")[0]
+
+    def is_substitution(k):
+        return "DEL" not in k and "del" not in k and "_" not in k
+
+    return pd.DataFrame({"mutation": mutations}).assign(
+        gene=lambda x: x["mutation"].apply(gene),
+        ref_aa=lambda x: x["mutation"]
+        .apply(lambda k: re.findall("[A-Za-z*]+", k.split(":")[1])[0] if is_substitution(k) else k)
+        .str.upper(),
+        alt_aa=lambda x: x["mutation"]
+        .apply(lambda k: re.findall("[A-Za-z*]+", k.split(":")[1])[1] if is_substitution(k) else k.split(":")[1])
+        .str.upper(),
+        codon_num=lambda x: x["mutation"].apply(lambda k: int(re.findall("[0-9]+", k.split(":")[1])[0])),
+        codon_end=lambda x: x["mutation"].apply(
+            lambda k: int(re.findall("[0-9]+", k.split(":")[1])[1])
+            if "/" in k and ("DEL" in k or "del" in k)
+            else None
+        ),
+        type=lambda x: x["mutation"].apply(lambda k: "deletion" if "DEL" in k or "del" in k else "substitution"),
+    )
+
+
+def _records(df):
+    # Compare values, not dtypes: missing codon_end is None in one and NaN in the other
+    return [
+        {k: (None if pd.isna(v) else v) for k, v in row.items()}
+        for row in df[["gene", "ref_aa", "alt_aa", "codon_num", "codon_end", "type"]].to_dict("records")
+    ]
+
+
+def test_parse_mutations_matches_old_lambdas():
+    mutations = pd.Series(MUTATIONS)
+    assert _records(parse_mutations(mutations, GENE_MAPPING)) == _records(_old_parse(MUTATIONS))
+
+
+def test_parse_mutations_canonical_only():
+    # Without fallback rows, codon columns stay integer like the old output
+    canonical = [i for i in MUTATIONS if "_" not in i and "/" not in i]
+    parsed = parse_mutations(pd.Series(canonical), GENE_MAPPING)
+    assert _records(parsed) == _records(_old_parse(canonical))
+    assert parsed["codon_num"].dtype.kind == "i"
+
+
+def test_parse_mutations_keeps_index():
+    mutations = pd.Series(["s:214_215insepe", "s:d614g", "s:del69/70"], index=[7, 3, 5])
+    parsed = parse_mutations(mutations, GENE_MAPPING)
+    assert list(parsed.index) == [7, 3, 5]
+    assert parsed.loc[3, "ref_aa"] == "D"
+    assert parsed.loc[7, "ref_aa"] == "S:214_215INSEPE"
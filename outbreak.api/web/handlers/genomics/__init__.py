@@ -22,6 +22,7 @@ from .lineage import (
     MutationDetailsHandler,
     MutationsByLineage,
 )
+from .metrics import MetricsHandler
 from .prevalence import (
     CumulativePrevalenceByLocationHandler,
     GlobalPrevalenceByTimeHandler,
@@ -1,8 +1,27 @@
 import abc
+import json
+import logging
+import time
 
+import pandas as pd
 from biothings.web.handlers import BaseAPIHandler
+from tornado.web import RequestHandler
 
 from .gisaid_auth import gisaid_authorized
+from .metrics import RequestTimings, stage_metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
 
 class BaseHandler(BaseAPIHandler):
@@ -17,41 +36,112 @@ class BaseHandler(BaseAPIHandler):
         self.set_header("Access-Control-Allow-Methods", "POST, GET, OPTIONS, PATCH, PUT")
 
     size = 10000
+    stream_chunk_size = 5000
+    timings = None
 
     async def asynchronous_fetch(self, query):
-        query["track_total_hits"] = True
+        if not isinstance(query, str):  # Bodies from cached_query_body are pre-serialized
+            query["track_total_hits"] = True
+        start = time.perf_counter()
         response = await self.biothings.elasticsearch.async_client.search(
             index=self.biothings.config.genomics.ES_INDEX, body=query, size=0, request_timeout=90
         )
+        self.timings.add_query(query, response.get("took"), (time.perf_counter() - start) * 1000)
         return response
 
     async def asynchronous_fetch_count(self, query):
         query["track_total_hits"] = True
+        start = time.perf_counter()
         response = await self.biothings.elasticsearch.async_client.count(
             index=self.biothings.config.genomics.ES_INDEX, body=query
         )
+        self.timings.add_query(query, None, (time.perf_counter() - start) * 1000)
         return response
 
+    async def get_index_name(self):
+        # Concrete index(es) behind the genomics alias; changes when a new build goes live
+        response = await self.biothings.elasticsearch.async_client.indices.get_alias(
+            index=self.biothings.config.genomics.ES_INDEX
+        )
+        return ",".join(sorted(response))
+
     async def get_mapping(self):
         response = await self.biothings.elasticsearch.async_client.indices.get_mapping(
             index=self.biothings.config.genomics.ES_INDEX
         )
         return response
 
+    def set_server_timing(self):
+        # Stages finished so far; streamed serialization is only in the metrics endpoint
+        self.set_header(
+            "Server-Timing",
+            "{}, app;dur={:.1f}".format(
+                self.timings.server_timing(), self.request.request_time() * 1000
+            ).lstrip(", "),
+        )
+
+    async def write_response(self, resp):
+        if isinstance(resp, dict) and isinstance(resp.get("results"), pd.DataFrame):
+            if getattr(self, "format", "json") == "json":
+                self.set_server_timing()
+                with self.timings.stage("serialize"):
+                    await self.write_records(resp)
+                return
+            resp = dict(resp, results=resp["results"].to_dict(orient="records"))
+        with self.timings.stage("serialize"):
+            self.write(resp)
+        self.set_server_timing()
+
+    async def write_records(self, resp):
+        """
+        Stream a response whose "results" is a DataFrame as a JSON list of records,
+        encoding and flushing stream_chunk_size rows at a time from the column arrays.
+        """
+        df = resp["results"]
+        head = dumps_json({k: v for k, v in resp.items() if k != "results"})[:-1]
+        RequestHandler.write(self, head + (b',"results":[' if len(head) > 1 else b'"results":['))
+        columns = [str(i) for i in df.columns]
+        arrays = [df[i].to_numpy() for i in df.columns]
+        for start in range(0, df.shape[0], self.stream_chunk_size):
+            rows = zip(*[i[start : start + self.stream_chunk_size].tolist() for i in arrays])
+            chunk = dumps_json([dict(zip(columns, row)) for row in rows])[1:-1]
+            RequestHandler.write(self, b"," + chunk if start > 0 else chunk)
+            await self.flush()
+        RequestHandler.write(self, b"]}")
+
     def post(self):
         pass
 
+    def on_finish(self):
+        super().on_finish()
+        if self.timings is None:
+            return
+        total = self.request.request_time()
+        stage_metrics.record(type(self).__name__, self.get_status(), self.timings, total)
+        threshold = self.biothings.config.genomics.SLOW_QUERY_MS
+        if threshold is not None and total * 1000 >= threshold:
+            logger.warning(
+                "Slow genomics request (%.0f ms) %s stages=%s queries=%s",
+                total * 1000,
+                self.request.uri,
+                json.dumps({k: round(v, 1) for k, v in self.timings.stages.items()}),
+                self.timings.query_log(),
+            )
+
     async def get(self):
+        self.timings = RequestTimings(
+            keep_queries=self.biothings.config.genomics.SLOW_QUERY_MS is not None
+        )
         if not getattr(self.biothings.config, "DISABLE_GENOMICS_ENDPOINT", False):
             await self._get_with_gisauth()
         else:
             resp = await self._get()
-            self.write(resp)
+            await self.write_response(resp)
 
     @gisaid_authorized
     async def _get_with_gisauth(self):
         resp = await self._get()
-        self.write(resp)
+        await self.write_response(resp)
 
     def _get(self):
         raise NotImplementedError()
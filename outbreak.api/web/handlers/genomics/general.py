@@ -1,12 +1,11 @@
 import pandas as pd
 from .base import BaseHandler
 from tornado import gen
-from .util import create_nested_mutation_query, parse_location_id_to_query, get_total_hits
+from .location_id import encode_child_ids, encode_location_id
+from .util import create_nested_mutation_query, parse_location_id_to_query, get_total_hits, iterate_composite_buckets, create_date_partitions
 
 class SequenceCountHandler(BaseHandler):
 
-    country_iso3_to_iso2 = {"BGD": "BD", "BEL": "BE", "BFA": "BF", "BGR": "BG", "BIH": "BA", "BRB": "BB", "WLF": "WF", "BLM": "BL", "BMU": "BM", "BRN": "BN", "BOL": "BO", "BHR": "BH", "BDI": "BI", "BEN": "BJ", "BTN": "BT", "JAM": "JM", "BVT": "BV", "BWA": "BW", "WSM": "WS", "BES": "BQ", "BRA": "BR", "BHS": "BS", "JEY": "JE", "BLR": "BY", "BLZ": "BZ", "RUS": "RU", "RWA": "RW", "SRB": "RS", "TLS": "TL", "REU": "RE", "TKM": "TM", "TJK": "TJ", "ROU": "RO", "TKL": "TK", "GNB": "GW", "GUM": "GU", "GTM": "GT", "SGS": "GS", "GRC": "GR", "GNQ": "GQ", "GLP": "GP", "JPN": "JP", "GUY": "GY", "GGY": "GG", "GUF": "GF", "GEO": "GE", "GRD": "GD", "GBR": "GB", "GAB": "GA", "SLV": "SV", "GIN": "GN", "GMB": "GM", "GRL": "GL", "GIB": "GI", "GHA": "GH", "OMN": "OM", "TUN": "TN", "JOR": "JO", "HRV": "HR", "HTI": "HT", "HUN": "HU", "HKG": "HK", "HND": "HN", "HMD": "HM", "VEN": "VE", "PRI": "PR", "PSE": "PS", "PLW": "PW", "PRT": "PT", "SJM": "SJ", "PRY": "PY", "IRQ": "IQ", "PAN": "PA", "PYF": "PF", "PNG": "PG", "PER": "PE", "PAK": "PK", "PHL": "PH", "PCN": "PN", "POL": "PL", "SPM": "PM", "ZMB": "ZM", "ESH": "EH", "EST": "EE", "EGY": "EG", "ZAF": "ZA", "ECU": "EC", "ITA": "IT", "VNM": "VN", "SLB": "SB", "ETH": "ET", "SOM": "SO", "ZWE": "ZW", "SAU": "SA", "ESP": "ES", "ERI": "ER", "MNE": "ME", "MDA": "MD", "MDG": "MG", "MAF": "MF", "MAR": "MA", "MCO": "MC", "UZB": "UZ", "MMR": "MM", "MLI": "ML", "MAC": "MO", "MNG": "MN", "MHL": "MH", "MKD": "MK", "MUS": "MU", "MLT": "MT", "MWI": "MW", "MDV": "MV", "MTQ": "MQ", "MNP": "MP", "MSR": "MS", "MRT": "MR", "IMN": "IM", "UGA": "UG", "TZA": "TZ", "MYS": "MY", "MEX": "MX", "ISR": "IL", "FRA": "FR", "IOT": "IO", "SHN": "SH", "FIN": "FI", "FJI": "FJ", "FLK": "FK", "FSM": "FM", "FRO": "FO", "NIC": "NI", "NLD": "NL", "NOR": "NO", "NAM": "NA", "VUT": "VU", "NCL": "NC", "NER": "NE", "NFK": "NF", "NGA": "NG", "NZL": "NZ", "NPL": "NP", "NRU": "NR", "NIU": "NU", "COK": "CK", "XKX": "XK", "CIV": "CI", "CHE": "CH", "COL": "CO", "CHN": "CN", "CMR": "CM", "CHL": "CL", "CCK": "CC", "CAN": "CA", "COG": "CG", "CAF": "CF", "COD": "CD", "CZE": "CZ", "CYP": "CY", "CXR": "CX", "CRI": "CR", "CUW": "CW", "CPV": "CV", "CUB": "CU", "SWZ": "SZ", "SYR": "SY", "SXM": "SX", "KGZ": "KG", "KEN": "KE", "SSD": "SS", "SUR": "SR", "KIR": "KI", "KHM": "KH", "KNA": "KN", "COM": "KM", "STP": "ST", "SVK": "SK", "KOR": "KR", "SVN": "SI", "PRK": "KP", "KWT": "KW", "SEN": "SN", "SMR": "SM", "SLE": "SL", "SYC": "SC", "KAZ": "KZ", "CYM": "KY", "SGP": "SG", "SWE": "SE", "SDN": "SD", "DOM": "DO", "DMA": "DM", "DJI": "DJ", "DNK": "DK", "VGB": "VG", "DEU": "DE", "YEM": "YE", "DZA": "DZ", "USA": "US", "URY": "UY", "MYT": "YT", "UMI": "UM", "LBN": "LB", "LCA": "LC", "LAO": "LA", "TUV": "TV", "TWN": "TW", "TTO": "TT", "TUR": "TR", "LKA": "LK", "LIE": "LI", "LVA": "LV", "TON": "TO", "LTU": "LT", "LUX": "LU", "LBR": "LR", "LSO": "LS", "THA": "TH", "ATF": "TF", "TGO": "TG", "TCD": "TD", "TCA": "TC", "LBY": "LY", "VAT": "VA", "VCT": "VC", "ARE": "AE", "AND": "AD", "ATG": "AG", "AFG": "AF", "AIA": "AI", "VIR": "VI", "ISL": "IS", "IRN": "IR", "ARM": "AM", "ALB": "AL", "AGO": "AO", "ATA": "AQ", "ASM": "AS", "ARG": "AR", "AUS": "AU", "AUT": "AT", "ABW": "AW", "IND": "IN", "ALA": "AX", "AZE": "AZ", "IRL": "IE", "IDN": "ID", "UKR": "UA", "QAT": "QA", "MOZ": "MZ"} # TODO: Move to separate class.
-
     @gen.coroutine
     def _get(self):
         query_location = self.get_argument("location_id", None)
@@ -55,15 +54,12 @@ class SequenceCountHandler(BaseHandler):
                     }
                 }
                 resp = yield self.asynchronous_fetch(query)
-                parse_id = lambda x,y: x
-                if subadmin == "division_id":
-                    parse_id = lambda x,loc_id: "_".join([loc_id, self.country_iso3_to_iso2[loc_id]+"-"+x if loc_id in self.country_iso3_to_iso2 else loc_id+"-"+x])
-                if subadmin == "location_id":
-                    parse_id = lambda x,loc_id: "_".join([loc_id, x])
+                buckets = [i for i in resp["aggregations"]["subadmin"]["buckets"] if i["key"].lower() != "none"]
+                location_ids = encode_child_ids(query_location, [i["key"] for i in buckets])
                 flattened_response = [{
                     "total_count": i["doc_count"],
-                    "location_id": parse_id(i["key"], query_location)
-                } for i in resp["aggregations"]["subadmin"]["buckets"] if i["key"].lower() != "none"]
+                    "location_id": j
+                } for i, j in zip(buckets, location_ids)]
                 flattened_response = sorted(flattened_response, key = lambda x: -x["total_count"])
             else:
                 resp = yield self.asynchronous_fetch(query)
@@ -225,9 +221,6 @@ class LocationDetailsHandler(BaseHandler):
 
 class LocationHandler(BaseHandler):
 
-    # Use dict to map to NE IDs from epi data
-    country_iso3_to_iso2 = {"BGD": "BD", "BEL": "BE", "BFA": "BF", "BGR": "BG", "BIH": "BA", "BRB": "BB", "WLF": "WF", "BLM": "BL", "BMU": "BM", "BRN": "BN", "BOL": "BO", "BHR": "BH", "BDI": "BI", "BEN": "BJ", "BTN": "BT", "JAM": "JM", "BVT": "BV", "BWA": "BW", "WSM": "WS", "BES": "BQ", "BRA": "BR", "BHS": "BS", "JEY": "JE", "BLR": "BY", "BLZ": "BZ", "RUS": "RU", "RWA": "RW", "SRB": "RS", "TLS": "TL", "REU": "RE", "TKM": "TM", "TJK": "TJ", "ROU": "RO", "TKL": "TK", "GNB": "GW", "GUM": "GU", "GTM": "GT", "SGS": "GS", "GRC": "GR", "GNQ": "GQ", "GLP": "GP", "JPN": "JP", "GUY": "GY", "GGY": "GG", "GUF": "GF", "GEO": "GE", "GRD": "GD", "GBR": "GB", "GAB": "GA", "SLV": "SV", "GIN": "GN", "GMB": "GM", "GRL": "GL", "GIB": "GI", "GHA": "GH", "OMN": "OM", "TUN": "TN", "JOR": "JO", "HRV": "HR", "HTI": "HT", "HUN": "HU", "HKG": "HK", "HND": "HN", "HMD": "HM", "VEN": "VE", "PRI": "PR", "PSE": "PS", "PLW": "PW", "PRT": "PT", "SJM": "SJ", "PRY": "PY", "IRQ": "IQ", "PAN": "PA", "PYF": "PF", "PNG": "PG", "PER": "PE", "PAK": "PK", "PHL": "PH", "PCN": "PN", "POL": "PL", "SPM": "PM", "ZMB": "ZM", "ESH": "EH", "EST": "EE", "EGY": "EG", "ZAF": "ZA", "ECU": "EC", "ITA": "IT", "VNM": "VN", "SLB": "SB", "ETH": "ET", "SOM": "SO", "ZWE": "ZW", "SAU": "SA", "ESP": "ES", "ERI": "ER", "MNE": "ME", "MDA": "MD", "MDG": "MG", "MAF": "MF", "MAR": "MA", "MCO": "MC", "UZB": "UZ", "MMR": "MM", "MLI": "ML", "MAC": "MO", "MNG": "MN", "MHL": "MH", "MKD": "MK", "MUS": "MU", "MLT": "MT", "MWI": "MW", "MDV": "MV", "MTQ": "MQ", "MNP": "MP", "MSR": "MS", "MRT": "MR", "IMN": "IM", "UGA": "UG", "TZA": "TZ", "MYS": "MY", "MEX": "MX", "ISR": "IL", "FRA": "FR", "IOT": "IO", "SHN": "SH", "FIN": "FI", "FJI": "FJ", "FLK": "FK", "FSM": "FM", "FRO": "FO", "NIC": "NI", "NLD": "NL", "NOR": "NO", "NAM": "NA", "VUT": "VU", "NCL": "NC", "NER": "NE", "NFK": "NF", "NGA": "NG", "NZL": "NZ", "NPL": "NP", "NRU": "NR", "NIU": "NU", "COK": "CK", "XKX": "XK", "CIV": "CI", "CHE": "CH", "COL": "CO", "CHN": "CN", "CMR": "CM", "CHL": "CL", "CCK": "CC", "CAN": "CA", "COG": "CG", "CAF": "CF", "COD": "CD", "CZE": "CZ", "CYP": "CY", "CXR": "CX", "CRI": "CR", "CUW": "CW", "CPV": "CV", "CUB": "CU", "SWZ": "SZ", "SYR": "SY", "SXM": "SX", "KGZ": "KG", "KEN": "KE", "SSD": "SS", "SUR": "SR", "KIR": "KI", "KHM": "KH", "KNA": "KN", "COM": "KM", "STP": "ST", "SVK": "SK", "KOR": "KR", "SVN": "SI", "PRK": "KP", "KWT": "KW", "SEN": "SN", "SMR": "SM", "SLE": "SL", "SYC": "SC", "KAZ": "KZ", "CYM": "KY", "SGP": "SG", "SWE": "SE", "SDN": "SD", "DOM": "DO", "DMA": "DM", "DJI": "DJ", "DNK": "DK", "VGB": "VG", "DEU": "DE", "YEM": "YE", "DZA": "DZ", "USA": "US", "URY": "UY", "MYT": "YT", "UMI": "UM", "LBN": "LB", "LCA": "LC", "LAO": "LA", "TUV": "TV", "TWN": "TW", "TTO": "TT", "TUR": "TR", "LKA": "LK", "LIE": "LI", "LVA": "LV", "TON": "TO", "LTU": "LT", "LUX": "LU", "LBR": "LR", "LSO": "LS", "THA": "TH", "ATF": "TF", "TGO": "TG", "TCD": "TD", "TCA": "TC", "LBY": "LY", "VAT": "VA", "VCT": "VC", "ARE": "AE", "AND": "AD", "ATG": "AG", "AFG": "AF", "AIA": "AI", "VIR": "VI", "ISL": "IS", "IRN": "IR", "ARM": "AM", "ALB": "AL", "AGO": "AO", "ATA": "AQ", "ASM": "AS", "ARG": "AR", "AUS": "AU", "AUT": "AT", "ABW": "AW", "IND": "IN", "ALA": "AX", "AZE": "AZ", "IRL": "IE", "IDN": "ID", "UKR": "UA", "QAT": "QA", "MOZ": "MZ"}
-
     location_types = ["country", "division", "location"]
 
     @gen.coroutine
@@ -284,13 +277,12 @@ class LocationHandler(BaseHandler):
                 for rec in resp["aggregations"]["loc_agg"]["buckets"]:
                     if rec["key"]["division"].lower() in ["none", "unknown"] or rec["key"]["division"].lower().replace(" ", "").replace("-", "") == "outofstate" or rec["key"]["division_id"].lower() == "none":
                         continue
-                    country_iso2_code = self.country_iso3_to_iso2[rec["key"]["country_id"]] if rec["key"]["country_id"] in self.country_iso3_to_iso2 else rec["key"]["country_id"]
                     flattened_response.append({
                         "country": rec["key"]["country"],
                         "country_id": rec["key"]["country_id"],
                         "division": rec["key"]["division"],
                         "division_id": rec["key"]["division_id"],
-                        "id": "_".join([rec["key"]["country_id"], country_iso2_code + "-" + rec["key"]["division_id"]]),
+                        "id": encode_location_id(rec["key"]["country_id"], rec["key"]["division_id"]),
                         "label": ", ".join([rec["key"]["division"], rec["key"]["country"]]),
                         "admin_level": 1,
                         "total_count": rec["doc_count"]
@@ -299,7 +291,6 @@ class LocationHandler(BaseHandler):
                 for rec in resp["aggregations"]["loc_agg"]["buckets"]:
                     if rec["key"]["location"].lower() in ["none", "unknown"] or rec["key"]["location"].lower().replace(" ", "").replace("-", "") == "outofstate" or rec["key"]["location_id"].lower() == "none":
                         continue
-                    country_iso2_code = self.country_iso3_to_iso2[rec["key"]["country_id"]] if rec["key"]["country_id"] in self.country_iso3_to_iso2 else rec["key"]["country_id"]
                     flattened_response.append({
                         "country": rec["key"]["country"],
                         "country_id": rec["key"]["country_id"],
@@ -307,7 +298,7 @@ class LocationHandler(BaseHandler):
                         "division_id": rec["key"]["division_id"],
                         "location": rec["key"]["location"],
                         "location_id": rec["key"]["location_id"],
-                        "id": "_".join([rec["key"]["country_id"], country_iso2_code + "-" + rec["key"]["division_id"], rec["key"]["location_id"]]),
+                        "id": encode_location_id(rec["key"]["country_id"], rec["key"]["division_id"], rec["key"]["location_id"]),
                         "label": ", ".join([rec["key"]["location"], rec["key"]["division"], rec["key"]["country"]]),
                         "admin_level": 2,
                         "total_count": rec["doc_count"]
@@ -370,8 +361,7 @@ class MutationHandler(BaseHandler):
 
 class SubmissionLagHandler(BaseHandler):
 
-    @gen.coroutine
-    def _get(self):
+    async def _get(self):
         query_location = self.get_argument("location_id", None)
         query = {
             "aggs": {
@@ -388,21 +378,18 @@ class SubmissionLagHandler(BaseHandler):
         }
         if query_location is not None:
             query["query"] = parse_location_id_to_query(query_location)
-        resp = yield self.asynchronous_fetch(query)
-        path_to_results = ["aggregations", "date_collected_submitted_buckets", "buckets"]
-        buckets = resp
-        for i in path_to_results:
-            buckets = buckets[i]
-        while "after_key" in resp["aggregations"]["date_collected_submitted_buckets"]:
-            query["aggs"]["date_collected_submitted_buckets"]["composite"]["after"] = resp["aggregations"]["date_collected_submitted_buckets"]["after_key"]
-            resp = yield self.asynchronous_fetch(query)
-            buckets.extend(resp["aggregations"]["date_collected_submitted_buckets"]["buckets"])
-        flattened_response = [{
-            "date_collected": i["key"]["date_collected"],
-            "date_submitted": i["key"]["date_submitted"],
-            "total_count": i["doc_count"]
-        } for i in buckets]
-        resp = {"success": True, "results": flattened_response}
+        date_collected, date_submitted, total_count = [], [], []
+        async for buckets in iterate_composite_buckets(self.asynchronous_fetch, query, "date_collected_submitted_buckets", partitions = create_date_partitions("date_collected")):
+            for i in buckets:
+                date_collected.append(i["key"]["date_collected"])
+                date_submitted.append(i["key"]["date_submitted"])
+                total_count.append(i["doc_count"])
+        df_response = pd.DataFrame({
+            "date_collected": date_collected,
+            "date_submitted": date_submitted,
+            "total_count": total_count
+        })
+        resp = {"success": True, "results": df_response}
         return resp
 
 class MetadataHandler(BaseHandler):
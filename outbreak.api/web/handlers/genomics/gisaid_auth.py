@@ -1,7 +1,11 @@
+import asyncio
 import functools
+import hashlib
 import inspect
 import urllib.parse
+from collections import OrderedDict
 from typing import Callable, Optional, Awaitable
+import config_web
 from config_web import GPS_CLIENT_ID, GPS_API_ENDPOINT, GPS_AUTHN_URL, SECRET_KEY, CACHE_TIME, WHITELIST_KEYS
 import jwt
 from datetime import datetime as dt, timedelta, timezone
@@ -12,12 +16,102 @@ from tornado.web import RequestHandler, HTTPError
 # 15 seconds may or may not be a reasonable default
 _gisaid_gps_api_http_client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(15.0))
 
+TOKEN_CACHE_SIZE = getattr(config_web, "TOKEN_CACHE_SIZE", 10000)
+# Fraction of CACHE_TIME after which authenticated tokens are re-checked in the background
+TOKEN_REFRESH_AHEAD = getattr(config_web, "TOKEN_REFRESH_AHEAD", 0.8)
+
+
+class TokenVerificationCache:
+    """
+    LRU of verified API tokens keyed by token hash.
+    Concurrent GISAID GPS checks for the same token share a single request.
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def get(self, token):
+        """
+        Return (key, entry) for a token, decoding it on a cache miss.
+        Raises jwt.ExpiredSignatureError or jwt.DecodeError like jwt.decode.
+        """
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        if entry is None:
+            decoded_token = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            entry = {
+                "authn_token": decoded_token["authn_token"],
+                "last_checked": decoded_token["last_checked"],
+                "is_authenticated": decoded_token["is_authenticated"],
+                "exp": decoded_token.get("exp"),
+                "api_token": None,  # Re-issued token after a successful GPS check
+            }
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        if entry["exp"] is not None and entry["exp"] < dt.now(timezone.utc).timestamp():
+            self._entries.pop(key, None)
+            raise jwt.ExpiredSignatureError()
+        return key, entry
+
+    def check(self, key, entry):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._check(entry))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return future
+
+    def refresh_ahead(self, key, entry):
+        if key not in self._inflight:
+            future = self.check(key, entry)
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def _check(self, entry):
+        request_params = {
+            "api": {"version": 1},
+            "ctx": "cov",
+            "client_id": GPS_CLIENT_ID,
+            "auth_token": entry["authn_token"],
+            "cmd": "state/auth/check"
+        }
+        resp = await _gisaid_gps_api_http_client.post(
+            GPS_API_ENDPOINT, json=request_params
+        )
+        resp.raise_for_status()  # raise on non 200 resp.
+        resp_json = await resp.json()
+        if resp_json['rc'] == 'ok':
+            last_checked = dt.now(timezone.utc).timestamp()
+            entry["api_token"] = jwt.encode({
+                "authn_token": entry["authn_token"],
+                "last_checked": last_checked,
+                "is_authenticated": True
+            }, SECRET_KEY, algorithm="HS256")
+            entry["last_checked"] = last_checked
+            entry["is_authenticated"] = True
+        else:
+            entry["is_authenticated"] = False
+        return resp_json['rc']
+
+
+_token_cache = TokenVerificationCache()
+
 
 def gisaid_authorized(method: Callable[..., Optional[Awaitable[None]]]) ->\
         Callable[..., Optional[Awaitable[None]]]:
 
     @functools.wraps(method)
     async def wrapper(self: RequestHandler, *args, **kwargs) -> Optional[Awaitable[None]]:
+        async def run_method():
+            result = method(self, *args, **kwargs)
+            if inspect.isawaitable(result):
+                return await result
+            else:
+                return result
         try:
             authz_header = self.request.headers['Authorization']
         except KeyError:
@@ -32,14 +126,9 @@ def gisaid_authorized(method: Callable[..., Optional[Awaitable[None]]]) ->\
             raise HTTPError(400)
         # we are assuming that the token is of type str
         if parts[1] in WHITELIST_KEYS:
-            result = method(self, *args, **kwargs)
-            if inspect.isawaitable(result):
-                return await result
-            else:
-                return result
-        decoded_token = None
+            return await run_method()
         try:
-            decoded_token = jwt.decode(parts[1], SECRET_KEY, algorithms=["HS256"])
+            token_key, token_entry = _token_cache.get(parts[1])
         except jwt.ExpiredSignatureError:
             self.set_status(403)
             self.add_header('WWW-Authenticate',
@@ -52,49 +141,28 @@ def gisaid_authorized(method: Callable[..., Optional[Awaitable[None]]]) ->\
                             'Bearer realm="GISAID Authentication-Token"')
             self.write({"message": "Invalid token. Please authenticate!"})
             return self.finish()
-        token_diff_time = (dt.now(timezone.utc) - dt.utcfromtimestamp(decoded_token["last_checked"]).replace(tzinfo=timezone.utc)).seconds
-        #print(token_diff_time)
+        token_diff_time = dt.now(timezone.utc).timestamp() - token_entry["last_checked"]
         reset_last_checked = False                # False only if cache expired and token is unauthenticated
         if token_diff_time <= CACHE_TIME: # Cached token
-            if decoded_token["is_authenticated"]: # Authenticated
-                result = method(self, *args, **kwargs)
-                if inspect.isawaitable(result):
-                    return await result
-                else:
-                    return result
+            if token_entry["is_authenticated"]: # Authenticated
+                if token_diff_time >= CACHE_TIME * TOKEN_REFRESH_AHEAD: # Re-check with GPS off the request path
+                    _token_cache.refresh_ahead(token_key, token_entry)
+                if token_entry["api_token"] is not None:
+                    self.add_header('X-Auth-Token', token_entry["api_token"])
+                return await run_method()
             else:           # Unauthenticated
                 reset_last_checked = True
         elif token_diff_time <= CACHE_TIME * 2:                   # Cache expired. Extend cache time to allow user to get new token
-            if decoded_token["is_authenticated"]: # Authenticated
+            if token_entry["is_authenticated"]: # Authenticated
                 reset_last_checked = True
         if reset_last_checked:
-            request_params = {
-                "api": {"version": 1},
-                "ctx": "cov",
-                "client_id": GPS_CLIENT_ID,
-                "auth_token": decoded_token["authn_token"],
-                "cmd": "state/auth/check"
-            }
-            resp = await _gisaid_gps_api_http_client.post(
-                GPS_API_ENDPOINT, json=request_params
-            )
-            resp.raise_for_status()  # raise on non 200 resp.
-            resp_json = await resp.json()
-            if resp_json['rc'] == 'ok':
-                encoded_api_token = jwt.encode({
-                    "authn_token": decoded_token["authn_token"],
-                    "last_checked": dt.now(timezone.utc).timestamp(),
-                    "is_authenticated": True
-                }, SECRET_KEY, algorithm="HS256")
-                self.add_header('X-Auth-Token', encoded_api_token)
-                result = method(self, *args, **kwargs)
-                if inspect.isawaitable(result):
-                    return await result
-                else:
-                    return result
+            rc = await asyncio.shield(_token_cache.check(token_key, token_entry))
+            if rc == 'ok':
+                self.add_header('X-Auth-Token', token_entry["api_token"])
+                return await run_method()
             else:
                 self.set_status(403)
-                self.write({'gisaid_response': resp_json['rc']})
+                self.write({'gisaid_response': rc})
                 return self.finish()
         else:
             self.set_status(403)
@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import re
+import time
+from bisect import bisect_left, bisect_right
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_wildcard(pattern):
+    """
+    Compile an ES wildcard pattern (* and ?, backslash escapes) into a regex.
+    Returns the regex and the literal prefix before the first wildcard.
+    """
+    parts = []
+    prefix = None
+    escaped = False
+    for position, c in enumerate(pattern):
+        if escaped:
+            parts.append(re.escape(c))
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c in "*?":
+            if prefix is None:
+                prefix = re.sub(r"\\(.)", r"\1", pattern[:position])
+            parts.append(".*" if c == "*" else ".")
+        else:
+            parts.append(re.escape(c))
+    if prefix is None:
+        prefix = re.sub(r"\\(.)", r"\1", pattern)
+    return re.compile("".join(parts), re.DOTALL), prefix
+
+
+def match_wildcard(sorted_values, pattern):
+    """
+    Positions in sorted_values matching an ES wildcard pattern, in ascending order.
+    The literal prefix narrows the scan to a bisected range.
+    """
+    regex, prefix = compile_wildcard(pattern)
+    start = bisect_left(sorted_values, prefix)
+    end = bisect_right(sorted_values, prefix + "\U0010ffff") if prefix else len(sorted_values)
+    return [i for i in range(start, end) if regex.fullmatch(sorted_values[i])]
+
+
+class GenomicsIndexCache:
+    """
+    In-memory data derived from the genomics index. It is built on first use and
+    rebuilt when the genomics alias points at a new index, which is checked at
+    most every check_interval seconds.
+    """
+
+    check_interval = 60
+
+    def __init__(self):
+        self.index_name = None
+        self.checked_at = 0
+        self.lock = None
+
+    def is_fresh(self):
+        return (
+            self.index_name is not None
+            and time.monotonic() - self.checked_at < self.check_interval
+        )
+
+    async def ensure(self, handler):
+        if self.is_fresh():
+            return
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.is_fresh():
+                return
+            index_name = await handler.get_index_name()
+            if index_name != self.index_name:
+                await self.build(handler)
+                self.index_name = index_name
+            self.checked_at = time.monotonic()
+
+    async def build(self, handler):
+        raise NotImplementedError()
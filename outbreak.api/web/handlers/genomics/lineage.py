@@ -1,9 +1,7 @@
 from .base import BaseHandler
 from tornado import gen
 import pandas as pd
-from .util import create_nested_mutation_query, calculate_proportion, parse_location_id_to_query, get_total_hits
-
-import re
+from .util import create_nested_mutation_query, calculate_proportion, parse_location_id_to_query, get_total_hits, parse_mutations
 
 class LineageByCountryHandler(BaseHandler):
 
@@ -211,17 +209,8 @@ class LineageMutationsHandler(BaseHandler):
                 "lineage": query_lineage
             } for i in buckets]
             if len(flattened_response) > 0:
-                df_response = (
-                    pd.DataFrame(flattened_response)
-                    .assign(
-                        gene = lambda x: x["mutation"].apply(lambda k: self.gene_mapping[k.split(":")[0]] if k.split(":")[0] in self.gene_mapping else k.split(":")[0]),
-                        ref_aa = lambda x: x["mutation"].apply(lambda k: re.findall("[A-Za-z*]+", k.split(":")[1])[0] if "DEL" not in k and "del" not in k and "_" not in k else k).str.upper(),
-                        alt_aa = lambda x: x["mutation"].apply(lambda k: re.findall("[A-Za-z*]+", k.split(":")[1])[1] if "DEL" not in k and "del" not in k and "_" not in k else k.split(":")[1]).str.upper(),
-                        codon_num = lambda x: x["mutation"].apply(lambda k: int(re.findall("[0-9]+", k.split(":")[1])[0])),
-                        codon_end = lambda x: x["mutation"].apply(lambda k: int(re.findall("[0-9]+", k.split(":")[1])[1]) if "/" in k and ("DEL" in k or "del" in k) else None),
-                        type = lambda x: x["mutation"].apply(lambda k: "deletion" if "DEL" in k or "del" in k else "substitution")
-                    )
-                )
+                df_response = pd.DataFrame(flattened_response)
+                df_response = df_response.join(parse_mutations(df_response["mutation"], self.gene_mapping))
                 df_response = df_response[df_response["ref_aa"] != df_response["alt_aa"]]
                 df_response.loc[:, "prevalence"] = df_response["mutation_count"]/df_response["lineage_count"]
                 df_response.loc[~df_response["codon_end"].isna(), "change_length_nt"] = ((df_response["codon_end"] - df_response["codon_num"]) + 1) * 3
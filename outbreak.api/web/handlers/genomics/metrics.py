@@ -0,0 +1,131 @@
+import copy
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from biothings.web.handlers import BaseAPIHandler
+from tornado.web import RequestHandler
+
+# Upper bounds in seconds of the stage duration histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class RequestTimings:
+    """
+    Milliseconds spent in each stage of one request, in the order the stages
+    first ran, plus the ES bodies sent when slow-query logging is enabled.
+    """
+
+    def __init__(self, keep_queries=False):
+        self.stages = {}
+        self.queries = []
+        self.keep_queries = keep_queries
+
+    def add(self, name, ms):
+        self.stages[name] = self.stages.get(name, 0) + ms
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add_query(self, body, took_ms, wall_ms):
+        # "es" is wall time seen by the handler, "es_took" the time ES reports spending
+        self.add("es", wall_ms)
+        if took_ms is not None:
+            self.add("es_took", took_ms)
+        if not self.keep_queries:
+            return
+        # Copied, since paged aggregations reuse and modify their body. Cached bodies are
+        # immutable strings. Serialization waits until the request turns out to be slow.
+        self.queries.append(
+            {
+                "body": body if isinstance(body, str) else copy.deepcopy(body),
+                "took_ms": took_ms,
+                "wall_ms": round(wall_ms, 1),
+            }
+        )
+
+    def query_log(self):
+        return json.dumps(
+            [
+                dict(i, body=json.loads(i["body"]) if isinstance(i["body"], str) else i["body"])
+                for i in self.queries
+            ]
+        )
+
+    def server_timing(self):
+        return ", ".join("{};dur={:.1f}".format(k, v) for k, v in self.stages.items())
+
+
+class StageMetrics:
+    """
+    Per-process histograms of stage durations and request counts per handler,
+    rendered in the Prometheus text exposition format.
+
+    Every handler reports "es", "es_took", "serialize" and "total". Only the
+    all-lineages, prevalence-by-location and lineage-mutations v2 handlers also
+    mark "query", "flatten" and "transform", so for the others the time outside
+    ES and serialization is only visible as part of "total".
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.requests = {}
+
+    def observe(self, handler, stage, seconds):
+        key = (handler, stage)
+        if key not in self.histograms:
+            # Per-bucket counts (last one is +Inf), then the sum
+            self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram = self.histograms[key]
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def record(self, handler, status, timings, total_seconds):
+        key = (handler, str(status))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        for name, ms in timings.stages.items():
+            self.observe(handler, name, ms / 1000)
+        self.observe(handler, "total", total_seconds)
+
+    def render(self):
+        lines = [
+            "# HELP genomics_requests_total Genomics API requests by handler and status.",
+            "# TYPE genomics_requests_total counter",
+        ]
+        for (handler, status), count in sorted(self.requests.items()):
+            lines.append(
+                'genomics_requests_total{{handler="{}",status="{}"}} {}'.format(
+                    handler, status, count
+                )
+            )
+        lines.append("# HELP genomics_stage_seconds Time spent per request stage.")
+        lines.append("# TYPE genomics_stage_seconds histogram")
+        for (handler, stage), histogram in sorted(self.histograms.items()):
+            labels = 'handler="{}",stage="{}"'.format(handler, stage)
+            count = 0
+            for bound, n in zip(self.buckets + ("+Inf",), histogram[:-1]):
+                count += n
+                lines.append(
+                    'genomics_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, count)
+                )
+            lines.append("genomics_stage_seconds_sum{{{}}} {}".format(labels, histogram[-1]))
+            lines.append("genomics_stage_seconds_count{{{}}} {}".format(labels, count))
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+
+class MetricsHandler(BaseAPIHandler):
+    name = "metrics"
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        RequestHandler.write(self, stage_metrics.render())
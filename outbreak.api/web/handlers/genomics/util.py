@@ -1,8 +1,21 @@
+import asyncio
+import copy
+import functools
+import json
+import re
 from datetime import timedelta, datetime as dt
 from scipy.stats import beta
 import pandas as pd
+from .location_id import decode_location_id
 
 
+QUERY_CACHE_SIZE = 1024
+# Partitions of a composite aggregation paged at once, and pages buffered per partition
+MAX_CONCURRENT_PARTITIONS = 4
+PARTITION_QUEUE_SIZE = 2
+# gene:[ref_aa]codon_num[/codon_end][alt_aa], e.g. s:d614g, s:del69/70, orf1a:s3675/3677del
+MUTATION_PATTERN = re.compile(r"^(?P<gene>[^:_]*):(?P<change>(?P<ref_aa>[A-Za-z*]+)?(?P<codon_num>[0-9]+)(?:/(?P<codon_end>[0-9]+))?(?P<alt_aa>[A-Za-z*]+)?)$")
+
 def calculate_proportion(_x, _n):
     x = _x.round()
     n = _n.round()
@@ -10,44 +23,6 @@ def calculate_proportion(_x, _n):
     est_proportion = _x/_n
     return est_proportion, ci_low, ci_upp
 
-def compute_total_count(df, col, new_col):
-    df.loc[:,new_col] = df[col].sum()
-    return df
-
-def expand_dates(df, date_min, date_max, index_col, grp_col):
-    idx = pd.date_range(date_min, date_max)
-    df = (
-        df
-        .set_index(index_col)
-        .reindex(idx, fill_value = 0)
-        .reset_index()
-        .rename(
-            columns = {
-                "index": "date"
-            }
-        )
-    )
-    return df
-
-def compute_rolling_mean_all_lineages(df, index_col, col, new_col, grp_col):
-    idx = pd.date_range(df[index_col].min(), df[index_col].max())
-    df = (
-        df
-        .set_index(index_col)
-        .reindex(idx, fill_value = 0)
-        .assign(**{
-            new_col: lambda x: x[col].rolling("7d").mean()
-        })
-        .drop(grp_col, axis = 1)
-        .reset_index()
-        .rename(
-            columns = {
-                "index": "date"
-            }
-        )
-    )
-    return df
-
 def compute_rolling_mean(df, index_col, col, new_col):
     df = (
         df
@@ -197,42 +172,71 @@ def create_nested_mutation_query(location_id = None, lineages = [], mutations =
     parse_location_id_to_query(location_id, query_obj)
     return query_obj
 
-def classify_other_category(grp, keep_lineages): # Understood as ignores any lineages user want to keep
-    grp.loc[(~grp["lineage"].isin(keep_lineages)) | (grp["lineage"] == "none"), "lineage"] = "other" # Temporarily remove none. TODO: Proper fix
-    grp = grp.groupby("lineage").agg({
-        "total_count": lambda x: x.iloc[0],
-        "lineage_count": "sum"
-    })
-    return grp
-
-def get_major_lineage_prevalence(df, index_col = "date", min_date = None, max_date = None, keep_lineages = [], prevalence_threshold = 0.05, nday_threshold = 10, ndays = 180):
-   
-    df['prevalence'] = df['total_count']/df['lineage_count']
-    df = df.sort_values(by="date") #Sort date values
-    
+def get_major_lineage_prevalence(df, index_col = "date", min_date = None, max_date = None, keep_lineages = None, prevalence_threshold = 0.05, nday_threshold = 10, ndays = 180):
+    # Pivot flattened (date, lineage) buckets to a dense date x lineage matrix and bucket minor lineages under "other"
+    keep_lineages = keep_lineages if keep_lineages is not None else []
     if min_date and max_date:
-        df = df[(df["date"].between(min_date, max_date))]
+        df = df[(df[index_col].between(min_date, max_date))]
     elif min_date:
         date_limit = dt.strptime(min_date, "%Y-%m-%d") + timedelta(days=ndays) # searches from min_date to ndays forward
-        df = df[(df['date'] >= min_date) & (df['date'] <= date_limit)]
-    else:
-        date_limit = dt.strptime(max_date, "%Y-%m-%d") - timedelta(days=ndays) # searches from max_date to ndays back
-        df = df[(df['date'] <= max_date) & (df['date'] >= date_limit)]
-        
-    num_unique_dates = df["date"].unique().shape[0]  #counts # of unique days lineage is found
-    
+        df = df[(df[index_col] >= min_date) & (df[index_col] <= date_limit)]
+    elif len(df) > 0:
+        max_date = dt.strptime(max_date, "%Y-%m-%d") if max_date else df[index_col].max()
+        date_limit = max_date - timedelta(days=ndays) # searches from max_date (latest date by default) to ndays back
+        df = df[(df[index_col] <= max_date) & (df[index_col] >= date_limit)]
+    lineage_counts = df.set_index([index_col, "lineage"])["lineage_count"].unstack(fill_value = 0)
+    total_counts = df.drop_duplicates(index_col).set_index(index_col)["total_count"]
+    if lineage_counts.empty:
+        return lineage_counts, total_counts
+    num_unique_dates = lineage_counts.shape[0]  # counts # of unique days lineage is found
     if num_unique_dates < nday_threshold:
-        nday_threshold = round((nday_threshold/ndays) * num_unique_dates) 
-    lineage_counts = df[(df["prevalence"] >= prevalence_threshold)]["lineage"].value_counts() #number of times lineage is found in df
-    lineages_to_retain = lineage_counts[lineage_counts >= nday_threshold].index.to_list() #lineages found at least [nday_threshold] times won't be grouped
-    keep_lineages.extend(lineages_to_retain)
-    df = df.groupby(index_col).apply(classify_other_category, lineages_to_retain)
-    return df
+        nday_threshold = round((nday_threshold/ndays) * num_unique_dates)
+    prevalences = lineage_counts.div(total_counts.reindex(lineage_counts.index), axis = 0)
+    nday_counts = (prevalences >= prevalence_threshold).sum(axis = 0) # number of days lineage is above threshold
+    retain = (nday_counts >= nday_threshold) | lineage_counts.columns.isin(keep_lineages) # lineages found at least [nday_threshold] times won't be grouped
+    retain &= lineage_counts.columns != "none" # Temporarily remove none. TODO: Proper fix
+    other_counts = lineage_counts.loc[:, ~retain].sum(axis = 1)
+    lineage_counts = lineage_counts.loc[:, retain]
+    if (~retain).any():
+        lineage_counts = lineage_counts.assign(other = other_counts).sort_index(axis = 1)
+    idx = pd.date_range(lineage_counts.index.min(), lineage_counts.index.max())
+    return lineage_counts.reindex(idx, fill_value = 0), total_counts.reindex(idx, fill_value = 0)
+
+def compute_rolling_prevalence_all_lineages(lineage_counts, total_counts, window = 7):
+    # Each lineage spans its first to last observed date; rolling means only count days within the span
+    observed = lineage_counts > 0
+    started = observed.cummax()
+    span = started & observed[::-1].cummax()[::-1]
+    periods = started.cumsum().clip(upper = window)
+    lineage_count_rolling = lineage_counts.rolling(window, min_periods = 1).sum() / periods.where(started)
+    total_count_rolling = lineage_count_rolling.where(span, 0).sum(axis = 1)
+    prevalence_rolling = lineage_count_rolling.div(total_count_rolling, axis = 0).fillna(0) # Prevalence is 0 if total_count_rolling == 0.
+    total_counts = observed.mul(total_counts, axis = 0)
+    prevalences = lineage_counts.div(total_counts.where(observed), axis = 0).fillna(0)
+    lineage_idx, date_idx = span.values.T.nonzero() # Melt back ordered by lineage, then date
+    return pd.DataFrame({
+        "date": lineage_counts.index[date_idx].strftime("%Y-%m-%d"),
+        "total_count": total_counts.values.T[lineage_idx, date_idx],
+        "lineage_count": lineage_counts.values.T[lineage_idx, date_idx],
+        "lineage": lineage_counts.columns[lineage_idx],
+        "prevalence": prevalences.values.T[lineage_idx, date_idx],
+        "prevalence_rolling": prevalence_rolling.values.T[lineage_idx, date_idx]
+    })
+
+def compute_cumulative_prevalence_all_lineages(lineage_counts):
+    lineage_count = lineage_counts.sum(axis = 0)
+    total_count = lineage_count.sum()
+    return pd.DataFrame({
+        "lineage": lineage_counts.columns,
+        "total_count": total_count,
+        "lineage_count": lineage_count.values,
+        "prevalence": lineage_count.values / total_count
+    })
 
 def parse_location_id_to_query(query_id, query_obj = None):
     if query_id == None:
         return None
-    location_codes = query_id.split("_")
+    location_codes = decode_location_id(query_id)
     if query_obj == None:
         query_obj = {
             "bool": {
@@ -240,9 +244,7 @@ def parse_location_id_to_query(query_id, query_obj = None):
             }
         }
     location_types = ["country_id", "division_id", "location_id"]
-    for i in range(min(3, len(location_codes))):
-        if i == 1 and len(location_codes[i].split("-")) > 1:  # For division remove iso2 code if present
-            location_codes[i] = location_codes[i].split("-")[1]
+    for i in range(len(location_codes)):
         if "must" in query_obj["bool"]:
             query_obj["bool"]["must"].append({
                 "term": {
@@ -319,3 +321,129 @@ def create_date_range_filter(field_name, min_date=None, max_date=None):
     if min_date:
         date_range_filter["range"][field_name]["gte"] = min_date
     return date_range_filter
+
+
+def add_filter_to_query(query, filter_obj):
+    query = copy.deepcopy(query)
+    query["query"] = {
+        "bool": {
+            "filter": ([query["query"]] if query.get("query") else []) + [filter_obj]
+        }
+    }
+    return query
+
+def create_date_partitions(field_name, min_year = 2020, max_year = None):
+    # Yearly range filters covering the whole key space of a YYYY-MM-DD keyword field
+    max_year = max_year if max_year is not None else dt.today().year
+    bounds = ["{}-01-01".format(i) for i in range(min_year + 1, max_year + 1)]
+    if len(bounds) == 0:
+        return None
+    ranges = [{"lt": bounds[0]}] + [{"gte": i, "lt": j} for i, j in zip(bounds, bounds[1:])] + [{"gte": bounds[-1]}]
+    return [{"range": {field_name: i}} for i in ranges]
+
+async def page_composite_buckets(fetch, query, agg_name):
+    query = copy.deepcopy(query)
+    while True:
+        resp = await fetch(query)
+        agg = resp["aggregations"][agg_name]
+        yield agg["buckets"]
+        if "after_key" not in agg or len(agg["buckets"]) == 0:
+            break
+        query["aggs"][agg_name]["composite"]["after"] = agg["after_key"]
+
+async def iterate_composite_buckets(fetch, query, agg_name, partitions = None):
+    # Yields pages of composite aggregation buckets. With partitions (filters splitting the key space),
+    # an unpartitioned first page that isn't full is the whole result. Otherwise the composite is large,
+    # and up to MAX_CONCURRENT_PARTITIONS partitions are paged concurrently, with their pages yielded in
+    # partition order.
+    if not partitions:
+        async for page in page_composite_buckets(fetch, query, agg_name):
+            yield page
+        return
+    resp = await fetch(query)
+    first_page = resp["aggregations"][agg_name]["buckets"]
+    if len(first_page) < query["aggs"][agg_name]["composite"].get("size", 10):
+        yield first_page
+        return
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PARTITIONS)
+    async def fill_queue(partition_query, queue):
+        # Tasks start in partition order, so the partition being consumed always holds a slot
+        async with semaphore:
+            try:
+                async for page in page_composite_buckets(fetch, partition_query, agg_name):
+                    await queue.put(page)
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+    queues = [asyncio.Queue(maxsize = PARTITION_QUEUE_SIZE) for i in partitions]
+    tasks = [
+        asyncio.ensure_future(fill_queue(add_filter_to_query(query, i), j))
+        for i, j in zip(partitions, queues)
+    ]
+    try:
+        for queue in queues:
+            while True:
+                page = await queue.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def cached_query_body(builder):
+    # Memoize an ES request body builder on its normalized, hashable arguments. Bodies are cached
+    # pre-serialized, so repeated queries skip construction and JSON encoding and can't be mutated.
+    @functools.lru_cache(maxsize = QUERY_CACHE_SIZE)
+    def wrapper(*args):
+        query = builder(*args)
+        query["track_total_hits"] = True
+        return json.dumps(query)
+    return wrapper
+
+def normalize_query_terms(terms):
+    # Order-insensitive hashable key for OR-ed lineages or AND-ed mutations
+    return tuple(sorted(set(terms)))
+
+def parse_mutation(mutation, gene_mapping = {}):
+    # Row-wise parse for mutation strings that don't fit MUTATION_PATTERN
+    gene, change = mutation.split(":")[:2]
+    is_deletion = "DEL" in mutation or "del" in mutation
+    aa = re.findall("[A-Za-z*]+", change)
+    codons = re.findall("[0-9]+", change)
+    is_substitution = not is_deletion and "_" not in mutation
+    return {
+        "gene": gene_mapping.get(gene, gene),
+        "ref_aa": (aa[0] if is_substitution else mutation).upper(),
+        "alt_aa": (aa[1] if is_substitution else change).upper(),
+        "codon_num": int(codons[0]),
+        "codon_end": int(codons[1]) if "/" in mutation and is_deletion else None,
+        "type": "deletion" if is_deletion else "substitution"
+    }
+
+def parse_mutations(mutations, gene_mapping = {}):
+    # Derive gene, ref_aa, alt_aa, codon_num, codon_end and type for a Series of mutation strings in one regex pass
+    parsed = mutations.str.extract(MUTATION_PATTERN)
+    matched = parsed["change"].notna()
+    is_deletion = mutations.str.contains("DEL|del")
+    is_substitution = matched & ~is_deletion
+    df = pd.DataFrame({
+        "gene": parsed["gene"].map(gene_mapping).fillna(parsed["gene"]),
+        "ref_aa": parsed["ref_aa"].where(is_substitution, mutations).str.upper(),
+        "alt_aa": parsed["alt_aa"].where(is_substitution, parsed["change"]).str.upper(),
+        "codon_num": pd.to_numeric(parsed["codon_num"]),
+        "codon_end": pd.to_numeric(parsed["codon_end"].where(is_deletion)),
+        "type": is_deletion.map({True: "deletion", False: "substitution"})
+    }, index = mutations.index)
+    if not matched.all():
+        df = pd.concat([
+            df[matched],
+            pd.DataFrame([parse_mutation(i, gene_mapping) for i in mutations[~matched]], index = mutations.index[~matched])
+        ]).reindex(mutations.index)
+    if df["codon_num"].notna().all():
+        df["codon_num"] = df["codon_num"].astype(int)
+    if df["codon_end"].notna().all():
+        df["codon_end"] = df["codon_end"].astype(int)
+    return df
@@ -1,5 +1,7 @@
 from web.handlers.genomics.base import BaseHandler
 
+from .lineage_index import lineage_index
+
 
 class LineageHandler(BaseHandler):
 
@@ -12,17 +14,10 @@ class LineageHandler(BaseHandler):
     async def _get(self):
         query_str = self.get_argument("name", None)
         size = self.get_argument("size", None)
-        query = {
-            "size": 0,
-            "query": {"wildcard": {"pangolin_lineage": {"value": query_str}}},
-            "aggs": {"lineage": {"terms": {"field": "pangolin_lineage", "size": 10000}}},
-        }
-        resp = await self.asynchronous_fetch(query)
-        path_to_results = ["aggregations", "lineage", "buckets"]
-        buckets = resp
-        for i in path_to_results:
-            buckets = buckets[i]
-        flattened_response = [{"name": i["key"], "total_count": i["doc_count"]} for i in buckets]
+        await lineage_index.ensure(self)
+        flattened_response = [
+            {"name": name, "total_count": count} for name, count in lineage_index.search(query_str)
+        ]
         if size:
             try:
                 size = int(size)
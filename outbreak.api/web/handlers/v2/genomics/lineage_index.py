@@ -0,0 +1,49 @@
+from web.handlers.genomics.index_cache import GenomicsIndexCache, match_wildcard
+from web.handlers.genomics.util import page_composite_buckets
+
+
+class LineageIndex(GenomicsIndexCache):
+    """
+    Sorted pangolin_lineage names with sequence counts, answering wildcard
+    lineage searches by prefix bisection and glob matching in-process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.names = []
+        self.counts = []
+
+    async def build(self, handler):
+        query = {
+            "size": 0,
+            "aggs": {
+                "lineage": {
+                    "composite": {
+                        "size": 10000,
+                        "sources": [{"pangolin_lineage": {"terms": {"field": "pangolin_lineage"}}}],
+                    }
+                }
+            },
+        }
+        names = []
+        counts = []
+        async for page in page_composite_buckets(handler.asynchronous_fetch, query, "lineage"):
+            names.extend(i["key"]["pangolin_lineage"] for i in page)
+            counts.extend(i["doc_count"] for i in page)
+        # Composite buckets come back sorted by key, which is what bisection needs
+        self.names = names
+        self.counts = counts
+
+    def search(self, pattern, size=10000):
+        """
+        Lineages matching an ES wildcard pattern, ordered like a terms aggregation
+        (count descending, then name) and capped at size. Names are lowercase in
+        the index, so the pattern is matched case-insensitively like ES does.
+        """
+        pattern = pattern.lower() if pattern is not None else "*"
+        positions = match_wildcard(self.names, pattern)
+        positions = sorted(positions, key=lambda x: -self.counts[x])
+        return [(self.names[i], self.counts[i]) for i in positions[:size]]
+
+
+lineage_index = LineageIndex()
@@ -1,9 +1,125 @@
-import re
+import asyncio
+import gzip
+import json
+import os
+import time
 
 import pandas as pd
 
 from web.handlers.genomics.base import BaseHandler
-from web.handlers.genomics.util import create_nested_mutation_query, get_total_hits
+from web.handlers.genomics.index_cache import GenomicsIndexCache
+from web.handlers.genomics.util import (
+    cached_query_body,
+    create_nested_mutation_query,
+    parse_mutations,
+)
+
+# Mutation buckets per lineage group; each group's filters bucket can hold up to this many terms buckets
+MUTATION_TERMS_SIZE = 10000
+
+
+@cached_query_body
+def build_lineage_mutations_query(query_lineages):
+    # Query structure: Lineage 1 OR Lineage 2 OR Lineage 3 AND Mutation 1 AND Mutation 2, Lineage 4 AND Mutation 2, Lineage 5 ....
+    # One filters bucket per comma-separated group, so all groups are aggregated in a single search.
+    filters = {}
+    for query_lineage in query_lineages:
+        query_lineage_split = query_lineage.split(" AND ")
+        query_pangolin_lineage = query_lineage_split[0].split(
+            " OR "
+        )  # First parameter always lineages separated by commas
+        query_mutations = query_lineage_split[1:]  # First parameter is always lineage
+        filters[query_lineage] = create_nested_mutation_query(
+            lineages=query_pangolin_lineage, mutations=query_mutations
+        )
+    return {
+        "size": 0,
+        "aggs": {
+            "lineages": {
+                "filters": {"filters": filters},
+                "aggs": {
+                    "mutations": {
+                        "nested": {"path": "mutations"},
+                        "aggs": {
+                            "mutations": {
+                                "terms": {"field": "mutations.mutation", "size": MUTATION_TERMS_SIZE},
+                                "aggs": {"genomes": {"reverse_nested": {}}},
+                            }
+                        },
+                    }
+                },
+            }
+        },
+    }
+
+
+def read_lineage_mutations_table(path):
+    with gzip.open(path, "rt") as f:
+        return json.load(f)
+
+
+class LineageMutationsTable(GenomicsIndexCache):
+    """
+    Per-lineage mutation counts precomputed by bin/lineage_mutations.py. The file
+    is re-read off the IOLoop when it is replaced, and the table is only used while
+    it was built from the index the genomics alias points at. Both are checked at
+    most every check_interval seconds.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.path = None
+        self.mtime = None
+        self.table_index = None
+        self.lineages = {}
+
+    async def ensure(self, handler, path):
+        """
+        Returns True if the table can answer queries for the live genomics index.
+        """
+        if not path:
+            return False
+        if not self.is_fresh() or path != self.path:
+            if self.lock is None:
+                self.lock = asyncio.Lock()
+            async with self.lock:
+                if not self.is_fresh() or path != self.path:
+                    await self.reload(handler, path)
+        return self.table_index is not None and self.table_index == self.index_name
+
+    async def reload(self, handler, path):
+        mtime = os.stat(path).st_mtime if os.path.exists(path) else None
+        if path != self.path or mtime != self.mtime:
+            table = {"index": None, "lineages": {}}
+            if mtime is not None:
+                table = await asyncio.get_running_loop().run_in_executor(
+                    None, read_lineage_mutations_table, path
+                )
+            self.table_index = table["index"]
+            self.lineages = table["lineages"]
+            self.path = path
+            self.mtime = mtime
+        self.index_name = await handler.get_index_name()
+        self.checked_at = time.monotonic()
+
+    def get_buckets(self, lineages):
+        # Lineages are disjoint, so counts for "A OR B" are the sums of per-lineage counts.
+        # Table keys are lowercase, like the normalized pangolin_lineage values. Returns None
+        # unless every lineage is a key, so wildcards and unknown names are left to ES.
+        lineages = [i.lower() for i in lineages]
+        if not all(i in self.lineages for i in lineages):
+            return None
+        lineage_count = 0
+        mutations = {}
+        for lineage in lineages:
+            lineage_count += self.lineages[lineage]["lineage_count"]
+            for mutation, count in self.lineages[lineage]["mutations"].items():
+                mutations[mutation] = mutations.get(mutation, 0) + count
+        # Same order as the terms aggregation: doc_count descending, then key
+        return lineage_count, sorted(mutations.items(), key=lambda x: (-x[1], x[0]))
+
+
+lineage_mutations_table = LineageMutationsTable()
 
 
 class LineageMutationsHandler(BaseHandler):
@@ -38,92 +154,76 @@ class LineageMutationsHandler(BaseHandler):
             genes = gene.lower().split(",")
         else:
             genes = []
-        dict_response = {}
-        # Query structure: Lineage 1 OR Lineage 2 OR Lineage 3 AND Mutation 1 AND Mutation 2, Lineage 4 AND Mutation 2, Lineage 5 ....
-        for query_lineage in pangolin_lineage.split(","):
-            query = {
-                "size": 0,
-                "query": {},
-                "aggs": {
-                    "mutations": {
-                        "nested": {"path": "mutations"},
-                        "aggs": {
-                            "mutations": {
-                                "terms": {"field": "mutations.mutation", "size": 10000},
-                                "aggs": {"genomes": {"reverse_nested": {}}},
-                            }
-                        },
+        query_lineages = list(dict.fromkeys(pangolin_lineage.split(",")))
+        flattened_response = []
+        es_lineages = query_lineages
+        if await lineage_mutations_table.ensure(
+            self, self.biothings.config.genomics.LINEAGE_MUTATIONS_TABLE
+        ):
+            # Groups with mutation filters, or that the table can't resolve exactly, are sent to ES
+            es_lineages = []
+            for query_lineage in query_lineages:
+                buckets = None
+                if " AND " not in query_lineage:
+                    buckets = lineage_mutations_table.get_buckets(query_lineage.split(" OR "))
+                if buckets is None:
+                    es_lineages.append(query_lineage)
+                    continue
+                lineage_count, mutations = buckets
+                flattened_response.extend(
+                    {
+                        "mutation": mutation,
+                        "mutation_count": mutation_count,
+                        "lineage_count": lineage_count,
+                        "lineage": query_lineage,
                     }
-                },
-            }
-            query_lineage_split = query_lineage.split(" AND ")
-            query_mutations = []
-            query_pangolin_lineage = query_lineage_split[0].split(
-                " OR "
-            )  # First parameter always lineages separated by commas
-            if len(query_lineage_split) > 1:
-                query_mutations = query_lineage_split[1:]  # First parameter is always lineage
-            query["query"] = create_nested_mutation_query(
-                lineages=query_pangolin_lineage, mutations=query_mutations
-            )
-            # print(query)
-            resp = await self.asynchronous_fetch(query)
-            path_to_results = ["aggregations", "mutations", "mutations", "buckets"]
-            buckets = resp
-            for i in path_to_results:
-                buckets = buckets[i]
-            flattened_response = [
-                {
-                    "mutation": i["key"],
-                    "mutation_count": i["genomes"]["doc_count"],
-                    "lineage_count": get_total_hits(resp),
-                    "lineage": query_lineage,
-                }
-                for i in buckets
-            ]
-            if len(flattened_response) > 0:
-                df_response = pd.DataFrame(flattened_response).assign(
-                    gene=lambda x: x["mutation"].apply(
-                        lambda k: self.gene_mapping[k.split(":")[0]]
-                        if k.split(":")[0] in self.gene_mapping
-                        else k.split(":")[0]
-                    ),
-                    ref_aa=lambda x: x["mutation"]
-                    .apply(
-                        lambda k: re.findall("[A-Za-z*]+", k.split(":")[1])[0]
-                        if "DEL" not in k and "del" not in k and "_" not in k
-                        else k
-                    )
-                    .str.upper(),
-                    alt_aa=lambda x: x["mutation"]
-                    .apply(
-                        lambda k: re.findall("[A-Za-z*]+", k.split(":")[1])[1]
-                        if "DEL" not in k and "del" not in k and "_" not in k
-                        else k.split(":")[1]
-                    )
-                    .str.upper(),
-                    codon_num=lambda x: x["mutation"].apply(
-                        lambda k: int(re.findall("[0-9]+", k.split(":")[1])[0])
-                    ),
-                    codon_end=lambda x: x["mutation"].apply(
-                        lambda k: int(re.findall("[0-9]+", k.split(":")[1])[1])
-                        if "/" in k and ("DEL" in k or "del" in k)
-                        else None
-                    ),
-                    type=lambda x: x["mutation"].apply(
-                        lambda k: "deletion" if "DEL" in k or "del" in k else "substitution"
-                    ),
+                    for mutation, mutation_count in mutations
                 )
-                df_response = df_response[df_response["ref_aa"] != df_response["alt_aa"]]
-                df_response.loc[:, "prevalence"] = (
-                    df_response["mutation_count"] / df_response["lineage_count"]
+        # Each lineage group adds one filters bucket and up to MUTATION_TERMS_SIZE terms buckets,
+        # so batch as many groups per search as fit under ES search.max_buckets
+        groups_per_query = max(
+            1, self.biothings.config.genomics.ES_MAX_BUCKETS // (MUTATION_TERMS_SIZE + 1)
+        )
+        for start in range(0, len(es_lineages), groups_per_query):
+            with self.timings.stage("query"):
+                query = build_lineage_mutations_query(
+                    tuple(es_lineages[start : start + groups_per_query])
                 )
-                df_response.loc[~df_response["codon_end"].isna(), "change_length_nt"] = (
-                    (df_response["codon_end"] - df_response["codon_num"]) + 1
-                ) * 3
-                df_response = df_response[df_response["prevalence"] >= frequency].fillna("None")
-                if genes:
-                    df_response = df_response[df_response["gene"].str.lower().isin(genes)]
-                dict_response[query_lineage] = df_response.to_dict(orient="records")
+            resp = await self.asynchronous_fetch(query)
+            with self.timings.stage("flatten"):
+                for query_lineage, bucket in resp["aggregations"]["lineages"]["buckets"].items():
+                    flattened_response.extend(
+                        {
+                            "mutation": i["key"],
+                            "mutation_count": i["genomes"]["doc_count"],
+                            "lineage_count": bucket["doc_count"],
+                            "lineage": query_lineage,
+                        }
+                        for i in bucket["mutations"]["mutations"]["buckets"]
+                    )
+        if len(flattened_response) == 0:
+            return {"success": True, "results": {}}
+        with self.timings.stage("transform"):
+            df_response = pd.DataFrame(flattened_response)
+            df_response = df_response.join(
+                parse_mutations(df_response["mutation"], self.gene_mapping)
+            )
+            df_response = df_response[df_response["ref_aa"] != df_response["alt_aa"]]
+            df_response.loc[:, "prevalence"] = (
+                df_response["mutation_count"] / df_response["lineage_count"]
+            )
+            df_response.loc[~df_response["codon_end"].isna(), "change_length_nt"] = (
+                (df_response["codon_end"] - df_response["codon_num"]) + 1
+            ) * 3
+            df_response = df_response[df_response["prevalence"] >= frequency].fillna("None")
+            if genes:
+                df_response = df_response[df_response["gene"].str.lower().isin(genes)]
+            observed = set(i["lineage"] for i in flattened_response)
+            groups = {i: grp for i, grp in df_response.groupby("lineage", sort=False)}
+            dict_response = {
+                i: groups[i].to_dict(orient="records") if i in groups else []
+                for i in query_lineages
+                if i in observed
+            }
         resp = {"success": True, "results": dict_response}
         return resp
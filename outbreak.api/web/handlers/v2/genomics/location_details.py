@@ -1,5 +1,6 @@
 from web.handlers.genomics.base import BaseHandler
-from web.handlers.genomics.util import parse_location_id_to_query
+
+from .location_index import location_index
 
 
 class LocationDetailsHandler(BaseHandler):
@@ -12,33 +13,11 @@ class LocationDetailsHandler(BaseHandler):
     async def _get(self):
         query_str = self.args.id
         query_ids = query_str.split("_")
-        query = {"query": {}, "aggs": {"loc": {"composite": {"size": 10000, "sources": []}}}}
         loc_id_len = len(query_ids)
-        if loc_id_len >= 1:
-            query["aggs"]["loc"]["composite"]["sources"].extend(
-                [
-                    {"country": {"terms": {"field": "country"}}},
-                    {"country_id": {"terms": {"field": "country_id"}}},
-                ]
-            )
-        if loc_id_len >= 2:  # 3 is max length
-            query["aggs"]["loc"]["composite"]["sources"].extend(
-                [
-                    {"division": {"terms": {"field": "division"}}},
-                    {"division_id": {"terms": {"field": "division_id"}}},
-                ]
-            )
-        if loc_id_len == 3:  # 3 is max length
-            query["aggs"]["loc"]["composite"]["sources"].extend(
-                [
-                    {"location": {"terms": {"field": "location"}}},
-                    {"location_id": {"terms": {"field": "location_id"}}},
-                ]
-            )
-        query["query"] = parse_location_id_to_query(query_str)
-        resp = await self.asynchronous_fetch(query)
+        await location_index.ensure(self)
+        buckets = location_index.lookup(query_str)
         flattened_response = []
-        for rec in resp["aggregations"]["loc"]["buckets"]:
+        for rec in buckets:
             if loc_id_len == 1:
                 flattened_response.append(
                     {
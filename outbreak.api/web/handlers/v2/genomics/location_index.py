@@ -0,0 +1,105 @@
+from web.handlers.genomics.index_cache import GenomicsIndexCache, match_wildcard
+from web.handlers.genomics.location_id import LOCATION_ID_FIELDS, decode_location_id
+from web.handlers.genomics.util import page_composite_buckets
+
+# Composite sources per admin level, in the order LocationHandler expects its buckets
+LOCATION_SOURCES = {
+    "country": ["country", "country_id"],
+    "division": ["division", "division_id", "country", "country_id"],
+    "location": ["location", "location_id", "country", "country_id", "division", "division_id"],
+}
+# Composite key order of location-lookup, which returns the first matching bucket
+LOOKUP_SOURCES = {
+    "country": ["country", "country_id"],
+    "division": ["country", "country_id", "division", "division_id"],
+    "location": ["country", "country_id", "division", "division_id", "location", "location_id"],
+}
+
+
+class LocationIndex(GenomicsIndexCache):
+    """
+    Location names, IDs and sequence counts for every admin level, serving the
+    location search box and location-lookup without querying ES per keystroke.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = {}
+        self.lower_names = {}
+        self.lower_positions = {}
+        self.by_id = {}
+
+    async def fetch_buckets(self, handler, loc):
+        # {loc}_lower is the field the wildcard search runs on, so it is kept as the last source
+        sources = LOCATION_SOURCES[loc] + ["{}_lower".format(loc)]
+        query = {
+            "size": 0,
+            "aggs": {
+                "loc_agg": {
+                    "composite": {
+                        "size": 10000,
+                        "sources": [{i: {"terms": {"field": i}}} for i in sources],
+                    }
+                }
+            },
+        }
+        buckets = []
+        async for page in page_composite_buckets(handler.asynchronous_fetch, query, "loc_agg"):
+            buckets.extend(page)
+        return buckets
+
+    async def build(self, handler):
+        buckets = {}
+        lower_names = {}
+        lower_positions = {}
+        by_id = {}
+        for level, loc in enumerate(LOCATION_SOURCES):
+            buckets[loc] = await self.fetch_buckets(handler, loc)
+            order = sorted(
+                range(len(buckets[loc])),
+                key=lambda x: buckets[loc][x]["key"]["{}_lower".format(loc)],
+            )
+            lower_names[loc] = [buckets[loc][i]["key"]["{}_lower".format(loc)] for i in order]
+            lower_positions[loc] = order
+            for rec in buckets[loc]:
+                location_id = tuple(rec["key"][i] for i in LOCATION_ID_FIELDS[: level + 1])
+                by_id.setdefault(location_id, []).append(rec)
+        self.buckets = buckets
+        self.lower_names = lower_names
+        self.lower_positions = lower_positions
+        self.by_id = by_id
+
+    def merge_buckets(self, records, sources):
+        # Drop the {loc}_lower source and sum counts, as the composite aggregation would without it
+        merged = {}
+        for rec in records:
+            key = tuple(rec["key"][i] for i in sources)
+            if key in merged:
+                merged[key]["doc_count"] += rec["doc_count"]
+            else:
+                merged[key] = {"key": dict(zip(sources, key)), "doc_count": rec["doc_count"]}
+        return list(merged.values())
+
+    def search(self, loc, pattern):
+        """
+        Buckets of an admin level whose {loc}_lower matches an ES wildcard pattern,
+        in the same order and with the same counts as the composite aggregation.
+        """
+        positions = sorted(
+            self.lower_positions[loc][i]
+            for i in match_wildcard(self.lower_names[loc], pattern if pattern is not None else "*")
+        )
+        return self.merge_buckets([self.buckets[loc][i] for i in positions], LOCATION_SOURCES[loc])
+
+    def lookup(self, query_id):
+        """
+        Buckets matching a location ID (ISO3[_ISO2-DIV[_LOC]]) in location-lookup order.
+        """
+        location_codes = decode_location_id(query_id)
+        loc = list(LOCATION_SOURCES)[len(location_codes) - 1]
+        sources = LOOKUP_SOURCES[loc]
+        records = self.merge_buckets(self.by_id.get(location_codes, []), sources)
+        return sorted(records, key=lambda x: tuple(x["key"][i] for i in sources))
+
+
+location_index = LocationIndex()
@@ -1,7 +1,24 @@
 import pandas as pd
 
 from web.handlers.genomics.base import BaseHandler
-from web.handlers.genomics.util import create_nested_mutation_query
+from web.handlers.genomics.util import (
+    cached_query_body,
+    create_nested_mutation_query,
+    normalize_query_terms,
+)
+
+
+@cached_query_body
+def build_most_recent_date_query(field, lineages, mutations, location_id):
+    query = {
+        "size": 0,
+        "query": {},
+        "aggs": {"date_collected": {"terms": {"field": field, "size": 10000}}},
+    }
+    query["query"] = create_nested_mutation_query(
+        lineages=list(lineages), mutations=list(mutations), location_id=location_id
+    )
+    return query
 
 
 class MostRecentDateHandler(BaseHandler):
@@ -19,18 +36,15 @@ class MostRecentDateHandler(BaseHandler):
         query_location = self.args.location_id
         query_mutations = self.args.mutations
         query_mutations = query_mutations.split(",") if query_mutations is not None else []
-        query = {
-            "size": 0,
-            "query": {},
-            "aggs": {"date_collected": {"terms": {"field": self.field, "size": 10000}}},
-        }
         query_pangolin_lineage = (
             query_pangolin_lineage.split(",") if query_pangolin_lineage is not None else []
         )
-        query_obj = create_nested_mutation_query(
-            lineages=query_pangolin_lineage, mutations=query_mutations, location_id=query_location
+        query = build_most_recent_date_query(
+            self.field,
+            normalize_query_terms(query_pangolin_lineage),
+            normalize_query_terms(query_mutations),
+            query_location,
         )
-        query["query"] = query_obj
         resp = await self.asynchronous_fetch(query)
         # print(resp)
         path_to_results = ["aggregations", "date_collected", "buckets"]
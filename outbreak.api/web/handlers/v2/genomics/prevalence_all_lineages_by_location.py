@@ -4,16 +4,35 @@ import pandas as pd
 
 from web.handlers.genomics.base import BaseHandler
 from web.handlers.genomics.util import (
-    compute_rolling_mean_all_lineages,
-    compute_total_count,
+    cached_query_body,
+    compute_cumulative_prevalence_all_lineages,
+    compute_rolling_prevalence_all_lineages,
     create_date_range_filter,
-    expand_dates,
     get_major_lineage_prevalence,
     parse_location_id_to_query,
     parse_time_window_to_query,
 )
 
 
+@cached_query_body
+def build_all_lineages_query(location_id, min_date, max_date, size):
+    query = {
+        "size": 0,
+        "aggs": {
+            "count": {
+                "terms": {"field": "date_collected", "size": size},
+                "aggs": {"lineage_count": {"terms": {"field": "pangolin_lineage", "size": size}}},
+            }
+        },
+    }
+    query_obj = parse_location_id_to_query(location_id)
+    date_range_filter = create_date_range_filter("date_collected", min_date, max_date)
+    query_obj = parse_time_window_to_query(date_range_filter, query_obj=query_obj)
+    if query_obj:
+        query["query"] = query_obj
+    return query
+
+
 class PrevalenceAllLineagesByLocationHandler(BaseHandler):
     # size = 100  # If size=1000 it will raise too_many_buckets_exception in case missing location_id in query.
     name = "prevalence-by-location-all-lineages"
@@ -41,125 +60,60 @@ class PrevalenceAllLineagesByLocationHandler(BaseHandler):
             query_other_exclude.split(",") if query_other_exclude is not None else []
         )
         query_cumulative = self.args.cumulative
-        query = {
-            "size": 0,
-            "aggs": {
-                "count": {
-                    "terms": {"field": "date_collected", "size": self.size},
-                    "aggs": {
-                        "lineage_count": {"terms": {"field": "pangolin_lineage", "size": self.size}}
-                    },
-                }
-            },
-        }
-        query_obj = parse_location_id_to_query(query_location)
-        date_range_filter = create_date_range_filter(
-            "date_collected", self.args.min_date, self.args.max_date
-        )
-        query_obj = parse_time_window_to_query(date_range_filter, query_obj=query_obj)
-        if query_obj:
-            query["query"] = query_obj
-        # import json
-        # print(json.dumps(query))
+        with self.timings.stage("query"):
+            query = build_all_lineages_query(
+                query_location, self.args.min_date, self.args.max_date, self.size
+            )
         resp = await self.asynchronous_fetch(query)
-        buckets = resp
-        path_to_results = ["aggregations", "count", "buckets"]
-        for i in path_to_results:
-            buckets = buckets[i]
-        flattened_response = []
-        for i in buckets:
-            if len(i["key"].split("-")) == 1 or "XX" in i["key"]:
-                continue
-            for j in i["lineage_count"]["buckets"]:
-                flattened_response.append(
-                    {
-                        "date": i["key"],
-                        "total_count": i["doc_count"],
-                        "lineage_count": j["doc_count"],
-                        "lineage": j["key"],
-                    }
-                )
+        with self.timings.stage("flatten"):
+            buckets = resp
+            path_to_results = ["aggregations", "count", "buckets"]
+            for i in path_to_results:
+                buckets = buckets[i]
+            flattened_response = []
+            for i in buckets:
+                if len(i["key"].split("-")) == 1 or "XX" in i["key"]:
+                    continue
+                for j in i["lineage_count"]["buckets"]:
+                    flattened_response.append(
+                        {
+                            "date": i["key"],
+                            "total_count": i["doc_count"],
+                            "lineage_count": j["doc_count"],
+                            "lineage": j["key"],
+                        }
+                    )
         if not flattened_response:
             return {"success": True, "results": []}
-        df_response = (
-            pd.DataFrame(flattened_response)
-            .assign(
-                date=lambda x: pd.to_datetime(x["date"], format="%Y-%m-%d"),
-                prevalence=lambda x: x["lineage_count"] / x["total_count"],
-            )
-            .sort_values("date")
-        )
-        if (
-            query_window is not None and not date_range_filter
-        ):  # discard query_window if either max_date or min_date exists
-            df_response = df_response[
-                df_response["date"] >= (dt.now() - timedelta(days=query_window))
-            ]
-        df_response = get_major_lineage_prevalence(
-            df_response,
-            "date",
-            query_other_exclude,
-            query_other_threshold,
-            query_nday_threshold,
-            query_ndays,
-        )
-        if not query_cumulative:
+        with self.timings.stage("transform"):
             df_response = (
-                df_response.groupby("lineage", group_keys=True)
-                .apply(
-                    compute_rolling_mean_all_lineages,
-                    "date",
-                    "lineage_count",
-                    "lineage_count_rolling",
-                    "lineage",
+                pd.DataFrame(flattened_response)
+                .assign(
+                    date=lambda x: pd.to_datetime(x["date"], format="%Y-%m-%d"),
+                    prevalence=lambda x: x["lineage_count"] / x["total_count"],
                 )
-                .reset_index()
+                .sort_values("date")
             )
-            df_response = df_response.groupby("date").apply(
-                compute_total_count, "lineage_count_rolling", "total_count_rolling"
-            )
-            df_response.loc[:, "prevalence_rolling"] = (
-                df_response["lineage_count_rolling"] / df_response["total_count_rolling"]
-            )
-            df_response.loc[
-                df_response["prevalence_rolling"].isna(), "prevalence_rolling"
-            ] = 0  # Prevalence is 0 if total_count_rolling == 0.
-            df_response.loc[:, "date"] = df_response["date"].apply(lambda x: x.strftime("%Y-%m-%d"))
-            df_response = df_response.fillna("None")
-            df_response = df_response[
-                [
-                    "date",
-                    "total_count",
-                    "lineage_count",
-                    "lineage",
-                    "prevalence",
-                    "prevalence_rolling",
+            # discard query_window if either max_date or min_date exists
+            if query_window is not None and not self.args.min_date and not self.args.max_date:
+                df_response = df_response[
+                    df_response["date"] >= (dt.now() - timedelta(days=query_window))
                 ]
-            ]
-        else:
-            df_response = (
-                df_response.groupby("lineage")
-                .apply(
-                    expand_dates,
-                    df_response["date"].min(),
-                    df_response["date"].max(),
-                    "date",
-                    "lineage",
-                )
-                .reset_index()
-            )
-            df_response = (
-                df_response.groupby("date")
-                .apply(compute_total_count, "lineage_count", "total_count")
-                .reset_index()
-            )
-            df_response = (
-                df_response.groupby("lineage")
-                .agg({"total_count": "sum", "lineage_count": "sum"})
-                .reset_index()
-            )
-            df_response.loc[:, "prevalence"] = (
-                df_response["lineage_count"] / df_response["total_count"]
+            lineage_counts, total_counts = get_major_lineage_prevalence(
+                df_response,
+                "date",
+                min_date=self.args.min_date,
+                max_date=self.args.max_date,
+                keep_lineages=query_other_exclude,
+                prevalence_threshold=query_other_threshold,
+                nday_threshold=query_nday_threshold,
+                ndays=query_ndays,
             )
-        resp = {"success": True, "results": df_response.to_dict(orient="records")}
+            if lineage_counts.empty:
+                return {"success": True, "results": []}
+            if not query_cumulative:
+                df_response = compute_rolling_prevalence_all_lineages(lineage_counts, total_counts)
+            else:
+                df_response = compute_cumulative_prevalence_all_lineages(lineage_counts)
+        resp = {"success": True, "results": df_response}
         return resp
@@ -1,7 +1,10 @@
 import pandas as pd
 
 from web.handlers.genomics.base import BaseHandler
-from web.handlers.genomics.util import compute_rolling_mean, parse_location_id_to_query
+from web.handlers.genomics.util import parse_location_id_to_query
+
+# ref_aa per (gene, codon_num) is fixed by the reference genome, so it is kept for the process
+ref_aa_cache = {}
 
 
 class PrevalenceByAAPositionHandler(BaseHandler):
@@ -31,115 +34,115 @@ class PrevalenceByAAPositionHandler(BaseHandler):
         query_aa_position = self.args.position
         if query_aa_position is None:
             query_aa_position = int(query_str.split(":")[1])
-        # Get ref codon
+        position_filter = {
+            "bool": {
+                "must": [
+                    {"match": {"mutations.codon_num": query_aa_position}},
+                    {"match": {"mutations.gene": query_gene}},
+                ]
+            }
+        }
         query = {
             "size": 0,
             "aggs": {
-                "by_mutations": {
-                    "nested": {"path": "mutations"},
+                "by_date": {
+                    "terms": {"field": "date_collected", "size": self.size},
                     "aggs": {
-                        "inner": {
-                            "filter": {
-                                "bool": {
-                                    "must": [
-                                        {"match": {"mutations.codon_num": query_aa_position}},
-                                        {"match": {"mutations.gene": query_gene}},
-                                    ]
+                        "by_mutations": {
+                            "nested": {"path": "mutations"},
+                            "aggs": {
+                                "inner": {
+                                    "filter": position_filter,
+                                    "aggs": {"by_name": {"terms": {"field": "mutations.alt_aa"}}},
                                 }
                             },
-                            "aggs": {"by_nested": {"top_hits": {"size": 1}}},
                         }
                     },
                 }
             },
         }
-        resp = await self.asynchronous_fetch(query)
-        tmp_ref = resp["aggregations"]["by_mutations"]["inner"]["by_nested"]["hits"]["hits"]
-        dict_response = []
-        if len(tmp_ref) > 0:
-            ref_aa = tmp_ref[0]["_source"]["ref_aa"]
-            query = {
+        ref_aa = ref_aa_cache.get((query_gene, query_aa_position))
+        if ref_aa is None:
+            # Look up the ref codon across all genomes in the same round trip
+            query["aggs"]["ref"] = {
+                "global": {},
                 "aggs": {
-                    "by_date": {
-                        "terms": {"field": "date_collected", "size": self.size},
+                    "by_mutations": {
+                        "nested": {"path": "mutations"},
                         "aggs": {
-                            "by_mutations": {
-                                "nested": {"path": "mutations"},
-                                "aggs": {
-                                    "inner": {
-                                        "filter": {
-                                            "bool": {
-                                                "must": [
-                                                    {
-                                                        "match": {
-                                                            "mutations.codon_num": query_aa_position
-                                                        }
-                                                    },
-                                                    {"match": {"mutations.gene": query_gene}},
-                                                ]
-                                            }
-                                        },
-                                        "aggs": {
-                                            "by_name": {"terms": {"field": "mutations.alt_aa"}}
-                                        },
-                                    }
-                                },
+                            "inner": {
+                                "filter": position_filter,
+                                "aggs": {"by_nested": {"top_hits": {"size": 1}}},
                             }
                         },
                     }
-                }
+                },
             }
-            if query_location is not None:
-                query["query"] = parse_location_id_to_query(
-                    query_location, query["aggs"]["prevalence"]["filter"]
-                )
-            if query_lineage is not None:
-                if "query" in query:
-                    query["query"]["bool"]["must"].append(
-                        {"term": {"pangolin_lineage": query_lineage}}
-                    )
-                else:
-                    query["query"] = {"term": {"pangolin_lineage": query_lineage}}
-            resp = await self.asynchronous_fetch(query)
-            buckets = resp
-            path_to_results = ["aggregations", "by_date", "buckets"]
-            for i in path_to_results:
-                buckets = buckets[i]
-            flattened_response = []
-            for d in buckets:
-                alt_count = 0
-                for m in d["by_mutations"]["inner"]["by_name"]["buckets"]:
-                    if m["key"] == "None":
-                        continue
-                    flattened_response.append(
-                        {
-                            "date": d["key"],
-                            "total_count": d["doc_count"],
-                            "aa": m["key"],
-                            "aa_count": m["doc_count"],
-                        }
-                    )
-                    alt_count += m["doc_count"]
+        query_obj = parse_location_id_to_query(query_location)
+        if query_lineage is not None:
+            lineage_filter = {"term": {"pangolin_lineage": query_lineage}}
+            if query_obj is not None:
+                query_obj["bool"]["must"].append(lineage_filter)
+            else:
+                query_obj = lineage_filter
+        if query_obj is not None:
+            query["query"] = query_obj
+        resp = await self.asynchronous_fetch(query)
+        if ref_aa is None:
+            tmp_ref = resp["aggregations"]["ref"]["by_mutations"]["inner"]["by_nested"]["hits"][
+                "hits"
+            ]
+            if len(tmp_ref) == 0:
+                return {"success": True, "results": []}
+            ref_aa = tmp_ref[0]["_source"]["ref_aa"]
+            ref_aa_cache[(query_gene, query_aa_position)] = ref_aa
+        buckets = resp
+        path_to_results = ["aggregations", "by_date", "buckets"]
+        for i in path_to_results:
+            buckets = buckets[i]
+        flattened_response = []
+        for d in buckets:
+            if len(d["key"].split("-")) == 1 or "XX" in d["key"]:
+                continue
+            alt_count = 0
+            for m in d["by_mutations"]["inner"]["by_name"]["buckets"]:
+                if m["key"] == "None" or m["key"] == ref_aa:
+                    continue
                 flattened_response.append(
                     {
                         "date": d["key"],
                         "total_count": d["doc_count"],
-                        "aa": ref_aa,
-                        "aa_count": d["doc_count"] - alt_count,
+                        "aa": m["key"],
+                        "aa_count": m["doc_count"],
                     }
                 )
-            df_response = (
-                pd.DataFrame(flattened_response)
-                .assign(
-                    date=lambda x: pd.to_datetime(x["date"], format="%Y-%m-%d"),
-                    prevalence=lambda x: x["aa_count"] / x["total_count"],
-                )
-                .sort_values("date")
-            )
-            df_response = df_response.groupby("aa").apply(
-                compute_rolling_mean, "date", "prevalence", "prevalence_rolling"
+                alt_count += m["doc_count"]
+            flattened_response.append(
+                {
+                    "date": d["key"],
+                    "total_count": d["doc_count"],
+                    "aa": ref_aa,
+                    "aa_count": d["doc_count"] - alt_count,
+                }
             )
-            df_response.loc[:, "date"] = df_response["date"].apply(lambda x: x.strftime("%Y-%m-%d"))
-            dict_response = df_response.to_dict(orient="records")
-        resp = {"success": True, "results": dict_response}
+        if len(flattened_response) == 0:
+            return {"success": True, "results": []}
+        df_response = pd.DataFrame(flattened_response).assign(
+            date=lambda x: pd.to_datetime(x["date"], format="%Y-%m-%d"),
+            prevalence=lambda x: x["aa_count"] / x["total_count"],
+        )
+        # 7-day rolling mean per aa over the dates it was observed on
+        prevalence_rolling = (
+            df_response.pivot(index="date", columns="aa", values="prevalence")
+            .sort_index()
+            .rolling("7d")
+            .mean()
+            .stack()
+        )
+        df_response["prevalence_rolling"] = prevalence_rolling.reindex(
+            pd.MultiIndex.from_frame(df_response[["date", "aa"]])
+        ).to_numpy()
+        df_response = df_response.sort_values(["aa", "date"], kind="mergesort")
+        df_response["date"] = df_response["date"].dt.strftime("%Y-%m-%d")
+        resp = {"success": True, "results": df_response.to_dict(orient="records")}
         return resp
@@ -1,12 +1,44 @@
 from web.handlers.genomics.base import BaseHandler
 from web.handlers.genomics.util import (
+    cached_query_body,
     create_iterator,
     create_nested_mutation_query,
+    normalize_query_terms,
     parse_location_id_to_query,
     transform_prevalence,
 )
 
 
+@cached_query_body
+def build_prevalence_query(location_id, lineages, mutations, min_date, max_date, size):
+    query = {
+        "size": 0,
+        "aggs": {
+            "prevalence": {
+                "filter": {"bool": {"must": []}},
+                "aggs": {
+                    "count": {
+                        "terms": {"field": "date_collected", "size": size},
+                        "aggs": {"lineage_count": {"filter": {}}},
+                    }
+                },
+            }
+        },
+    }
+    if max_date or min_date:
+        query["query"] = {"range": {"date_collected": {}}}
+        if max_date:
+            query["query"]["range"]["date_collected"]["lte"] = max_date
+        if min_date:
+            query["query"]["range"]["date_collected"]["gte"] = min_date
+    parse_location_id_to_query(location_id, query["aggs"]["prevalence"]["filter"])
+    query_obj = create_nested_mutation_query(
+        lineages=list(lineages), mutations=list(mutations), location_id=location_id
+    )
+    query["aggs"]["prevalence"]["aggs"]["count"]["aggs"]["lineage_count"]["filter"] = query_obj
+    return query
+
+
 class PrevalenceByLocationAndTimeHandler(BaseHandler):
     name = "prevalence-by-location"
     kwargs = dict(BaseHandler.kwargs)
@@ -28,43 +60,22 @@ class PrevalenceByLocationAndTimeHandler(BaseHandler):
         query_mutations = self.args.mutations
         query_mutations = query_mutations.split(" AND ") if query_mutations is not None else []
         cumulative = self.args.cumulative
-        date_range_filter = {"query": {"range": {"date_collected": {}}}}
-        if self.args.max_date:
-            date_range_filter["query"]["range"]["date_collected"]["lte"] = self.args.max_date
-        if self.args.min_date:
-            date_range_filter["query"]["range"]["date_collected"]["gte"] = self.args.min_date
-
         results = {}
         for i, j in create_iterator(query_pangolin_lineage, query_mutations):
-            query = {
-                "size": 0,
-                "aggs": {
-                    "prevalence": {
-                        "filter": {"bool": {"must": []}},
-                        "aggs": {
-                            "count": {
-                                "terms": {"field": "date_collected", "size": self.size},
-                                "aggs": {"lineage_count": {"filter": {}}},
-                            }
-                        },
-                    }
-                },
-            }
-            if self.args.max_date or self.args.min_date:
-                query.update(date_range_filter)
-            parse_location_id_to_query(query_location, query["aggs"]["prevalence"]["filter"])
             lineages = i.split(" OR ") if i is not None else []
-            query_obj = create_nested_mutation_query(
-                lineages=lineages, mutations=j, location_id=query_location
-            )
-            query["aggs"]["prevalence"]["aggs"]["count"]["aggs"]["lineage_count"][
-                "filter"
-            ] = query_obj
-            # import json
-            # print(json.dumps(query))
+            with self.timings.stage("query"):
+                query = build_prevalence_query(
+                    query_location,
+                    normalize_query_terms(lineages),
+                    normalize_query_terms(j),
+                    self.args.min_date,
+                    self.args.max_date,
+                    self.size,
+                )
             resp = await self.asynchronous_fetch(query)
             path_to_results = ["aggregations", "prevalence", "count", "buckets"]
-            resp = transform_prevalence(resp, path_to_results, cumulative)
+            with self.timings.stage("transform"):
+                resp = transform_prevalence(resp, path_to_results, cumulative)
             res_key = None
             if len(query_pangolin_lineage) > 0:
                 res_key = " OR ".join(lineages)
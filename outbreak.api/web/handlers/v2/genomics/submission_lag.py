@@ -1,5 +1,11 @@
+import pandas as pd
+
 from web.handlers.genomics.base import BaseHandler
-from web.handlers.genomics.util import parse_location_id_to_query
+from web.handlers.genomics.util import (
+    create_date_partitions,
+    iterate_composite_buckets,
+    parse_location_id_to_query,
+)
 
 
 class SubmissionLagHandler(BaseHandler):
@@ -26,24 +32,23 @@ class SubmissionLagHandler(BaseHandler):
         }
         if query_location is not None:
             query["query"] = parse_location_id_to_query(query_location)
-        resp = await self.asynchronous_fetch(query)
-        path_to_results = ["aggregations", "date_collected_submitted_buckets", "buckets"]
-        buckets = resp
-        for i in path_to_results:
-            buckets = buckets[i]
-        while "after_key" in resp["aggregations"]["date_collected_submitted_buckets"]:
-            query["aggs"]["date_collected_submitted_buckets"]["composite"]["after"] = resp[
-                "aggregations"
-            ]["date_collected_submitted_buckets"]["after_key"]
-            resp = await self.asynchronous_fetch(query)
-            buckets.extend(resp["aggregations"]["date_collected_submitted_buckets"]["buckets"])
-        flattened_response = [
+        date_collected, date_submitted, total_count = [], [], []
+        async for buckets in iterate_composite_buckets(
+            self.asynchronous_fetch,
+            query,
+            "date_collected_submitted_buckets",
+            partitions=create_date_partitions("date_collected"),
+        ):
+            for i in buckets:
+                date_collected.append(i["key"]["date_collected"])
+                date_submitted.append(i["key"]["date_submitted"])
+                total_count.append(i["doc_count"])
+        df_response = pd.DataFrame(
             {
-                "date_collected": i["key"]["date_collected"],
-                "date_submitted": i["key"]["date_submitted"],
-                "total_count": i["doc_count"],
+                "date_collected": date_collected,
+                "date_submitted": date_submitted,
+                "total_count": total_count,
             }
-            for i in buckets
-        ]
-        resp = {"success": True, "results": flattened_response}
+        )
+        resp = {"success": True, "results": df_response}
         return resp